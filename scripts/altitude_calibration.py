@@ -0,0 +1,313 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: altitude_calibration.py
+Description: Whole-flight geoid/baro offset calibration.
+             Loads RTK height (data_position_state_rtk_hgt) and baro height
+             (data_drone_list_0_height) per aircraft, segments flights, then
+             fits  rtk - baro = offset + drift * minutes_since_takeoff
+             for every flight at once with a vectorized Huber (IRLS) robust
+             regression. Results are stored per flight and per aircraft in
+             calibration.json and, with --write, as the
+             'altitude_calibration' measurement for the dashboards.
+             Replaces the hard-coded GEOID_OFFSET = 3.13.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import flight_events as fe
+from flux_arrays import align_to_grid
+
+# Configuration
+INFLUX_URL = "http://localhost:8086"
+INFLUX_ORG = "autel_ops"
+INFLUX_BUCKET = "telemetry"
+INFLUX_TOKEN = "my-super-secret-token-change-me"
+
+RTK_FIELD = "data_position_state_rtk_hgt"
+BARO_FIELD = "data_drone_list_0_height"
+FIX_FIELD = "data_position_state_rtk_inpos"
+RTK_FIX = 2                       # Same meaning as bridge.py rtk_status "FIX"
+
+CALIBRATION_FILE = os.getenv("ALT_CALIBRATION_FILE", "calibration.json")
+CALIBRATION_MEASUREMENT = "altitude_calibration"
+FALLBACK_OFFSET = 3.13            # Legacy constant, used until a flight is calibrated
+
+STEP_S = 1.0
+MAX_FILL_S = 30
+MIN_SAMPLES = 30                  # Flights with fewer fix samples are not fitted
+HUBER_K = 1.345                   # Standard 95%-efficiency tuning constant
+IRLS_ITERATIONS = 10
+
+
+# ---------------------------------------------------------------------------
+# ROBUST REGRESSION (all flights in one pass)
+# ---------------------------------------------------------------------------
+def _group_median(values, labels, n_groups):
+    """Per-group median via one lexsort (labels must be 0..n_groups-1)."""
+    order = np.lexsort((values, labels))
+    counts = np.bincount(labels, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    last = max(values.size - 1, 0)
+    ranked = values[order] if values.size else np.zeros(1)
+    lo = ranked[np.clip(starts + (counts - 1) // 2, 0, last)]
+    hi = ranked[np.clip(starts + counts // 2, 0, last)]
+    return np.where(counts > 0, 0.5 * (lo + hi), np.nan)
+
+
+def fit_offsets(x, y, labels, n_groups, k=HUBER_K, iterations=IRLS_ITERATIONS):
+    """
+    Fit y = a + b*x independently for every label with Huber IRLS.
+    Returns (offset, drift, residual_rms, samples) arrays of length n_groups.
+    """
+    w = np.ones_like(y)
+    n = np.bincount(labels, minlength=n_groups).astype(np.float64)
+    a = np.full(n_groups, np.nan)
+    b = np.zeros(n_groups)
+
+    for _ in range(iterations):
+        sw = np.bincount(labels, w, n_groups)
+        sx = np.bincount(labels, w * x, n_groups)
+        sy = np.bincount(labels, w * y, n_groups)
+        sxx = np.bincount(labels, w * x * x, n_groups)
+        sxy = np.bincount(labels, w * x * y, n_groups)
+        det = sw * sxx - sx * sx
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Short or hovering flights have no x spread: fit the offset only
+            has_slope = det > 1e-9 * np.maximum(sw * sxx, 1.0)
+            b = np.where(has_slope, (sw * sxy - sx * sy) / det, 0.0)
+            a = np.where(has_slope, (sxx * sy - sx * sxy) / det, sy / sw)
+
+        resid = y - a[labels] - b[labels] * x
+        scale = 1.4826 * _group_median(np.abs(resid), labels, n_groups)
+        scale = np.where(scale > 1e-6, scale, 1e-6)
+        u = np.abs(resid) / (k * scale[labels])
+        w = np.where(u <= 1.0, 1.0, 1.0 / u)
+
+    resid = y - a[labels] - b[labels] * x
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rms = np.sqrt(np.bincount(labels, resid * resid, n_groups) / n)
+    return a, b, rms, n.astype(np.int64)
+
+
+# ---------------------------------------------------------------------------
+# FLIGHT ASSEMBLY
+# ---------------------------------------------------------------------------
+def flight_samples(rtk, baro, fix=None):
+    """
+    Segment one aircraft's gridded series into flights and return the
+    regression inputs: (flight_bounds, x_minutes, y_delta, local_labels).
+    """
+    f_start, f_end = fe.detect_flights(baro, STEP_S)
+    idx = np.arange(baro.size)
+    labels = fe.assign_to_flights(idx, f_start, f_end)
+
+    valid = (labels >= 0) & np.isfinite(rtk) & np.isfinite(baro)
+    if fix is not None:
+        valid &= fix == RTK_FIX
+    idx, lab = idx[valid], labels[valid]
+    x = (idx - f_start[lab]) * STEP_S / 60.0
+    y = rtk[idx] - baro[idx]
+    return (f_start, f_end), x, y, lab
+
+
+def calibrate_arrays(arrays):
+    """
+    Calibrate every flight of every aircraft in long-format query arrays
+    (_time, _field, _value, topic). Returns a list of flight result dicts.
+    """
+    if "_field" not in arrays or arrays["_field"].size == 0:
+        return []
+
+    topics = np.unique(arrays["topic"])
+    serials = [t.split("/")[2] if t.count("/") >= 3 else t for t in topics]
+    step = np.timedelta64(int(STEP_S * 1e9), "ns")
+    gap = int(MAX_FILL_S / STEP_S)
+
+    xs, ys, labels, meta = [], [], [], []
+    for topic, serial in zip(topics, serials):
+        sel = arrays["topic"] == topic
+        t, f, v = arrays["_time"][sel], arrays["_field"][sel], arrays["_value"][sel]
+        if not np.any(f == BARO_FIELD) or not np.any(f == RTK_FIELD):
+            continue
+        start = t.min().astype("datetime64[s]").astype("datetime64[ns]")
+        n = int((t.max() - start) // step) + 1
+
+        def grid(name):
+            m = f == name
+            order = np.argsort(t[m], kind="stable")
+            return align_to_grid(t[m][order], v[m][order], start, STEP_S, n, gap)
+
+        baro, rtk = grid(BARO_FIELD), grid(RTK_FIELD)
+        rtk[rtk == 0.0] = np.nan
+        fix = grid(FIX_FIELD) if np.any(f == FIX_FIELD) else None
+
+        (f_start, f_end), x, y, lab = flight_samples(rtk, baro, fix)
+        base = len(meta)
+        for s, e in zip(f_start, f_end):
+            meta.append({
+                "serial": str(serial),
+                "takeoff": str((start + s * step).astype("datetime64[s]")) + "Z",
+                "landing": str((start + (e - 1) * step).astype("datetime64[s]")) + "Z",
+            })
+        xs.append(x)
+        ys.append(y)
+        labels.append(lab + base)
+
+    if not meta or not sum(x.size for x in xs):
+        return []
+    x, y, lab = np.concatenate(xs), np.concatenate(ys), np.concatenate(labels)
+    offset, drift, rms, samples = fit_offsets(x, y, lab, len(meta))
+
+    results = []
+    for i, m in enumerate(meta):
+        if samples[i] < MIN_SAMPLES:
+            continue
+        m.update(offset_m=round(float(offset[i]), 4), drift_m_per_min=round(float(drift[i]), 5),
+                 residual_rms_m=round(float(rms[i]), 4), samples=int(samples[i]))
+        results.append(m)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# STORAGE
+# ---------------------------------------------------------------------------
+def load_calibration(path=CALIBRATION_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {"aircraft": {}, "flights": {}}
+
+
+def save_calibration(flights, path=CALIBRATION_FILE):
+    """
+    Merge new flight results into the calibration file and recompute the
+    per-aircraft offset as the sample-weighted median of its flight offsets.
+    """
+    state = load_calibration(path)
+    for fl in flights:
+        state["flights"][f"{fl['serial']}@{fl['takeoff']}"] = fl
+
+    by_serial = {}
+    for fl in state["flights"].values():
+        by_serial.setdefault(fl["serial"], []).append(fl)
+    for serial, items in by_serial.items():
+        offsets = np.array([i["offset_m"] for i in items])
+        weights = np.array([i["samples"] for i in items], dtype=np.float64)
+        order = np.argsort(offsets)
+        cum = np.cumsum(weights[order])
+        median = offsets[order][np.searchsorted(cum, cum[-1] / 2.0)]
+        latest = max(items, key=lambda i: i["takeoff"])
+        state["aircraft"][serial] = {
+            "offset_m": round(float(median), 4),
+            "drift_m_per_min": latest["drift_m_per_min"],
+            "flights": len(items),
+            "last_flight": latest["takeoff"],
+            "updated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=4, sort_keys=True)
+    os.replace(tmp, path)
+    return state
+
+
+def load_offset(serial=None, path=CALIBRATION_FILE, default=FALLBACK_OFFSET):
+    """
+    Calibrated geoid/baro offset for an aircraft. Without a serial, the fleet
+    median is returned; without any calibration, the legacy constant.
+    """
+    aircraft = load_calibration(path).get("aircraft", {})
+    if serial and serial in aircraft:
+        return aircraft[serial]["offset_m"]
+    if aircraft:
+        return float(np.median([a["offset_m"] for a in aircraft.values()]))
+    return default
+
+
+def write_to_influx(client, flights):
+    """Publish per-flight results so Grafana can read the offset with last()."""
+    from influxdb_client import Point, WritePrecision
+    from influxdb_client.client.write_api import SYNCHRONOUS
+
+    points = [
+        Point(CALIBRATION_MEASUREMENT)
+        .tag("serial", fl["serial"])
+        .field("offset_m", fl["offset_m"])
+        .field("drift_m_per_min", fl["drift_m_per_min"])
+        .field("residual_rms_m", fl["residual_rms_m"])
+        .field("samples", fl["samples"])
+        .time(fl["takeoff"], WritePrecision.S)
+        for fl in flights
+    ]
+    client.write_api(write_options=SYNCHRONOUS).write(INFLUX_BUCKET, INFLUX_ORG, points)
+
+
+# ---------------------------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------------------------
+def main():
+    from influxdb_client import InfluxDBClient
+    from query_cache import QueryCache
+
+    parser = argparse.ArgumentParser(description="Fit per-flight geoid/baro altitude offsets.")
+    parser.add_argument("--range", dest="time_range", default="-7d")
+    parser.add_argument("--write", action="store_true", help=f"Also write '{CALIBRATION_MEASUREMENT}' points to InfluxDB")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    print(f"📐 ALTITUDE CALIBRATION | Window: {args.time_range}")
+    client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG, timeout=60_000)
+    cache = QueryCache(enabled=not args.no_cache)
+    query = f"""
+    from(bucket: "{INFLUX_BUCKET}")
+      |> range(start: v.timeRangeStart, stop: v.timeRangeStop)
+      |> filter(fn: (r) => r["_measurement"] == "mqtt_consumer")
+      |> filter(fn: (r) => r["_field"] == "{RTK_FIELD}" or r["_field"] == "{BARO_FIELD}" or r["_field"] == "{FIX_FIELD}")
+      |> aggregateWindow(every: 1s, fn: last, createEmpty: false)
+      |> keep(columns: ["_time", "_field", "_value", "topic"])
+    """
+    try:
+        t0 = time.perf_counter()
+        arrays = cache.query(client.query_api(), query, args.time_range)
+        t1 = time.perf_counter()
+        flights = calibrate_arrays(arrays)
+        t2 = time.perf_counter()
+        if not flights:
+            print("   ⚠️  No flights with RTK FIX found in the window.")
+            return
+
+        state = save_calibration(flights)
+        print(f"   Fetched in {t1 - t0:.2f}s, calibrated {len(flights)} flight(s) in {t2 - t1:.3f}s\n")
+        print(f"   {'SERIAL':<22} | {'TAKEOFF':<20} | {'OFFSET':>8} | {'DRIFT/min':>9} | {'RMS':>6} | {'N':>6}")
+        print("   " + "-" * 85)
+        for fl in flights:
+            print(f"   {fl['serial']:<22} | {fl['takeoff']:<20} | {fl['offset_m']:>8.3f} | "
+                  f"{fl['drift_m_per_min']:>9.4f} | {fl['residual_rms_m']:>6.3f} | {fl['samples']:>6}")
+        print()
+        for serial, a in state["aircraft"].items():
+            print(f"   ✈️  {serial}: offset {a['offset_m']:.3f}m over {a['flights']} flight(s)")
+        print(f"\n✅ Calibration saved to {CALIBRATION_FILE}")
+
+        if args.write:
+            write_to_influx(client, flights)
+            print(f"✅ Wrote {len(flights)} point(s) to '{CALIBRATION_MEASUREMENT}'")
+    except Exception as e:
+        print(f"\n❌ CRITICAL ERROR: {e}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: backfill_flights.py
+Description: High-speed bulk loader for flights recorded without backhaul.
+             1. Splits every log in flight_logs/ into line-aligned chunks.
+             2. Parses chunks in a process pool into Telegraf-identical
+                line protocol (measurement mqtt_consumer, original timestamps).
+             3. Streams large batches through several persistent HTTP
+                connections to the InfluxDB v2 write API.
+             4. Checkpoints finished chunks so an interrupted run resumes.
+
+             Parsing is the bound: an OSD packet is one point of ~135
+             fields. Repeated packet layouts are rendered through compiled
+             per-layout templates (_Shape), ~2x the generic walk: ~7-8k
+             points (~1M field values) per second per parser core, of which
+             reading + json.loads alone caps out at ~15k. Hundreds of
+             thousands of points/s therefore takes tens of cores (--workers)
+             or an ingest path that skips JSON, not a faster renderer.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import argparse
+import gzip
+import http.client
+import json
+import math
+import os
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from urllib.parse import urlencode, urlparse
+
+import flight_logs
+
+# CONFIGURATION
+INFLUX_URL = "http://localhost:8086"
+INFLUX_TOKEN = "my-super-secret-token-change-me"
+INFLUX_ORG = "autel_ops"
+INFLUX_BUCKET = "telemetry"
+
+# Performance Tuning
+CHUNK_BYTES = 8 * 1024 * 1024   # Work unit handed to one parser process
+BATCH_LINES = 10_000            # Points per HTTP write request
+WRITERS = 4                     # Parallel HTTP connections
+MAX_RETRIES = 5
+
+CHECKPOINT_FILE = ".backfill_checkpoint.json"
+HOSTNAME = socket.gethostname()
+
+
+# ---------------------------------------------------------------------------
+# LINE PROTOCOL
+# ---------------------------------------------------------------------------
+# Recorded packets of one topic almost always share one layout, so a layout
+# seen SHAPE_COMPILE_AFTER times is compiled into straight-line code that
+# pulls every leaf out in one go plus a '%' template for the field set
+# (_Shape). Packets are tried against their topic's recent shapes; anything
+# that does not match exactly goes through the generic walk (_walk_fields).
+SHAPE_COMPILE_AFTER = 2
+SHAPES_PER_TOPIC = 4            # Recent layouts tried per topic before the generic walk
+MAX_SHAPES = 256                # Compiled layouts per parser process
+TAG_CACHE_SIZE = 4096
+
+_KEY_CACHE = {}
+_NUMERIC = frozenset((int, float))
+_BOOLEAN = frozenset((bool,))
+_DROPPED = frozenset((str, type(None)))     # Telegraf's json parser drops strings and nulls
+_BOOL_TEXT = {True: "true", False: "false"}
+
+
+def _escape_key(s):
+    escaped = _KEY_CACHE.get(s)
+    if escaped is None:
+        escaped = s.replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+        _KEY_CACHE[s] = escaped
+    return escaped
+
+
+def _walk_fields(obj, prefix, expr, fields, layout):
+    """
+    flight_logs.flatten() straight into escaped 'name=value' strings.
+    NaN/Infinity floats are skipped (InfluxDB rejects them); an int too
+    large for a float raises OverflowError. 'layout' collects what
+    _Shape needs to compile this payload's layout: container checks and
+    (expression, name, kind) per leaf.
+    """
+    layout.append(("len", expr, len(obj)))
+    items = obj.items() if type(obj) is dict else enumerate(obj)
+    for key, value in items:
+        name = f"{prefix}_{key}" if prefix else str(key)
+        leaf = f"{expr}[{key!r}]"
+        kind = type(value)
+        if kind is float:
+            if value - value == 0.0:
+                fields.append(f"{_escape_key(name)}={value!r}")
+            layout.append(("num", leaf, name))
+        elif kind is int:
+            fields.append(f"{_escape_key(name)}={float(value)!r}")
+            layout.append(("num", leaf, name))
+        elif kind is bool:
+            fields.append(f"{_escape_key(name)}={'true' if value else 'false'}")
+            layout.append(("bool", leaf, name))
+        elif kind is dict or kind is list:
+            _walk_fields(value, name, leaf, fields, layout)
+        else:
+            layout.append(("drop", leaf, name))
+
+
+class _Shape:
+    """
+    One payload layout compiled to code: extract(payload) returns the
+    container sizes and the numeric, boolean and dropped leaves as tuples.
+    A payload matches only if every container has the same size (so the
+    same keys) and every leaf is still of its kind.
+    """
+    __slots__ = ("extract", "sizes", "template")
+
+    def __init__(self, layout):
+        lines, sizes, nums, bools, drops, names, flags = [], [], [], [], [], [], []
+        for kind, expr, arg in layout:
+            if kind == "len":
+                sizes.append(arg)
+                lines.append(f"len({expr})")
+            elif kind == "num":
+                nums.append(expr)
+                names.append(_escape_key(arg).replace("%", "%%") + "=%r")
+            elif kind == "bool":
+                bools.append(expr)
+                flags.append(_escape_key(arg).replace("%", "%%") + "=%s")
+            else:
+                drops.append(expr)
+        source = "def extract(p):\n    return ({}), ({}), ({}), ({})\n".format(
+            *("".join(f"{e}, " for e in part) for part in (lines, nums, bools, drops)))
+        scope = {}
+        exec(compile(source, "<backfill shape>", "exec"), scope)
+        self.extract = scope["extract"]
+        self.sizes = tuple(sizes)
+        self.template = ",".join(names + flags)
+
+    def fields(self, payload):
+        """The field set of a payload of this layout, or None if it does not match."""
+        try:
+            sizes, nums, bools, drops = self.extract(payload)
+        except (KeyError, IndexError, TypeError):
+            return None
+        if (sizes != self.sizes or not _NUMERIC.issuperset(map(type, nums))
+                or not _BOOLEAN.issuperset(map(type, bools)) or not _DROPPED.issuperset(map(type, drops))):
+            return None
+        nums = tuple(map(float, nums))
+        if not all(map(math.isfinite, nums)):
+            return None         # Generic walk skips the NaN/Infinity fields
+        return self.template % (nums + tuple(map(_BOOL_TEXT.__getitem__, bools)))
+
+
+class LineBuilder:
+    """Per-process line protocol renderer with the layout and tag caches."""
+
+    def __init__(self):
+        self.recent = {}        # topic -> [_Shape], most recently matched first
+        self.shapes = {}        # layout -> _Shape
+        self.seen = {}          # layout -> times seen (not yet compiled)
+        self.tags = {}          # (topic, bid) -> "measurement,tags "
+        self.compiled_hits = 0
+
+    def _prefix(self, topic, payload):
+        bid = payload.get("bid")
+        key = (topic, bid) if bid is None or type(bid) is str else None
+        prefix = self.tags.get(key) if key else None
+        if prefix is None:
+            tags = {"topic": topic, "host": HOSTNAME}
+            for key in flight_logs.TAG_KEYS:
+                if payload.get(key) is not None:
+                    tags[key] = str(payload[key])
+            esc = _escape_key
+            prefix = f"{flight_logs.MEASUREMENT},{','.join(f'{esc(k)}={esc(v)}' for k, v in sorted(tags.items()))} "
+            if key:
+                if len(self.tags) >= TAG_CACHE_SIZE:
+                    self.tags.clear()
+                self.tags[key] = prefix
+        return prefix
+
+    def _generic(self, topic, payload):
+        fields, layout = [], []
+        body = {k: v for k, v in payload.items() if k not in flight_logs.TAG_KEYS}
+        _walk_fields(body, "", "p", fields, layout)
+        # Tag keys sit in the payload dict: the size check covers them too
+        layout[0] = ("len", "p", len(payload))
+        layout = tuple(layout)
+        shape = self.shapes.get(layout)
+        if shape is None and len(self.shapes) < MAX_SHAPES:
+            seen = self.seen[layout] = self.seen.get(layout, 0) + 1
+            if seen >= SHAPE_COMPILE_AFTER:
+                del self.seen[layout]
+                shape = self.shapes[layout] = _Shape(layout)
+        if shape is not None:
+            recent = self.recent.setdefault(topic, [])
+            if shape not in recent:
+                recent.insert(0, shape)
+                del recent[SHAPES_PER_TOPIC:]
+        return ",".join(fields)
+
+    def to_line(self, ts_ms, topic, payload):
+        """
+        Render one recorded packet as a single line protocol point (ms
+        precision), or None if it has no fields. Raises OverflowError for
+        an int field too large for a float.
+        """
+        fields = None
+        recent = self.recent.get(topic)
+        if recent:
+            for i, shape in enumerate(recent):
+                fields = shape.fields(payload)
+                if fields is not None:
+                    if i:
+                        recent.insert(0, recent.pop(i))
+                    self.compiled_hits += 1
+                    break
+        if fields is None:
+            fields = self._generic(topic, payload)
+        if not fields:
+            return None
+        return f"{self._prefix(topic, payload)}{fields} {ts_ms}"
+
+
+_BUILDER = LineBuilder()
+
+
+def to_line(ts_ms, topic, payload):
+    """Render one recorded packet as a single line protocol point (ms precision)."""
+    return _BUILDER.to_line(ts_ms, topic, payload)
+
+
+def parse_chunk(path, start, end, batch_lines):
+    """
+    Worker process entry point. Returns (points, skipped, [batch bodies])
+    where each body is a ready-to-send UTF-8 line protocol payload and
+    'skipped' counts packets that cannot be written (an int field too large
+    for InfluxDB's float).
+    """
+    batches = []
+    lines = []
+    points = skipped = 0
+    for ts_ms, topic, payload in flight_logs.iter_records(path, start, end):
+        try:
+            line = to_line(ts_ms, topic, payload)
+        except OverflowError:
+            skipped += 1
+            continue
+        if line is None:
+            continue
+        lines.append(line)
+        if len(lines) >= batch_lines:
+            batches.append("\n".join(lines).encode("utf-8"))
+            points += len(lines)
+            lines = []
+    if lines:
+        batches.append("\n".join(lines).encode("utf-8"))
+        points += len(lines)
+    return points, skipped, batches
+
+
+# ---------------------------------------------------------------------------
+# HTTP WRITER
+# ---------------------------------------------------------------------------
+class InfluxWriter:
+    """One keep-alive HTTP connection per writer thread."""
+
+    def __init__(self, url, token, org, bucket, use_gzip=False):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.https = parsed.scheme == "https"
+        self.path = "/api/v2/write?" + urlencode({"org": org, "bucket": bucket, "precision": "ms"})
+        self.headers = {
+            "Authorization": f"Token {token}",
+            "Content-Type": "text/plain; charset=utf-8",
+        }
+        self.use_gzip = use_gzip
+        if use_gzip:
+            self.headers["Content-Encoding"] = "gzip"
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=60)
+            self._local.conn = conn
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def write(self, body):
+        if self.use_gzip:
+            body = gzip.compress(body, compresslevel=1)
+        delay = 0.5
+        for attempt in range(MAX_RETRIES):
+            try:
+                conn = self._connection()
+                conn.request("POST", self.path, body=body, headers=self.headers)
+                resp = conn.getresponse()
+                detail = resp.read()
+                if resp.status == 204:
+                    return
+                if resp.status in (429, 503):
+                    retry_after = resp.getheader("Retry-After")
+                    time.sleep(float(retry_after) if retry_after else delay)
+                elif resp.status >= 400 and resp.status < 500:
+                    raise RuntimeError(f"HTTP {resp.status}: {detail[:200].decode(errors='replace')}")
+                else:
+                    time.sleep(delay)
+            except (ConnectionError, http.client.HTTPException, socket.timeout, OSError):
+                self._reset()
+                time.sleep(delay)
+            delay *= 2
+        raise RuntimeError(f"Write failed after {MAX_RETRIES} attempts")
+
+
+# ---------------------------------------------------------------------------
+# CHECKPOINT
+# ---------------------------------------------------------------------------
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        print(f"   ⚠️  Ignoring unreadable checkpoint {path}")
+        return {}
+
+
+def save_checkpoint(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def _file_key(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": int(st.st_mtime)}
+
+
+# ---------------------------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------------------------
+def backfill(logs, args):
+    checkpoint_path = args.checkpoint
+    state = load_checkpoint(checkpoint_path)
+
+    # 1. Plan work units, skipping chunks already confirmed by InfluxDB
+    work = []
+    for path in logs:
+        key = _file_key(path)
+        entry = state.get(path)
+        if not entry or entry.get("size") != key["size"] or entry.get("mtime") != key["mtime"]:
+            entry = dict(key, chunk_bytes=args.chunk_bytes, done=[])
+            state[path] = entry
+        chunk_bytes = entry.get("chunk_bytes", args.chunk_bytes)
+        done = set(entry["done"])
+        for i, (start, end) in enumerate(flight_logs.chunk_offsets(path, chunk_bytes)):
+            if i not in done:
+                work.append((path, i, start, end))
+
+    if not work:
+        print("✅ Nothing to do: every chunk is already in InfluxDB.")
+        return
+
+    print(f"🚀 Backfilling {len(work)} chunk(s) from {len(logs)} log(s) "
+          f"| {args.workers} parsers, {args.writers} writers")
+
+    writer = InfluxWriter(args.url, args.token, args.org, args.bucket, use_gzip=args.gzip)
+    total_points = total_skipped = 0
+    started = time.perf_counter()
+
+    def finish(item):
+        nonlocal total_points, total_skipped
+        (path, index, _, _), points, skipped, futures = item
+        for fut in futures:
+            fut.result()
+        state[path]["done"].append(index)
+        save_checkpoint(checkpoint_path, state)
+        total_points += points
+        total_skipped += skipped
+        rate = total_points / max(time.perf_counter() - started, 1e-9)
+        sys.stdout.write(f"\r   📡 {total_points:,} points written | {rate:,.0f} points/s"
+                         + (f" | {total_skipped:,} skipped" if total_skipped else ""))
+        sys.stdout.flush()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as parsers, \
+            ThreadPoolExecutor(max_workers=args.writers) as writers:
+        queue = deque(work)
+        parsing = deque()
+        writing = deque()
+
+        while queue or parsing or writing:
+            # Keep every parser busy without reading whole archives into RAM
+            while queue and len(parsing) < args.workers * 2:
+                unit = queue.popleft()
+                parsing.append((unit, parsers.submit(parse_chunk, unit[0], unit[2], unit[3], args.batch_lines)))
+
+            if parsing and parsing[0][1].done():
+                unit, fut = parsing.popleft()
+                points, skipped, batches = fut.result()
+                writing.append((unit, points, skipped, [writers.submit(writer.write, b) for b in batches]))
+            elif writing and (len(writing) > args.writers or not parsing):
+                finish(writing.popleft())
+            elif parsing:
+                wait([parsing[0][1]], timeout=0.05)
+
+            # Checkpoint every chunk whose batches are all acknowledged
+            while writing and all(f.done() for f in writing[0][3]):
+                finish(writing.popleft())
+
+    elapsed = time.perf_counter() - started
+    print(f"\n✅ Backfill complete: {total_points:,} points in {elapsed:.1f}s "
+          f"({total_points / max(elapsed, 1e-9):,.0f} points/s)")
+    if total_skipped:
+        print(f"   ⚠️  {total_skipped:,} packet(s) skipped: integer field too large for a float")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load recorded flight logs into InfluxDB.")
+    parser.add_argument("logs", nargs="*", help=f"Log files (default: {flight_logs.LOG_DIR}/{flight_logs.LOG_PATTERN})")
+    parser.add_argument("--url", default=INFLUX_URL)
+    parser.add_argument("--token", default=INFLUX_TOKEN)
+    parser.add_argument("--org", default=INFLUX_ORG)
+    parser.add_argument("--bucket", default=INFLUX_BUCKET)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--writers", type=int, default=WRITERS)
+    parser.add_argument("--batch-lines", type=int, default=BATCH_LINES)
+    parser.add_argument("--chunk-bytes", type=int, default=CHUNK_BYTES)
+    parser.add_argument("--gzip", action="store_true", help="Compress request bodies (useful over ZeroTier)")
+    parser.add_argument("--checkpoint", default=os.path.join(flight_logs.LOG_DIR, CHECKPOINT_FILE))
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and load everything again")
+    args = parser.parse_args()
+
+    logs = args.logs or flight_logs.list_logs()
+    if not logs:
+        print(f"❌ No flight logs found in {flight_logs.LOG_DIR}/")
+        return
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    try:
+        backfill(logs, args)
+    except KeyboardInterrupt:
+        print("\n🛑 Backfill interrupted. Run again to resume from the checkpoint.")
+    except Exception as e:
+        print(f"\n❌ Backfill failed: {e}")
+        print("   Finished chunks are checkpointed; rerun to resume.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,9 @@ import sys
 import os
 import paho.mqtt.client as mqtt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from static_dedup import StaticCache
+
 # ---------------------------------------------------------------------------
 # CONFIGURATION
 # ---------------------------------------------------------------------------
@@ -28,6 +31,7 @@ PORT = 1883
 # Listen to everything from the drone
 TOPICS = [
     ("thing/product/+/osd", 0),
+    ("thing/product/+/static", 1),     # Slim OSD is merged back with it (static_dedup)
     ("thing/product/+/events", 0)
 ]
 DURATION = 60  # Listen for 60 seconds
@@ -35,6 +39,7 @@ DURATION = 60  # Listen for 60 seconds
 # The Master Dictionary that will hold every unique field we see
 master_schema = {}
 message_count = 0
+static_cache = StaticCache()
 
 def deep_merge(source, destination):
     """
@@ -68,6 +73,11 @@ def on_message(client, userdata, msg):
     global master_schema, message_count
     try:
         payload = json.loads(msg.payload.decode())
+        if msg.topic.endswith("/osd") or msg.topic.endswith("/static"):
+            # The bridge publishes slim OSD; rebuild the full vendor payload
+            payload = static_cache.on_message(msg.topic, payload)
+            if payload is None:
+                return  # Static message, or slim OSD still waiting for it
         
         # Merge this packet into our Master Schema
         deep_merge(payload, master_schema)
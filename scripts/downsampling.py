@@ -0,0 +1,225 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: downsampling.py
+Description: Generates InfluxDB downsampling tasks and tiered-retention
+             buckets from the flattened field set in schema_report.json.
+             Key fields are rolled up into 1s, 10s and 1m buckets with
+             mean/min/max/last chosen per field; every tier is computed from
+             the tier below it so each task scans as little data as possible.
+             pick_bucket() chooses the right tier for a query range so a
+             week-long view reads thousands of rows instead of millions.
+
+             python downsampling.py            -> print the generated Flux
+             python downsampling.py --apply    -> create buckets + tasks
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import argparse
+import json
+import os
+import re
+from datetime import timedelta
+
+# Configuration
+INFLUX_URL = "http://localhost:8086"
+INFLUX_TOKEN = "my-super-secret-token-change-me"
+INFLUX_ORG = "autel_ops"
+INFLUX_BUCKET = "telemetry"
+MEASUREMENT = "mqtt_consumer"
+
+SCHEMA_REPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema_report.json")
+
+# (bucket, window, retention, task schedule). Each tier reads the previous one.
+TIERS = [
+    {"bucket": f"{INFLUX_BUCKET}_1s", "every": "1s", "seconds": 1, "retention": timedelta(days=7), "schedule": "1m"},
+    {"bucket": f"{INFLUX_BUCKET}_10s", "every": "10s", "seconds": 10, "retention": timedelta(days=90), "schedule": "5m"},
+    {"bucket": f"{INFLUX_BUCKET}_1m", "every": "1m", "seconds": 60, "retention": timedelta(days=730), "schedule": "15m"},
+]
+RAW_RETENTION = timedelta(days=2)   # Assumed retention of the raw bucket for pick_bucket
+TASK_OFFSET = "15s"                 # Let Telegraf flush before a window is rolled up
+AGG_TAG = "agg"
+
+# Field rules: first matching pattern wins. Fields matching nothing are not rolled up.
+#   last            -> enums, states, positions (averaging lat/lon across a turn lies)
+#   mean/min/max    -> continuous physical values
+#   min/last        -> monotonic consumables (battery)
+#   min/max         -> counts where the extremes matter (satellites)
+FIELD_RULES = [
+    (r"(latitude|longitude|_lat|_lon)$", ("last",)),
+    (r"(rtk_inpos|fix_sta|mode_code|_state|_status|rtk_used|quality)$", ("last",)),
+    (r"(gps_number|rtk_number|satellite)", ("min", "max")),
+    (r"(capacity_percent|remain_flight_time|voltage)$", ("min", "last")),
+    (r"(height|altitude|elevation|rtk_hgt|_speed|vel_ned_[xyz]|attitude_(head|pitch|roll)|gimbal_(pitch|yaw|roll)|home_distance)$",
+     ("mean", "min", "max")),
+]
+AGG_FUNCTIONS = ("mean", "min", "max", "last")
+
+
+# ---------------------------------------------------------------------------
+# FIELD SELECTION
+# ---------------------------------------------------------------------------
+def load_fields(path=SCHEMA_REPORT, measurement=MEASUREMENT):
+    with open(path) as f:
+        report = json.load(f)
+    return sorted(report.get(measurement, {}).get("fields", []))
+
+
+def classify_fields(fields, rules=FIELD_RULES):
+    """Return {agg function: [field, ...]} for every rolled-up field."""
+    compiled = [(re.compile(p), aggs) for p, aggs in rules]
+    plan = {fn: [] for fn in AGG_FUNCTIONS}
+    for field in fields:
+        for pattern, aggs in compiled:
+            if pattern.search(field):
+                for fn in aggs:
+                    plan[fn].append(field)
+                break
+    return {fn: names for fn, names in plan.items() if names}
+
+
+# ---------------------------------------------------------------------------
+# FLUX GENERATION
+# ---------------------------------------------------------------------------
+def _flux_set(names):
+    return "[" + ", ".join(json.dumps(n) for n in names) + "]"
+
+
+def task_flux(tier, source_bucket, plan, from_raw, org=INFLUX_ORG):
+    """One task per tier: every agg function unioned and written in one to()."""
+    name = f"downsample_{tier['bucket']}"
+    lines = [
+        f'option task = {{name: "{name}", every: {tier["schedule"]}, offset: {TASK_OFFSET}}}',
+        "",
+        f'data = from(bucket: "{source_bucket}")',
+        "  |> range(start: -task.every)",
+        f'  |> filter(fn: (r) => r["_measurement"] == "{MEASUREMENT}")',
+        "",
+    ]
+    streams = []
+    for fn, fields in plan.items():
+        var = f"{fn}_data"
+        streams.append(var)
+        # Higher tiers re-aggregate the matching roll-up of the tier below:
+        # mean of means, min of mins, max of maxes, last of lasts.
+        agg_filter = "" if from_raw else f' and r["{AGG_TAG}"] == "{fn}"'
+        lines += [
+            f"{var} = data",
+            f'  |> filter(fn: (r) => contains(value: r["_field"], set: {_flux_set(fields)}){agg_filter})',
+            f"  |> aggregateWindow(every: {tier['every']}, fn: {fn}, createEmpty: false)",
+            f'  |> set(key: "{AGG_TAG}", value: "{fn}")',
+            "",
+        ]
+    lines += [
+        f"union(tables: [{', '.join(streams)}])",
+        f'  |> to(bucket: "{tier["bucket"]}", org: "{org}")',
+    ]
+    return name, "\n".join(lines) + "\n"
+
+
+def generate_tasks(fields, tiers=TIERS):
+    plan = classify_fields(fields)
+    tasks = []
+    source = INFLUX_BUCKET
+    for i, tier in enumerate(tiers):
+        tasks.append(task_flux(tier, source, plan, from_raw=(i == 0)))
+        source = tier["bucket"]
+    return plan, tasks
+
+
+# ---------------------------------------------------------------------------
+# QUERY HELPER
+# ---------------------------------------------------------------------------
+def pick_bucket(range_seconds, max_points=2000, age_seconds=0, tiers=TIERS):
+    """
+    Choose the bucket for a query spanning range_seconds whose oldest point is
+    age_seconds old. Returns (bucket, window_seconds, agg_filter_needed).
+    The finest tier that stays within max_points (and still retains the
+    data) wins; raw data is used for short, recent windows.
+    """
+    oldest = age_seconds + range_seconds
+    if range_seconds <= max_points and oldest <= RAW_RETENTION.total_seconds():
+        return INFLUX_BUCKET, 0, False
+    candidates = [t for t in tiers if oldest <= t["retention"].total_seconds()] or [tiers[-1]]
+    for tier in candidates:
+        if range_seconds / tier["seconds"] <= max_points:
+            return tier["bucket"], tier["seconds"], True
+    return candidates[-1]["bucket"], candidates[-1]["seconds"], True
+
+
+def source_flux(field, fn, start, stop, range_seconds, max_points=2000, age_seconds=0):
+    """Flux prologue reading one field from the appropriate tier."""
+    bucket, _, rolled = pick_bucket(range_seconds, max_points, age_seconds)
+    agg = f' and r["{AGG_TAG}"] == "{fn}"' if rolled else ""
+    return (
+        f'from(bucket: "{bucket}")\n'
+        f"  |> range(start: {start}, stop: {stop})\n"
+        f'  |> filter(fn: (r) => r["_measurement"] == "{MEASUREMENT}" and r["_field"] == "{field}"{agg})'
+    )
+
+
+# ---------------------------------------------------------------------------
+# APPLY
+# ---------------------------------------------------------------------------
+def apply(tasks, tiers=TIERS):
+    from influxdb_client import InfluxDBClient, BucketRetentionRules, TaskCreateRequest
+
+    client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
+    try:
+        buckets_api = client.buckets_api()
+        tasks_api = client.tasks_api()
+        org_id = client.organizations_api().find_organizations(org=INFLUX_ORG)[0].id
+
+        for tier in tiers:
+            rule = BucketRetentionRules(type="expire", every_seconds=int(tier["retention"].total_seconds()))
+            existing = buckets_api.find_bucket_by_name(tier["bucket"])
+            if existing:
+                existing.retention_rules = [rule]
+                buckets_api.update_bucket(existing)
+                print(f"   🔁 Bucket {tier['bucket']} retention -> {tier['retention'].days}d")
+            else:
+                buckets_api.create_bucket(bucket_name=tier["bucket"], retention_rules=rule, org_id=org_id)
+                print(f"   ✅ Bucket {tier['bucket']} created ({tier['retention'].days}d)")
+
+        for name, flux in tasks:
+            found = tasks_api.find_tasks(name=name)
+            if found:
+                task = found[0]
+                task.flux = flux
+                tasks_api.update_task(task)
+                print(f"   🔁 Task {name} updated")
+            else:
+                tasks_api.create_task(task_create_request=TaskCreateRequest(
+                    flux=flux, org_id=org_id, status="active", description="Generated by downsampling.py"))
+                print(f"   ✅ Task {name} created")
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate InfluxDB downsampling tasks.")
+    parser.add_argument("--schema", default=SCHEMA_REPORT, help="schema_report.json to read fields from")
+    parser.add_argument("--apply", action="store_true", help="Create/update buckets and tasks in InfluxDB")
+    args = parser.parse_args()
+
+    fields = load_fields(args.schema)
+    if not fields:
+        print(f"❌ No '{MEASUREMENT}' fields in {args.schema}. Run generate_schema_report.py first.")
+        return
+    plan, tasks = generate_tasks(fields)
+
+    rolled = sorted({f for names in plan.values() for f in names})
+    print(f"📉 {len(rolled)} of {len(fields)} fields rolled up: "
+          + ", ".join(f"{fn}={len(names)}" for fn, names in plan.items()))
+
+    if not args.apply:
+        for name, flux in tasks:
+            print(f"\n// ===== {name} =====\n{flux}")
+        return
+    apply(tasks)
+
+
+if __name__ == "__main__":
+    main()
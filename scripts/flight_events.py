@@ -0,0 +1,114 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: flight_events.py
+Description: Vectorized flight event detection over regularly sampled
+             telemetry arrays (see flux_arrays.align_to_grid).
+             Finds takeoff/landing (flights), sustained climbs/descents and
+             altitude-truth drift without a per-sample Python loop.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import numpy as np
+
+# Detection Thresholds
+AIRBORNE_HEIGHT_M = 1.0      # Baro height above home that counts as "flying"
+MIN_FLIGHT_S = 10            # Ignore hops shorter than this
+MAX_GROUND_GAP_S = 5         # Bounces shorter than this do not end a flight
+CLIMB_RATE_MPS = 1.0         # Vertical speed that counts as a climb/descent
+MIN_CLIMB_S = 3
+DRIFT_THRESHOLD_M = 1.0      # |RTK - offset - baro| that counts as drift
+MIN_DRIFT_S = 3
+
+
+def find_runs(mask):
+    """Return (starts, ends) of every True run in a boolean array (ends exclusive)."""
+    mask = np.asarray(mask, dtype=bool)
+    if mask.size == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def merge_runs(starts, ends, max_gap):
+    """Join runs separated by fewer than max_gap samples."""
+    if starts.size < 2:
+        return starts, ends
+    keep = (starts[1:] - ends[:-1]) >= max_gap
+    return starts[np.r_[True, keep]], ends[np.r_[keep, True]]
+
+
+def filter_runs(starts, ends, min_len):
+    keep = (ends - starts) >= min_len
+    return starts[keep], ends[keep]
+
+
+def detect_flights(height, step_s=1.0, airborne_m=AIRBORNE_HEIGHT_M,
+                   min_flight_s=MIN_FLIGHT_S, max_gap_s=MAX_GROUND_GAP_S):
+    """
+    Segment a height series into flights.
+    Returns (takeoff_idx, landing_idx); landing is exclusive (first ground sample).
+    """
+    airborne = np.nan_to_num(height, nan=0.0) > airborne_m
+    starts, ends = find_runs(airborne)
+    starts, ends = merge_runs(starts, ends, int(max_gap_s / step_s))
+    return filter_runs(starts, ends, int(min_flight_s / step_s))
+
+
+def vertical_speed(height, step_s=1.0):
+    """Central-difference climb rate in m/s (NaN-safe)."""
+    if height.size < 2:
+        return np.zeros_like(height)
+    return np.gradient(height, step_s)
+
+
+def detect_vertical(height, step_s=1.0, rate_mps=CLIMB_RATE_MPS, min_s=MIN_CLIMB_S):
+    """
+    Find sustained climbs and descents.
+    Returns ((climb_starts, climb_ends), (descent_starts, descent_ends)).
+    """
+    vs = np.nan_to_num(vertical_speed(height, step_s))
+    min_len = max(int(min_s / step_s), 1)
+    climbs = filter_runs(*find_runs(vs > rate_mps), min_len)
+    descents = filter_runs(*find_runs(vs < -rate_mps), min_len)
+    return climbs, descents
+
+
+def detect_drift(error, step_s=1.0, threshold=DRIFT_THRESHOLD_M, min_s=MIN_DRIFT_S):
+    """Find sustained periods where |altitude error| exceeds the threshold."""
+    over = np.nan_to_num(np.abs(error), nan=0.0) > threshold
+    return filter_runs(*find_runs(over), max(int(min_s / step_s), 1))
+
+
+def assign_to_flights(event_starts, flight_starts, flight_ends):
+    """Index of the flight each event starts in, or -1 if it is on the ground."""
+    if flight_starts.size == 0:
+        return np.full(event_starts.size, -1, dtype=np.int64)
+    idx = np.searchsorted(flight_starts, event_starts, side="right") - 1
+    inside = (idx >= 0) & (event_starts < flight_ends[np.maximum(idx, 0)])
+    return np.where(inside, idx, -1)
+
+
+def segment_reduce(values, starts, ends, ufunc):
+    """
+    Reduce each [start, end) segment with a ufunc (np.fmax, np.fmin, np.add)
+    in a single reduceat call.
+    """
+    if starts.size == 0:
+        return np.empty(0)
+    # One padding sample makes ends == len(values) a valid reduceat index
+    padded = np.append(values, 0.0)
+    idx = np.column_stack([starts, ends]).ravel()
+    return ufunc.reduceat(padded, idx)[::2]
+
+
+def segment_mean(values, starts, ends):
+    """NaN-ignoring mean of each [start, end) segment."""
+    valid = ~np.isnan(values)
+    sums = segment_reduce(np.where(valid, values, 0.0), starts, ends, np.add)
+    counts = segment_reduce(valid.astype(np.float64), starts, ends, np.add)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
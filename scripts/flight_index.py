@@ -0,0 +1,589 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: flight_index.py
+Description: Persistent spatial index over flights for "who flew here".
+             Every flight is simplified (track_simplify, SIMPLIFY_M) and
+             rasterized onto a uniform lat/lon grid of CELL_DEG cells. The
+             index keeps one posting (cell, flight, first/last time) per
+             touched cell, sorted by cell id, so a query only binary-searches
+             the rows of cells under its area and then measures the few
+             candidate tracks exactly:
+
+               point + radius  -> flights passing within radius (+ passes
+                                  with entry/exit time, closest distance)
+               bounding box    -> flights crossing the box (+ passes)
+
+             Batches are stored as immutable part_*.npz files (query_cache
+             columnar format) plus manifest.json; parts are merged when
+             there are more than MAX_PARTS. The index grows incrementally
+             from flight_recorder logs (already indexed logs are skipped)
+             and from the live telemetry/normalized stream (a flight is
+             added when the aircraft lands).
+
+             python flight_index.py build
+             python flight_index.py near 60.3195 24.8307 --radius 200
+             python flight_index.py bbox 60.31 24.82 60.33 24.85 --range -7d
+             python flight_index.py live
+             python flight_index.py bench --flights 3000
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import flight_events as fe
+import flight_logs as fl
+import track_simplify as ts
+from query_cache import load_arrays, parse_time, save_arrays
+
+# Configuration
+INDEX_DIR = os.getenv("FLIGHT_INDEX_DIR", "flight_index")
+MANIFEST_FILE = "manifest.json"
+CELL_DEG = 0.002                  # ~220 m north-south, ~110 m east-west at 60°N
+N_COLS = int(round(360 / CELL_DEG))
+SIMPLIFY_M = 5.0                  # Stored tracks deviate at most this much from the fixes
+MAX_PARTS = 16                    # Merge part files beyond this
+MIN_POINTS = 10
+METERS_PER_DEG = 111195.0         # Mean great-circle metres per degree of latitude
+
+MQTT_BROKER = "localhost"
+MQTT_PORT = 1883
+NORMALIZED_TOPIC = "telemetry/normalized"
+LANDED_AFTER_S = fe.MAX_GROUND_GAP_S
+
+
+# ---------------------------------------------------------------------------
+# GRID
+# ---------------------------------------------------------------------------
+def cell_rows(lat):
+    return np.floor((np.asarray(lat) + 90.0) / CELL_DEG).astype(np.int64)
+
+
+def cell_cols(lon):
+    return np.floor((np.asarray(lon) + 180.0) / CELL_DEG).astype(np.int64) % N_COLS
+
+
+def cell_ids(lat, lon):
+    return cell_rows(lat) * N_COLS + cell_cols(lon)
+
+
+def densify(lat, lon, t, step_deg=CELL_DEG / 2):
+    """Insert interpolated points so no step is longer than step_deg on either axis."""
+    if lat.size < 2:
+        return lat, lon, t
+    span = np.maximum(np.abs(np.diff(lat)), np.abs(np.diff(lon)))
+    k = np.maximum(np.ceil(span / step_deg).astype(np.int64), 1)
+    seg = np.repeat(np.arange(k.size), k)
+    frac = (np.arange(seg.size) - np.repeat(np.cumsum(k) - k, k)) / np.repeat(k, k)
+    out = []
+    for v in (lat, lon, t.astype(np.float64)):
+        out.append(np.concatenate([v[seg] + frac * (v[seg + 1] - v[seg]), v[-1:]]))
+    return out[0], out[1], out[2].astype(np.int64)
+
+
+def postings(lat, lon, t):
+    """(cells, first_ms, last_ms) touched by one polyline."""
+    lat, lon, t = densify(lat, lon, t)
+    cells = cell_ids(lat, lon)
+    order = np.lexsort((t, cells))
+    cells, t = cells[order], t[order]
+    first = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+    last = np.r_[first[1:] - 1, cells.size - 1]
+    return cells[first], t[first], t[last]
+
+
+def _ranges(starts, ends):
+    """Concatenated aranges [starts[i], ends[i]) without a Python loop."""
+    lengths = np.maximum(ends - starts, 0)
+    if not lengths.sum():
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return np.arange(lengths.sum()) + offsets
+
+
+# ---------------------------------------------------------------------------
+# FLIGHT EXTRACTION
+# ---------------------------------------------------------------------------
+def split_flights(serial, t_ms, lat, lon, height):
+    """Cut one aircraft's fixes into flights (flight_events thresholds)."""
+    ok = (lat != 0.0) | (lon != 0.0)
+    t_ms, lat, lon, height = t_ms[ok], lat[ok], lon[ok], height[ok]
+    if t_ms.size < MIN_POINTS:
+        return []
+    order = np.argsort(t_ms, kind="stable")
+    t_ms, lat, lon, height = t_ms[order], lat[order], lon[order], height[order]
+    step_s = max(float(np.median(np.diff(t_ms))) / 1000.0, 1e-3)
+    starts, ends = fe.detect_flights(height, step_s)
+    return [{"serial": serial, "t": t_ms[a:b], "lat": lat[a:b], "lon": lon[a:b]}
+            for a, b in zip(starts, ends) if b - a >= MIN_POINTS]
+
+
+def flights_from_log(path):
+    """Every flight in one flight_recorder log (aircraft OSD)."""
+    tracks = {}
+    for ts_ms, topic, payload in fl.iter_records(path):
+        if not topic.endswith("/osd"):
+            continue
+        data = payload.get("data")
+        if not isinstance(data, dict) or "latitude" not in data:
+            continue
+        serial = payload.get("gateway") or fl.serial_from_topic(topic)
+        rows = tracks.setdefault(serial, [])
+        rows.append((ts_ms, data.get("latitude", 0.0), data.get("longitude", 0.0), data.get("height", 0.0)))
+    flights = []
+    for serial, rows in tracks.items():
+        arr = np.asarray(rows, dtype=np.float64)
+        flights += split_flights(serial, arr[:, 0].astype(np.int64), arr[:, 1], arr[:, 2], arr[:, 3])
+    return flights
+
+
+# ---------------------------------------------------------------------------
+# INDEX
+# ---------------------------------------------------------------------------
+def build_part(flights):
+    """Columnar arrays for a batch of flights (flight-local ids)."""
+    cols = {k: [] for k in ("id", "serial", "start", "stop", "v_len", "v_lat", "v_lon", "v_t",
+                            "p_cell", "p_flight", "p_t0", "p_t1")}
+    for i, f in enumerate(flights):
+        t = np.asarray(f["t"], dtype=np.int64)
+        idx = ts.simplify(f["lat"], f["lon"], SIMPLIFY_M)
+        lat, lon, t = f["lat"][idx], f["lon"][idx], t[idx]
+        cells, t0, t1 = postings(lat, lon, t)
+        cols["id"].append(f"{f['serial']}@{int(f['t'][0])}")
+        cols["serial"].append(f["serial"])
+        cols["start"].append(int(f["t"][0]))
+        cols["stop"].append(int(f["t"][-1]))
+        cols["v_len"].append(idx.size)
+        cols["v_lat"].append(lat)
+        cols["v_lon"].append(lon)
+        cols["v_t"].append(t)
+        cols["p_cell"].append(cells)
+        cols["p_flight"].append(np.full(cells.size, i, dtype=np.int32))
+        cols["p_t0"].append(t0)
+        cols["p_t1"].append(t1)
+    out = {}
+    for name, values in cols.items():
+        if name in ("id", "serial"):
+            out[name] = np.asarray(values, dtype=str)
+        elif name.startswith(("v_", "p_")) and name != "v_len":
+            out[name] = np.concatenate(values) if values else np.empty(0)
+        else:
+            out[name] = np.asarray(values, dtype=np.int64)
+    return out
+
+
+class FlightIndex:
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        self.lock = threading.Lock()
+        self.manifest = {"parts": [], "logs": {}, "next_part": 0}
+        self._set(build_part([]))
+        self.open = {}              # serial -> live flight still in the air
+        self._load()
+
+    # --- Storage ------------------------------------------------------------
+    def _manifest_path(self):
+        return os.path.join(self.index_dir, MANIFEST_FILE)
+
+    def _load(self):
+        try:
+            with open(self._manifest_path()) as f:
+                self.manifest = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        parts = [load_arrays(os.path.join(self.index_dir, p)) for p in self.manifest["parts"]]
+        self._set(self._merge(parts))
+
+    def _save_manifest(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, self._manifest_path())
+
+    def _write_part(self, part):
+        os.makedirs(self.index_dir, exist_ok=True)
+        name = f"part_{self.manifest['next_part']:06d}.npz"
+        self.manifest["next_part"] += 1
+        save_arrays(os.path.join(self.index_dir, name), part)
+        self.manifest["parts"].append(name)
+
+    @staticmethod
+    def _merge(parts):
+        parts = [p for p in parts if p["id"].size]
+        if not parts:
+            return build_part([])
+        out = {}
+        base = np.cumsum([0] + [p["id"].size for p in parts[:-1]])
+        for name in parts[0]:
+            values = [p[name] for p in parts]
+            if name == "p_flight":
+                values = [v.astype(np.int64) + b for v, b in zip(values, base)]
+            out[name] = np.concatenate(values)
+        return out
+
+    def _set(self, data):
+        """Install merged arrays and the derived lookup structures."""
+        self.data = data
+        order = np.argsort(data["p_cell"], kind="stable")
+        self.p_cell = data["p_cell"][order].astype(np.int64)
+        self.p_flight = data["p_flight"][order].astype(np.int64)
+        self.p_t0 = data["p_t0"][order].astype(np.int64)
+        self.p_t1 = data["p_t1"][order].astype(np.int64)
+        self.v_off = np.concatenate([[0], np.cumsum(data["v_len"])]).astype(np.int64)
+        self.ids = {str(i): n for n, i in enumerate(data["id"])}
+
+    # --- Updates ------------------------------------------------------------
+    def _is_new(self, flight):
+        """False when the same aircraft already has an indexed flight overlapping this one."""
+        d = self.data
+        same = d["serial"] == flight["serial"]
+        overlap = same & (d["start"] <= int(flight["t"][-1])) & (d["stop"] >= int(flight["t"][0]))
+        return not overlap.any()
+
+    def add(self, flights, log=None):
+        """Index a batch of flights (one new part file)."""
+        with self.lock:
+            flights = [f for f in flights if self._is_new(f)]
+            if flights:
+                part = build_part(flights)
+                self._write_part(part)
+                data = self._merge([self.data, part])
+                if len(self.manifest["parts"]) > MAX_PARTS:
+                    self._compact(data)
+                self._set(data)
+            if log:
+                self.manifest["logs"][log[0]] = log[1]
+            self._save_manifest()
+            return len(flights)
+
+    def _compact(self, data):
+        old = self.manifest["parts"]
+        self.manifest["parts"] = []
+        self._write_part(data)
+        self._save_manifest()
+        for name in old:
+            try:
+                os.remove(os.path.join(self.index_dir, name))
+            except OSError:
+                pass
+
+    def add_logs(self, log_dir=fl.LOG_DIR, settle_s=60):
+        """Index flight_recorder logs not seen before (or grown since)."""
+        added = 0
+        for path in fl.list_logs(log_dir):
+            st = os.stat(path)
+            key = f"{st.st_size}:{int(st.st_mtime)}"
+            if self.manifest["logs"].get(os.path.basename(path)) == key:
+                continue
+            if time.time() - st.st_mtime < settle_s:
+                continue                # Still being written; the live stream covers it
+            n = self.add(flights_from_log(path), (os.path.basename(path), key))
+            print(f"   📼 {os.path.basename(path)}: {n} new flight(s)")
+            added += n
+        return added
+
+    def update_live(self, record):
+        """Feed one telemetry/normalized drone record; indexes the flight on landing."""
+        lat, lon = record.get("lat", 0.0), record.get("lon", 0.0)
+        serial = record.get("serial")
+        if record.get("device_type") != "drone" or (lat == 0.0 and lon == 0.0):
+            return None
+        ts_ms = int(record.get("timestamp", 0))
+        airborne = record.get("airborne", int(record.get("alt", 0.0) > fe.AIRBORNE_HEIGHT_M))
+        flight = self.open.get(serial)
+        if airborne:
+            if flight is None:
+                flight = self.open[serial] = {"serial": serial, "t": [], "lat": [], "lon": [],
+                                              "ground_since": None}
+            flight["ground_since"] = None
+        elif flight is not None and flight["ground_since"] is None:
+            flight["ground_since"] = ts_ms
+        if flight is None:
+            return None
+        flight["t"].append(ts_ms)
+        flight["lat"].append(lat)
+        flight["lon"].append(lon)
+        if flight["ground_since"] is not None and ts_ms - flight["ground_since"] >= LANDED_AFTER_S * 1000:
+            del self.open[serial]
+            return self._close(flight)
+        return None
+
+    def _close(self, flight):
+        done = {"serial": flight["serial"], "t": np.asarray(flight["t"], dtype=np.int64),
+                "lat": np.asarray(flight["lat"]), "lon": np.asarray(flight["lon"])}
+        if done["t"].size < MIN_POINTS or done["t"][-1] - done["t"][0] < fe.MIN_FLIGHT_S * 1000:
+            return None
+        self.add([done])
+        return f"{done['serial']}@{int(done['t'][0])}"
+
+    # --- Queries ------------------------------------------------------------
+    def _candidates(self, lat0, lon0, lat1, lon1, start, stop):
+        """Flight indices with a posting in the padded cell rectangle and time window."""
+        rows = np.arange(cell_rows(lat0) - 1, cell_rows(lat1) + 2)
+        c0, c1 = int(cell_cols(lon0)) - 1, int(cell_cols(lon1)) + 1
+        lo = np.searchsorted(self.p_cell, rows * N_COLS + c0, "left")
+        hi = np.searchsorted(self.p_cell, rows * N_COLS + c1, "right")
+        hits = _ranges(lo, hi)
+        keep = (self.p_t1[hits] >= start) & (self.p_t0[hits] <= stop)
+        return np.unique(self.p_flight[hits[keep]])
+
+    def _segments(self, flights):
+        """Vertex index pairs (a, b) of every segment of the given flights."""
+        v = _ranges(self.v_off[flights], self.v_off[flights + 1])
+        owner = np.repeat(flights, self.v_off[flights + 1] - self.v_off[flights])
+        same = owner[:-1] == owner[1:]
+        return v[:-1][same], v[1:][same], owner[:-1][same]
+
+    def _passes(self, a, owner, hit, s_in, s_out, start, stop, extra=None):
+        """Group consecutive hit segments into passes with interpolated times."""
+        if not hit.any():
+            return []
+        d = self.data
+        a, owner, s_in, s_out = a[hit], owner[hit], s_in[hit], s_out[hit]
+        if extra is not None:
+            extra = extra[hit]
+        t_a = d["v_t"][a].astype(np.float64)
+        t_b = d["v_t"][a + 1].astype(np.float64)
+        t_in = t_a + s_in * (t_b - t_a)
+        t_out = t_a + s_out * (t_b - t_a)
+        brk = np.flatnonzero(np.r_[True, (owner[1:] != owner[:-1]) | (a[1:] != a[:-1] + 1)])
+        p_in = np.minimum.reduceat(t_in, brk)
+        p_out = np.maximum.reduceat(t_out, brk)
+        p_owner = owner[brk]
+        p_extra = np.minimum.reduceat(extra, brk) if extra is not None else None
+        results = {}
+        for k in np.flatnonzero((p_out >= start) & (p_in <= stop)):
+            f = int(p_owner[k])
+            r = results.get(f)
+            if r is None:
+                r = results[f] = {"flight": str(d["id"][f]), "serial": str(d["serial"][f]),
+                                  "start": int(d["start"][f]), "stop": int(d["stop"][f]), "passes": []}
+            r["passes"].append({"from": int(max(p_in[k], start)), "to": int(min(p_out[k], stop))})
+            if p_extra is not None:
+                r["min_distance_m"] = round(min(r.get("min_distance_m", float("inf")), float(p_extra[k])), 1)
+        return sorted(results.values(), key=lambda r: r["start"])
+
+    def near(self, lat, lon, radius_m, start=None, stop=None):
+        """Flights that passed within radius_m of (lat, lon)."""
+        start = -2 ** 62 if start is None else start
+        stop = 2 ** 62 if stop is None else stop
+        dlat = radius_m / METERS_PER_DEG
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        with self.lock:
+            flights = self._candidates(lat - dlat, lon - dlon, lat + dlat, lon + dlon, start, stop)
+            if not flights.size:
+                return []
+            a, b, owner = self._segments(flights)
+            d = self.data
+            # Local equirectangular metres around the query point (sub-metre at these ranges)
+            kx = METERS_PER_DEG * math.cos(math.radians(lat))
+            ax, ay = (d["v_lon"][a] - lon) * kx, (d["v_lat"][a] - lat) * METERS_PER_DEG
+            bx, by = (d["v_lon"][b] - lon) * kx, (d["v_lat"][b] - lat) * METERS_PER_DEG
+            dx, dy = bx - ax, by - ay
+            qa = dx * dx + dy * dy
+            qb = ax * dx + ay * dy
+            # Closest approach and where |a + s (b - a)| = radius
+            s_min = np.clip(np.where(qa > 0, -qb / np.where(qa > 0, qa, 1.0), 0.0), 0.0, 1.0)
+            dist = np.hypot(ax + s_min * dx, ay + s_min * dy)
+            hit = dist <= radius_m
+            root = np.sqrt(np.maximum(qb * qb - qa * (ax * ax + ay * ay - radius_m * radius_m), 0.0))
+            safe = np.where(qa > 0, qa, 1.0)
+            s_in = np.where(qa > 0, np.clip((-qb - root) / safe, 0.0, 1.0), 0.0)
+            s_out = np.where(qa > 0, np.clip((-qb + root) / safe, 0.0, 1.0), 1.0)
+            return self._passes(a, owner, hit, s_in, s_out, start, stop, dist)
+
+    def within(self, lat0, lon0, lat1, lon1, start=None, stop=None):
+        """Flights that crossed the bounding box (lat0, lon0)-(lat1, lon1)."""
+        start = -2 ** 62 if start is None else start
+        stop = 2 ** 62 if stop is None else stop
+        lat0, lat1 = min(lat0, lat1), max(lat0, lat1)
+        lon0, lon1 = min(lon0, lon1), max(lon0, lon1)
+        with self.lock:
+            flights = self._candidates(lat0, lon0, lat1, lon1, start, stop)
+            if not flights.size:
+                return []
+            a, b, owner = self._segments(flights)
+            d = self.data
+            # Liang-Barsky clip of every segment against the box
+            s_in = np.zeros(a.size)
+            s_out = np.ones(a.size)
+            hit = np.ones(a.size, dtype=bool)
+            for p0, p1, lo, hi in ((d["v_lat"][a], d["v_lat"][b], lat0, lat1),
+                                   (d["v_lon"][a], d["v_lon"][b], lon0, lon1)):
+                delta = p1 - p0
+                flat = delta == 0
+                hit &= ~flat | ((p0 >= lo) & (p0 <= hi))
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    r0 = (lo - p0) / delta
+                    r1 = (hi - p0) / delta
+                s_in = np.where(flat, s_in, np.maximum(s_in, np.minimum(r0, r1)))
+                s_out = np.where(flat, s_out, np.minimum(s_out, np.maximum(r0, r1)))
+            hit &= s_in <= s_out
+            return self._passes(a, owner, hit, s_in, s_out, start, stop)
+
+    def stats(self):
+        d = self.data
+        return {"flights": int(d["id"].size), "vertices": int(d["v_lat"].size),
+                "postings": int(self.p_cell.size), "parts": len(self.manifest["parts"]),
+                "open_flights": len(self.open)}
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def _window(time_range):
+    if not time_range:
+        return None, None
+    now = datetime.now(timezone.utc)
+    return int(parse_time(time_range, now).timestamp() * 1000), int(now.timestamp() * 1000)
+
+
+def _print_results(results, elapsed):
+    print(f"   {len(results)} flight(s) in {elapsed * 1000:.2f} ms")
+    for r in results:
+        passes = ", ".join(
+            f"{datetime.fromtimestamp(p['from'] / 1000, timezone.utc):%Y-%m-%d %H:%M:%S}"
+            f"+{(p['to'] - p['from']) / 1000:.0f}s" for p in r["passes"])
+        dist = f" | closest {r['min_distance_m']:.0f} m" if "min_distance_m" in r else ""
+        print(f"   ✈️  {r['flight']:<28}{dist} | {passes}")
+
+
+def run_live(index):
+    import paho.mqtt.client as mqtt
+
+    def on_message(client, userdata, msg):
+        try:
+            record = json.loads(msg.payload)
+        except json.JSONDecodeError:
+            return
+        flight = index.update_live(record)
+        if flight:
+            print(f"   🛬 Indexed {flight} ({index.stats()['flights']} flights)")
+
+    client = mqtt.Client()
+    client.on_message = on_message
+    client.connect(MQTT_BROKER, MQTT_PORT)
+    client.subscribe(NORMALIZED_TOPIC)
+    print(f"🛰️  Indexing landings from {NORMALIZED_TOPIC} into {index.index_dir}/")
+    try:
+        client.loop_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Stopped.")
+
+
+def synthetic_flights(n_flights, points, seed=0):
+    """Random survey-like flights scattered over ~20 km around the test site."""
+    rng = np.random.default_rng(seed)
+    flights = []
+    t0 = 1765729922498
+    for i in range(n_flights):
+        lat0 = 60.3195 + rng.uniform(-0.09, 0.09)
+        lon0 = 24.8307 + rng.uniform(-0.18, 0.18)
+        s = np.arange(points) / 10.0
+        heading = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.02, points))
+        step = 8.0 / 10.0 / METERS_PER_DEG
+        lat = lat0 + np.cumsum(np.cos(heading)) * step
+        lon = lon0 + np.cumsum(np.sin(heading)) * step / math.cos(math.radians(lat0))
+        t = t0 + i * 900_000 + (s * 1000).astype(np.int64)
+        flights.append({"serial": f"SN{i % 12}", "t": t, "lat": lat, "lon": lon})
+    return flights
+
+
+def run_bench(args):
+    import shutil
+    import tempfile
+
+    tmp = tempfile.mkdtemp(prefix="flight_index_")
+    try:
+        flights = synthetic_flights(args.flights, args.points)
+        index = FlightIndex(tmp)
+        t0 = time.perf_counter()
+        for i in range(0, len(flights), 250):
+            index.add(flights[i:i + 250])
+        t1 = time.perf_counter()
+        index = FlightIndex(tmp)
+        t2 = time.perf_counter()
+        print(f"🧪 {args.flights} flights x {args.points} fixes: built in {t1 - t0:.1f}s, "
+              f"reloaded in {t2 - t1:.2f}s | {index.stats()}")
+
+        rng = np.random.default_rng(1)
+        for name, fn in (
+                ("near 200 m", lambda la, lo: index.near(la, lo, 200.0)),
+                ("bbox 1 km", lambda la, lo: index.within(la, lo, la + 0.009, lo + 0.018))):
+            times, found = [], 0
+            for _ in range(args.queries):
+                la = 60.3195 + rng.uniform(-0.09, 0.09)
+                lo = 24.8307 + rng.uniform(-0.18, 0.18)
+                q0 = time.perf_counter()
+                found += len(fn(la, lo))
+                times.append(time.perf_counter() - q0)
+            times = np.asarray(times) * 1000
+            print(f"   {name:<10} median {np.median(times):.2f} ms | p99 {np.percentile(times, 99):.2f} ms "
+                  f"| {found / args.queries:.1f} flights/query")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spatial index over recorded and live flights.")
+    parser.add_argument("--index", default=INDEX_DIR)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("build", help="Index new flight_recorder logs")
+    p.add_argument("--logs", default=fl.LOG_DIR)
+
+    p = sub.add_parser("near", help="Flights within a radius of a point")
+    p.add_argument("lat", type=float)
+    p.add_argument("lon", type=float)
+    p.add_argument("--radius", type=float, default=200.0)
+    p.add_argument("--range", dest="time_range")
+
+    p = sub.add_parser("bbox", help="Flights crossing a bounding box")
+    for name in ("lat0", "lon0", "lat1", "lon1"):
+        p.add_argument(name, type=float)
+    p.add_argument("--range", dest="time_range")
+
+    sub.add_parser("live", help=f"Index flights from {NORMALIZED_TOPIC} as they land")
+
+    p = sub.add_parser("bench", help="Synthetic build/query benchmark")
+    p.add_argument("--flights", type=int, default=3000)
+    p.add_argument("--points", type=int, default=3000)
+    p.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.cmd == "bench":
+        run_bench(args)
+        return
+
+    index = FlightIndex(args.index)
+    if args.cmd == "build":
+        print(f"🗂️  FLIGHT INDEX | {args.index}/ <- {args.logs}/")
+        index.add_logs(args.logs)
+        print(f"   {index.stats()}")
+    elif args.cmd == "near":
+        start, stop = _window(args.time_range)
+        t0 = time.perf_counter()
+        results = index.near(args.lat, args.lon, args.radius, start, stop)
+        _print_results(results, time.perf_counter() - t0)
+    elif args.cmd == "bbox":
+        start, stop = _window(args.time_range)
+        t0 = time.perf_counter()
+        results = index.within(args.lat0, args.lon0, args.lat1, args.lon1, start, stop)
+        _print_results(results, time.perf_counter() - t0)
+    elif args.cmd == "live":
+        run_live(index)
+
+
+if __name__ == "__main__":
+    main()
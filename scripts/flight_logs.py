@@ -0,0 +1,119 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: flight_logs.py
+Description: Shared reader for the on-disk flight logs written by
+             flight_recorder.py ("<iso time> | <topic> | <json payload>").
+             Line parsing lives in src/recordings.py (the bridge modules
+             read the same logs) and is re-exported here. This module adds
+             log discovery, chunking for worker processes, and flattens
+             payloads the same way Telegraf's JSON parser does, so offline
+             tools see the exact field names stored in InfluxDB.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import glob
+import os
+import sys
+
+# Line parsing is shared with the bridge modules; re-exported for the scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from recordings import SEPARATOR, parse_line, iter_raw, iter_records
+
+# Directory used by flight_recorder.py
+LOG_DIR = "flight_logs"
+LOG_PATTERN = "flight_*.jsonl"
+
+# Telegraf settings mirrored from config/telegraf.conf
+MEASUREMENT = "mqtt_consumer"
+TAG_KEYS = ("bid",)
+
+
+def list_logs(log_dir=LOG_DIR):
+    """Return every recorded flight log in the directory, oldest first."""
+    return sorted(glob.glob(os.path.join(log_dir, LOG_PATTERN)))
+
+
+def complete_size(path):
+    """Bytes of the log up to and including its last newline (skips a line still being written)."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        pos = size
+        while pos > 0:
+            step = min(65536, pos)
+            f.seek(pos - step)
+            block = f.read(step)
+            nl = block.rfind(b"\n")
+            if nl >= 0:
+                return pos - step + nl + 1
+            pos -= step
+    return 0
+
+
+def chunk_offsets(path, chunk_bytes, start=0, size=None):
+    """
+    Split a log into [start, end) byte ranges aligned to line boundaries.
+    'start' must itself be a line boundary; 'size' caps the range (default:
+    the whole file).
+    """
+    size = os.path.getsize(path) if size is None else size
+    offsets = []
+    with open(path, "rb") as f:
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            offsets.append((start, end))
+            start = end
+    return offsets
+
+
+def flatten(obj, prefix="", out=None):
+    """
+    Flatten nested JSON the way Telegraf's json parser does:
+    dict keys and list indexes joined with '_', numbers become floats,
+    booleans are kept, strings and nulls are dropped.
+    """
+    if out is None:
+        out = {}
+    if type(obj) is dict:
+        items = obj.items()
+    elif type(obj) is list:
+        items = enumerate(obj)
+    else:
+        return out
+    for key, value in items:
+        name = f"{prefix}_{key}" if prefix else str(key)
+        kind = type(value)
+        if kind is float:
+            out[name] = value
+        elif kind is int:
+            out[name] = float(value)
+        elif kind is bool:
+            out[name] = value
+        elif kind is dict or kind is list:
+            flatten(value, name, out)
+    return out
+
+
+def split_tags(payload, topic):
+    """Return (tags, fields) for a payload exactly as Telegraf stores it."""
+    tags = {"topic": topic}
+    body = {}
+    for key, value in payload.items():
+        if key in TAG_KEYS:
+            if value is not None:
+                tags[key] = str(value)
+        else:
+            body[key] = value
+    return tags, flatten(body)
+
+
+def serial_from_topic(topic):
+    """thing/product/<sn>/osd -> <sn> (None for other topics)."""
+    parts = topic.split("/")
+    if len(parts) >= 4 and parts[0] == "thing" and parts[1] == "product":
+        return parts[2]
+    return None
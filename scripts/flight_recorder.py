@@ -1,22 +1,57 @@
 import paho.mqtt.client as mqtt
 import datetime
+import json
 import os
+import sys
+
+# static_dedup lives with the bridge
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from static_dedup import StaticCache
 
 # CONFIG
 LOG_DIR = "flight_logs"
-if not os.path.exists(LOG_DIR): os.makedirs(LOG_DIR)
-filename = f"{LOG_DIR}/flight_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
-
-def on_message(client, userdata, msg):
-    with open(filename, "a") as f:
-        # Save timestamp + topic + payload
-        f.write(f"{datetime.datetime.now().isoformat()} | {msg.topic} | {msg.payload.decode()}\n")
-    print(f".", end="", flush=True)
-
-client = mqtt.Client("FlightRecorder")
-client.on_connect = lambda c, u, f, rc: c.subscribe("thing/product/+/osd")
-client.on_message = on_message
-
-print(f"🔴 RECORDER STARTED: Saving to {filename}")
-client.connect("localhost", 1883, 60)
-client.loop_forever()
+# The bridge's default sink publishes slim OSD plus a retained /static topic;
+# both are merged back so archives keep the full vendor payload.
+TOPICS = [("thing/product/+/osd", 0), ("thing/product/+/static", 1)]
+
+
+class Recorder:
+    """Appends full OSD payloads to one log ('<iso time> | <topic> | <json>')."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.cache = StaticCache()
+        self.unmerged = 0
+
+    def on_message(self, topic, payload):
+        try:
+            full = self.cache.on_message(topic, payload)
+        except ValueError:
+            return False
+        if topic.endswith("/static"):
+            return False
+        if full is None:
+            # Slim packet ahead of its static message: keep it rather than lose the fix
+            self.unmerged += 1
+            full = json.loads(payload)
+        with open(self.filename, "a") as f:
+            f.write(f"{datetime.datetime.now().isoformat()} | {topic} | {json.dumps(full, separators=(',', ':'))}\n")
+        return True
+
+
+if __name__ == "__main__":
+    if not os.path.exists(LOG_DIR): os.makedirs(LOG_DIR)
+    filename = f"{LOG_DIR}/flight_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+    recorder = Recorder(filename)
+
+    def on_message(client, userdata, msg):
+        if recorder.on_message(msg.topic, msg.payload):
+            print(f".", end="", flush=True)
+
+    client = mqtt.Client("FlightRecorder")
+    client.on_connect = lambda c, u, f, rc: c.subscribe(TOPICS)
+    client.on_message = on_message
+
+    print(f"🔴 RECORDER STARTED: Saving to {filename}")
+    client.connect("localhost", 1883, 60)
+    client.loop_forever()
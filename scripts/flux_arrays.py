@@ -0,0 +1,137 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: flux_arrays.py
+Description: Streams Flux query results as CSV straight into NumPy columns.
+             Avoids building one FluxRecord object per row, which is what
+             made the analysis scripts crawl on a full day of telemetry.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import numpy as np
+from influxdb_client import Dialect
+
+# Plain CSV: one header row per table schema, no annotation rows
+CSV_DIALECT = Dialect(header=True, annotations=[], delimiter=",", comment_prefix="#")
+
+TIME_COLUMNS = ("_time", "_start", "_stop")
+NUMERIC_COLUMNS = ("_value",)
+
+
+def to_datetime(values):
+    """RFC3339 strings ('...Z') -> datetime64[ns]."""
+    arr = np.asarray(values, dtype=str)
+    if arr.size == 0:
+        return arr.astype("datetime64[ns]")
+    return np.char.rstrip(arr, "Z").astype("datetime64[ns]")
+
+
+def to_float(values):
+    """CSV strings -> float64, empty cells become NaN."""
+    arr = np.asarray(values, dtype=str)
+    if arr.size == 0:
+        return arr.astype(np.float64)
+    return np.where(arr == "", "nan", arr).astype(np.float64)
+
+
+def rows_to_columns(rows):
+    """
+    Collect CSV rows (iterable of lists) into {column: list}.
+    Flux repeats the header whenever the table schema changes, so headers are
+    detected by their leading ',result,table' signature rather than position.
+    Columns missing from some tables are padded with empty strings.
+    """
+    columns = {}
+    header = None
+    missing = []
+    count = 0
+    for row in rows:
+        if not row or (len(row) == 1 and not row[0]):
+            continue
+        if len(row) > 2 and row[1] == "result" and row[2] == "table":
+            header = row
+            for name in header:
+                if name and name not in columns:
+                    columns[name] = [""] * count
+            missing = [columns[name] for name in columns if name not in header]
+            continue
+        if header is None:
+            continue
+        for name, value in zip(header, row):
+            if name:
+                columns[name].append(value)
+        for values in missing:
+            values.append("")
+        count += 1
+    return columns
+
+
+def columns_to_arrays(columns):
+    """Convert raw CSV columns to typed NumPy arrays."""
+    arrays = {}
+    for name, values in columns.items():
+        if name in TIME_COLUMNS:
+            arrays[name] = to_datetime(values)
+        elif name in NUMERIC_COLUMNS:
+            try:
+                arrays[name] = to_float(values)
+            except ValueError:
+                arrays[name] = np.asarray(values, dtype=str)
+        else:
+            arrays[name] = np.asarray(values, dtype=str)
+    return arrays
+
+
+def query_arrays(query_api, flux):
+    """Run a Flux query and return {column: np.ndarray} without per-row objects."""
+    rows = query_api.query_csv(flux, dialect=CSV_DIALECT)
+    return columns_to_arrays(rows_to_columns(rows))
+
+
+def split_fields(arrays, fields=None):
+    """
+    Split long-format (_time, _field, _value) arrays into
+    {field: (times, values)} sorted by time.
+    """
+    out = {}
+    if "_field" not in arrays or arrays["_field"].size == 0:
+        return out
+    names = arrays["_field"]
+    for field in (fields or np.unique(names)):
+        mask = names == field
+        t = arrays["_time"][mask]
+        v = arrays["_value"][mask]
+        order = np.argsort(t, kind="stable")
+        out[str(field)] = (t[order], v[order])
+    return out
+
+
+def align_to_grid(times, values, start, step_s, n, max_gap=None):
+    """
+    Place (times, values) on a regular grid of n slots of step_s seconds
+    beginning at 'start', forward-filling gaps (Flux fill(usePrevious: true)).
+    Gaps longer than max_gap slots are left as NaN so separate flights are
+    not glued together by a stale value.
+    """
+    grid = np.full(n, np.nan)
+    if times.size == 0:
+        return grid
+    step = np.timedelta64(int(step_s * 1e9), "ns")
+    idx = ((times - start) // step).astype(np.int64)
+    ok = (idx >= 0) & (idx < n) & ~np.isnan(values)
+    grid[idx[ok]] = values[ok]
+    return ffill(grid, max_gap)
+
+
+def ffill(arr, limit=None):
+    """Forward-fill NaNs along a 1-D array (leading NaNs stay NaN)."""
+    pos = np.arange(arr.size)
+    idx = np.where(~np.isnan(arr), pos, -1)
+    np.maximum.accumulate(idx, out=idx)
+    out = arr[np.maximum(idx, 0)]
+    out[idx < 0] = np.nan
+    if limit is not None:
+        out[pos - idx > limit] = np.nan
+    return out
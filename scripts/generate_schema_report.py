@@ -1,14 +1,35 @@
 import os
 import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from influxdb_client import InfluxDBClient
 
+from datetime import datetime, timezone
+
+import numpy as np
+
+from query_cache import QueryCache, parse_time, rfc3339
+
 # ==============================================================================
 # Script Name: generate_schema_report.py
 # Description: Connects to InfluxDB, infers the schema of existing measurements,
 #              and generates a JSON report for Grafana dashboard building.
-# Version:     1.1.1 (Token Fix & Performance Tuning)
+#              Preview queries are split into aligned blocks up to now():
+#              closed blocks come from the local query cache on repeat runs
+#              (--no-cache to skip), only the open tail is asked again. Key
+#              queries (measurements, tags, fields) cover KEYS_WINDOW in one
+#              query each and run concurrently through a bounded thread pool;
+#              the preview is one grouped last() query per measurement, and
+#              field types come from the stored _value type (types.isType),
+#              not from parsing the sample.
+#              Fields missing from the previous report are probed over
+#              PREVIEW_WINDOW; known fields only since the previous run
+#              (probed_at), and a stored type that changed is reported
+#              (--full re-probes everything).
+# Version:     1.3.0 (Concurrent + Incremental Discovery)
 # Author:      System Architect (Gemini)
-# Date:        2025-12-15
+# Date:        2025-12-19
 # ==============================================================================
 
 # Configuration
@@ -19,8 +40,50 @@ INFLUX_ORG = "autel_ops"
 INFLUX_BUCKET = "telemetry"
 
 REPORT_FILE = "schema_report.json"
+KEYS_WINDOW = "-30d"      # Same default as the influxdata/influxdb/schema package
+PREVIEW_WINDOW = "-24h"
+MAX_CONCURRENCY = 4       # Parallel Flux queries in flight against InfluxDB
+
+# Flux type name -> report type name (InfluxDB line protocol terms)
+FIELD_TYPES = (
+    ("float", "float"),
+    ("int", "integer"),
+    ("uint", "unsigned"),
+    ("bool", "boolean"),
+    ("string", "string"),
+)
+
+def _type_column():
+    """Flux map() expression naming the stored type of r._value."""
+    expr = '"string"'
+    for flux_type, name in reversed(FIELD_TYPES[:-1]):
+        expr = f'if types.isType(v: r._value, type: "{flux_type}") then "{name}" else {expr}'
+    return expr
+
+def _sample(value, kind):
+    """CSV cells arrive as text; restore the value by its stored type."""
+    try:
+        if kind == "boolean":
+            return value == "true"
+        if kind in ("integer", "unsigned"):
+            return int(float(value))
+        if kind == "float":
+            return float(value)
+    except (TypeError, ValueError):
+        pass
+    return value
 
-def generate_report():
+def load_previous_report(path=REPORT_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def _flux_set(names):
+    return "[" + ", ".join(json.dumps(n) for n in names) + "]"
+
+def generate_report(use_cache=True, full=False):
     print(f"🔍 Connecting to InfluxDB at {INFLUX_URL} (Org: {INFLUX_ORG}, Bucket: {INFLUX_BUCKET})...")
     
     # FIX: Increased timeout to 30s to handle large datasets without crashing
@@ -32,78 +95,114 @@ def generate_report():
     )
     
     query_api = client.query_api()
+    cache = QueryCache(enabled=use_cache)
+    previous = {} if full else load_previous_report()
     
     schema_data = {}
+    started = time.perf_counter()
+    probed_at = rfc3339(datetime.now(timezone.utc))
+    preview_start = parse_time(PREVIEW_WINDOW)
+
+    def values_of(flux):
+        # The whole window in one query: key sets gain nothing from blocks
+        result = cache.query(query_api, flux, KEYS_WINDOW, split=False)
+        return list(dict.fromkeys(str(v) for v in result.get("_value", [])))
+
+    def tag_keys(m):
+        return values_of(f"""
+            import "influxdata/influxdb/schema"
+            schema.measurementTagKeys(bucket: "{INFLUX_BUCKET}", measurement: "{m}", start: v.timeRangeStart, stop: v.timeRangeStop)
+            """)
+
+    def field_keys(m):
+        return values_of(f"""
+            import "influxdata/influxdb/schema"
+            schema.measurementFieldKeys(bucket: "{INFLUX_BUCKET}", measurement: "{m}", start: v.timeRangeStart, stop: v.timeRangeStop)
+            """)
+
+    def preview(m, fields, start=PREVIEW_WINDOW):
+        # One grouped query: the latest value, its time and stored type of every requested field
+        result = cache.query(query_api, f"""
+            import "types"
+            from(bucket: "{INFLUX_BUCKET}")
+              |> range(start: v.timeRangeStart, stop: v.timeRangeStop)
+              |> filter(fn: (r) => r["_measurement"] == "{m}")
+              |> filter(fn: (r) => contains(value: r["_field"], set: {_flux_set(fields)}))
+              |> group(columns: ["_field"])
+              |> last()
+              |> map(fn: (r) => ({{r with _type: {_type_column()}}}))
+              |> keep(columns: ["_time", "_field", "_value", "_type"])
+            """, start)
+        # Blocks arrive oldest first: the newest block's last() wins
+        times = np.datetime_as_string(result["_time"], unit="s") if "_time" in result else []
+        return {str(f): (_sample(str(v), str(k)), str(k), f"{t}Z")
+                for f, v, k, t in zip(result.get("_field", []), result.get("_value", []),
+                                      result.get("_type", []), times)}
 
     try:
         # 1. Get List of Measurements
         print("   ...fetching measurements")
         # Optimized query using schema package is faster than raw flux
-        measurements_query = f"""
+        measurements = values_of(f"""
         import "influxdata/influxdb/schema"
-        schema.measurements(bucket: "{INFLUX_BUCKET}")
-        """
-        
-        tables = query_api.query(measurements_query)
-        measurements = [record.get_value() for table in tables for record in table]
+        schema.measurements(bucket: "{INFLUX_BUCKET}", start: v.timeRangeStart, stop: v.timeRangeStop)
+        """)
 
         if not measurements:
             print("❌ No measurements found. Please start the telemetry ingestion first.")
             return
 
-        # 2. Inspect Each Measurement
-        for m in measurements:
-            print(f"   found measurement: {m}")
-            schema_data[m] = {
-                "fields": [],
-                "tags": [],
-                "recent_values": {}
-            }
-
-            # 3. Get Tag Keys
-            tag_query = f"""
-            import "influxdata/influxdb/schema"
-            schema.measurementTagKeys(bucket: "{INFLUX_BUCKET}", measurement: "{m}")
-            """
-            tag_tables = query_api.query(tag_query)
-            for t_table in tag_tables:
-                for t_record in t_table:
-                    schema_data[m]["tags"].append(t_record.get_value())
-
-            # 4. Get Field Keys
-            field_query = f"""
-            import "influxdata/influxdb/schema"
-            schema.measurementFieldKeys(bucket: "{INFLUX_BUCKET}", measurement: "{m}")
-            """
-            field_tables = query_api.query(field_query)
-            for f_table in field_tables:
-                for f_record in f_table:
-                    schema_data[m]["fields"].append(f_record.get_value())
-
-            # 5. Get Preview Data (Optimized)
-            # FIX: Added range(start: -24h) to prevent scanning infinite history
-            preview_flux = f"""
-            from(bucket: "{INFLUX_BUCKET}")
-              |> range(start: -24h)
-              |> filter(fn: (r) => r["_measurement"] == "{m}")
-              |> limit(n:5)
-            """
-            preview_tables = query_api.query(preview_flux)
-            
-            for p_table in preview_tables:
-                for p_record in p_table:
-                    field_name = p_record.get_field()
-                    value = p_record.get_value()
-                    # Store a sample value to help identify data types
-                    if field_name not in schema_data[m]["recent_values"]:
-                        schema_data[m]["recent_values"][field_name] = value
-
-        # 6. Save Report
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as pool:
+            # 2. Tag + Field Keys for every measurement, all in flight at once
+            tag_futures = {m: pool.submit(tag_keys, m) for m in measurements}
+            field_futures = {m: pool.submit(field_keys, m) for m in measurements}
+
+            # 3. Preview what the previous report cannot answer, and re-check
+            #    known fields only for data written since it was made
+            preview_futures = {}
+            for m in measurements:
+                fields = field_futures[m].result()
+                before = previous.get(m, {})
+                known = before.get("recent_values", {})
+                types = before.get("field_types", {})
+                seen = before.get("last_seen", {})
+                since = before.get("probed_at")
+                recent = since is not None and parse_time(since) > preview_start
+                to_probe = [f for f in fields if f not in known or f not in types or not recent]
+                to_check = [f for f in fields if f not in to_probe]
+                schema_data[m] = {
+                    "fields": fields,
+                    "tags": [],
+                    "recent_values": {f: known[f] for f in fields if f in known},
+                    "field_types": {f: types[f] for f in fields if f in types},
+                    "last_seen": {f: seen[f] for f in fields if f in seen},
+                    "probed_at": probed_at,
+                }
+                preview_futures[m] = [pool.submit(preview, m, names, start)
+                                      for names, start in ((to_probe, PREVIEW_WINDOW), (to_check, since)) if names]
+                print(f"   found measurement: {m} ({len(fields)} fields, {len(to_probe)} to probe, "
+                      f"{len(to_check)} to re-check)")
+
+            for m in measurements:
+                entry = schema_data[m]
+                entry["tags"] = tag_futures[m].result()
+                for future in preview_futures[m]:
+                    for f, (value, kind, seen_at) in future.result().items():
+                        old = entry["field_types"].get(f)
+                        if old is not None and old != kind:
+                            print(f"   ⚠️  {m}.{f} changed type: {old} -> {kind}")
+                        entry["recent_values"][f] = value
+                        entry["field_types"][f] = kind
+                        entry["last_seen"][f] = seen_at
+
+        # 4. Save Report
         with open(REPORT_FILE, "w") as f:
             json.dump(schema_data, f, indent=4)
         
-        print(f"\n✅ Schema Report generated: {REPORT_FILE}")
+        print(f"\n✅ Schema Report generated: {REPORT_FILE} in {time.perf_counter() - started:.1f}s")
         print("   Use this JSON to map your Grafana panels correctly.")
+        if use_cache:
+            print(f"   💾 Query cache: {cache.stats()}")
 
     except Exception as e:
         print(f"\n❌ ERROR: Failed to generate report. {e}")
@@ -111,4 +210,4 @@ def generate_report():
         client.close()
 
 if __name__ == "__main__":
-    generate_report()
+    generate_report(use_cache="--no-cache" not in sys.argv[1:], full="--full" in sys.argv[1:])
@@ -0,0 +1,469 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: heatmap_tiles.py
+Description: Offline "where we fly" heatmap as a z/x/y tile pyramid.
+             Airborne fixes from flight_recorder logs (parsed in a process
+             pool, line-aligned chunks like backfill_flights.py) or from the
+             'telemetry_normalized' measurement are binned at BASE_ZOOM with
+             one np.bincount per tile. Counts are stored per tile at every
+             zoom (parents are exact 2x2 sums of their children) and rendered
+             once to PNG, so month-scale maps are static files.
+
+             Updates are incremental: only the bytes appended to a log since
+             it was last binned are read (the recorder grows one log per
+             session), InfluxDB hours before the watermark are skipped, and
+             only the tiles touched by new fixes (plus their parents) are
+             re-summed and re-rendered.
+
+             python heatmap_tiles.py logs [flight_logs/*.jsonl]
+             python heatmap_tiles.py influx --range -30d
+             python heatmap_tiles.py serve          -> http://host:8766/{z}/{x}/{y}.png
+             python heatmap_tiles.py bench
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import flight_logs
+from flight_events import AIRBORNE_HEIGHT_M
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from tiles import TILE, mercator_pixels, write_png
+
+# CONFIGURATION
+INFLUX_URL = "http://localhost:8086"
+INFLUX_TOKEN = "my-super-secret-token-change-me"
+INFLUX_ORG = "autel_ops"
+INFLUX_BUCKET = "telemetry"
+MEASUREMENT = "telemetry_normalized"
+
+HEATMAP_DIR = os.getenv("HEATMAP_DIR", "heatmap")
+MANIFEST_FILE = "manifest.json"
+BASE_ZOOM = 16                  # 2.4 m pixels at the equator, 1.2 m at 60°N
+MIN_ZOOM = 6
+CHUNK_BYTES = 8 * 1024 * 1024
+SETTLE = timedelta(minutes=5)   # Same grace as query_cache before an hour is final
+PORT = 8766
+
+# Colour: log ramp of fixes per pixel. Tracks are lines, so a pixel one zoom
+# out holds ~2x (not 4x) the fixes: density is normalized by 2^(BASE - z).
+REFERENCE_FIXES = 50.0          # 5 s of 10 Hz dwell in one base pixel = full colour
+RAMP = np.array([[0, 0, 0, 0],
+                 [65, 105, 225, 120],
+                 [0, 200, 170, 170],
+                 [255, 215, 0, 210],
+                 [220, 20, 60, 240]], dtype=np.float64)
+COLOR_LUT = np.stack([np.interp(np.linspace(0, len(RAMP) - 1, 256), np.arange(len(RAMP)), RAMP[:, c])
+                      for c in range(4)], axis=1).astype(np.uint8)
+
+
+# ---------------------------------------------------------------------------
+# BINNING
+# ---------------------------------------------------------------------------
+def to_pixels(lat, lon, zoom=BASE_ZOOM):
+    """Web Mercator global integer pixel (x, y) at zoom."""
+    size = TILE * 2 ** zoom
+    x, y = mercator_pixels(lat, lon, zoom)
+    return (np.clip(x, 0, size - 1).astype(np.int64), np.clip(y, 0, size - 1).astype(np.int64))
+
+
+def bin_points(lat, lon, zoom=BASE_ZOOM):
+    """Fixes -> (keys, counts); key = tile x << 32 | tile y << 16 | pixel in tile."""
+    if not len(lat):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    gx, gy = to_pixels(lat, lon, zoom)
+    keys = ((gx >> 8) << 32) | ((gy >> 8) << 16) | ((gy & 255) << 8) | (gx & 255)
+    keys, counts = np.unique(keys, return_counts=True)
+    return keys, counts.astype(np.int64)
+
+
+def merge_bins(parts):
+    keys = np.concatenate([p[0] for p in parts]) if parts else np.empty(0, dtype=np.int64)
+    counts = np.concatenate([p[1] for p in parts]) if parts else np.empty(0, dtype=np.int64)
+    if not keys.size:
+        return keys, counts
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+def bin_chunk(path, start, end, zoom, min_height):
+    """Worker process entry point: airborne aircraft fixes of one log chunk."""
+    lat, lon = [], []
+    for _, topic, payload in flight_logs.iter_records(path, start, end):
+        if not topic.endswith("/osd"):
+            continue
+        data = payload.get("data")
+        if not isinstance(data, dict) or "latitude" not in data:
+            continue
+        la, lo = data.get("latitude", 0.0), data.get("longitude", 0.0)
+        if (la or lo) and data.get("height", 0.0) > min_height:
+            lat.append(la)
+            lon.append(lo)
+    return bin_points(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64), zoom)
+
+
+# ---------------------------------------------------------------------------
+# PYRAMID
+# ---------------------------------------------------------------------------
+class TilePyramid:
+    def __init__(self, root=HEATMAP_DIR, base_zoom=BASE_ZOOM, min_zoom=MIN_ZOOM,
+                 reference=REFERENCE_FIXES):
+        self.root = root
+        self.base_zoom = base_zoom
+        self.min_zoom = min_zoom
+        self.reference = reference
+        self.manifest = {"base_zoom": base_zoom, "logs": {}, "influx_watermark": None}
+        try:
+            with open(os.path.join(root, MANIFEST_FILE)) as f:
+                self.manifest.update(json.load(f))
+        except (OSError, json.JSONDecodeError):
+            pass
+        if self.manifest["base_zoom"] != base_zoom:
+            raise ValueError(f"{root} was built at zoom {self.manifest['base_zoom']}, not {base_zoom}")
+
+    def save_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, MANIFEST_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    # --- Storage ------------------------------------------------------------
+    def _counts_path(self, z, x, y):
+        return os.path.join(self.root, "counts", str(z), str(x), f"{y}.npz")
+
+    def tile_path(self, z, x, y):
+        return os.path.join(self.root, "tiles", str(z), str(x), f"{y}.png")
+
+    def load(self, z, x, y):
+        """Counts of one tile (stored sparse: pixel index + count)."""
+        try:
+            with np.load(self._counts_path(z, x, y)) as data:
+                out = np.zeros(TILE * TILE, dtype=np.int64)
+                out[data["i"]] = data["v"]
+        except OSError:
+            return None
+        return out.reshape(TILE, TILE)
+
+    def store(self, z, x, y, counts):
+        path = self._counts_path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        flat = counts.reshape(-1)
+        nz = np.flatnonzero(flat)
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(f, i=nz.astype(np.uint16), v=np.minimum(flat[nz], np.iinfo(np.uint32).max).astype(np.uint32))
+        os.replace(f"{path}.tmp", path)
+        self.render(z, x, y, counts)
+
+    def render(self, z, x, y, counts):
+        flat = counts.reshape(-1)
+        nz = np.flatnonzero(flat)
+        density = flat[nz] / 2.0 ** (self.base_zoom - z)
+        level = np.log1p(density) * (255.0 / math.log1p(self.reference))
+        rgba = np.zeros((TILE * TILE, 4), dtype=np.uint8)
+        rgba[nz] = COLOR_LUT[np.clip(level, 1, 255).astype(np.int64)]
+        path = self.tile_path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_png(path, rgba.reshape(TILE, TILE, 4))
+
+    # --- Updates ------------------------------------------------------------
+    def add(self, keys, counts, pool=None):
+        """
+        Fold binned fixes into the base tiles, then rebuild touched parents
+        one zoom level at a time (in the process pool when given).
+        """
+        if not keys.size:
+            return 0
+        run = pool.map if pool is not None else map
+        tile_keys = keys >> 16
+        bounds = np.flatnonzero(np.r_[True, tile_keys[1:] != tile_keys[:-1], True])
+        work = [(int(tile_keys[a] >> 16), int(tile_keys[a] & 0xFFFF), keys[a:b] & 0xFFFF, counts[a:b])
+                for a, b in zip(bounds[:-1], bounds[1:])]
+        touched = set(run(self._update_base, work))
+        n = len(touched)
+        for z in range(self.base_zoom - 1, self.min_zoom - 1, -1):
+            touched = {(x >> 1, y >> 1) for x, y in touched}
+            list(run(partial(self._update_parent, z), sorted(touched)))
+            n += len(touched)
+        return n
+
+    def _update_base(self, item):
+        x, y, pixels, counts = item
+        add = np.bincount(pixels, weights=counts, minlength=TILE * TILE).astype(np.int64).reshape(TILE, TILE)
+        base = self.load(self.base_zoom, x, y)
+        self.store(self.base_zoom, x, y, add if base is None else base + add)
+        return x, y
+
+    def _update_parent(self, z, tile):
+        self.store(z, tile[0], tile[1], self.parent_counts(z, *tile))
+
+    def parent_counts(self, z, x, y):
+        out = np.zeros((TILE, TILE), dtype=np.int64)
+        half = TILE // 2
+        for dy in (0, 1):
+            for dx in (0, 1):
+                child = self.load(z + 1, 2 * x + dx, 2 * y + dy)
+                if child is not None:
+                    out[dy * half:(dy + 1) * half, dx * half:(dx + 1) * half] = (
+                        child[0::2, 0::2] + child[0::2, 1::2] + child[1::2, 0::2] + child[1::2, 1::2])
+        return out
+
+
+# ---------------------------------------------------------------------------
+# SOURCES
+# ---------------------------------------------------------------------------
+def build_from_logs(pyramid, logs, workers, min_height):
+    # The recorder appends to one log per session: remember how many bytes
+    # of each log are binned and only bin what was appended since.
+    work, done = [], {}
+    for path in logs:
+        name = os.path.basename(path)
+        binned = pyramid.manifest["logs"].get(name, 0)
+        if isinstance(binned, str):         # Older manifests: "size:mtime"
+            binned = int(binned.split(":")[0])
+        size = flight_logs.complete_size(path)
+        if size < binned:
+            print(f"⚠️ {name} is shorter than the {binned} bytes already binned; rebuild the heatmap to include it")
+            continue
+        if size == binned:
+            continue
+        done[name] = size
+        work += [(path, s, e) for s, e in flight_logs.chunk_offsets(path, CHUNK_BYTES, binned, size)]
+    if not work:
+        print("✅ Nothing to do: every log is already in the heatmap.")
+        return
+
+    print(f"🔥 Binning {len(work)} chunk(s) from {len(done)} log(s) | {workers} worker(s)")
+    t0 = time.perf_counter()
+    fn = partial(bin_chunk, zoom=pyramid.base_zoom, min_height=min_height)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        bins = merge_bins(list(pool.map(fn, *zip(*work))))
+        t1 = time.perf_counter()
+        tiles = pyramid.add(*bins, pool=pool if workers > 1 else None)
+    pyramid.manifest["logs"].update(done)
+    pyramid.save_manifest()
+    print(f"   {int(bins[1].sum()):,} airborne fixes binned in {t1 - t0:.1f}s, "
+          f"{tiles} tile(s) updated in {time.perf_counter() - t1:.1f}s")
+
+
+def pair_fixes(arrays, min_height):
+    """telemetry_normalized long rows -> airborne (lat, lon) pairs."""
+    if not arrays.get("_field", np.empty(0)).size:
+        return np.empty(0), np.empty(0)
+    _, code = np.unique(arrays.get("serial", np.zeros(arrays["_field"].size, dtype=str)), return_inverse=True)
+    # Timestamps are whole milliseconds: the serial code fits in the ns digits
+    key = arrays["_time"].astype("datetime64[ns]").astype(np.int64) + code
+    fields = {}
+    for name in ("lat", "lon", "alt"):
+        m = arrays["_field"] == name
+        fields[name] = (key[m], arrays["_value"][m])
+    k, i, j = np.intersect1d(fields["lat"][0], fields["lon"][0], return_indices=True)
+    lat, lon = fields["lat"][1][i], fields["lon"][1][j]
+    _, ka, kb = np.intersect1d(k, fields["alt"][0], return_indices=True)
+    airborne = np.zeros(k.size, dtype=bool)
+    airborne[ka] = fields["alt"][1][kb] > min_height
+    ok = airborne & ((lat != 0.0) | (lon != 0.0))
+    return lat[ok], lon[ok]
+
+
+def build_from_influx(pyramid, time_range, min_height, workers=1, use_cache=True):
+    from influxdb_client import InfluxDBClient
+    from query_cache import QueryCache, floor_time, parse_time, rfc3339
+
+    now = datetime.now(timezone.utc)
+    stop = floor_time(now - SETTLE, timedelta(hours=1))
+    start = floor_time(parse_time(time_range, now), timedelta(hours=1))
+    if pyramid.manifest["influx_watermark"]:
+        start = max(start, parse_time(pyramid.manifest["influx_watermark"]))
+    if start >= stop:
+        print("✅ Nothing to do: the heatmap is up to date with InfluxDB.")
+        return
+
+    query = f"""
+    from(bucket: "{INFLUX_BUCKET}")
+      |> range(start: v.timeRangeStart, stop: v.timeRangeStop)
+      |> filter(fn: (r) => r["_measurement"] == "{MEASUREMENT}" and r["device_type"] == "drone")
+      |> filter(fn: (r) => r["_field"] == "lat" or r["_field"] == "lon" or r["_field"] == "alt")
+      |> keep(columns: ["_time", "_field", "_value", "serial"])
+    """
+    client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG, timeout=120_000)
+    cache = QueryCache(enabled=use_cache)
+    print(f"🔥 Binning {MEASUREMENT} {rfc3339(start)} -> {rfc3339(stop)}")
+    try:
+        t0 = time.perf_counter()
+        parts = []
+        cursor = start
+        while cursor < stop:            # One day at a time keeps memory flat
+            edge = min(cursor + timedelta(days=1), stop)
+            lat, lon = pair_fixes(cache.query(client.query_api(), query, cursor, edge), min_height)
+            parts.append(bin_points(lat, lon, pyramid.base_zoom))
+            cursor = edge
+        bins = merge_bins(parts)
+        t1 = time.perf_counter()
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                tiles = pyramid.add(*bins, pool=pool)
+        else:
+            tiles = pyramid.add(*bins)
+        pyramid.manifest["influx_watermark"] = rfc3339(stop)
+        pyramid.save_manifest()
+        print(f"   {int(bins[1].sum()):,} airborne fixes in {t1 - t0:.1f}s, "
+              f"{tiles} tile(s) updated in {time.perf_counter() - t1:.1f}s | {cache.stats()}")
+    finally:
+        client.close()
+
+
+# ---------------------------------------------------------------------------
+# SERVER
+# ---------------------------------------------------------------------------
+def serve(root, port):
+    tiles_dir = os.path.join(root, "tiles")
+    empty = os.path.join(root, "empty.png")
+    os.makedirs(tiles_dir, exist_ok=True)
+    write_png(empty, np.zeros((TILE, TILE, 4), dtype=np.uint8))
+
+    class TileHandler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=tiles_dir, **kwargs)
+
+        def send_head(self):
+            if not os.path.exists(self.translate_path(self.path)):
+                return self._empty()      # Outside the flown area: transparent, not 404
+            return super().send_head()
+
+        def _empty(self):
+            f = open(empty, "rb")
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            return f
+
+        def end_headers(self):
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Cache-Control", "max-age=300")
+            super().end_headers()
+
+        def log_message(self, fmt, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), TileHandler)
+    print(f"🗺️  Heatmap tiles on http://0.0.0.0:{port}/{{z}}/{{x}}/{{y}}.png (from {tiles_dir})")
+    return server
+
+
+# ---------------------------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------------------------
+def run_bench(args):
+    import shutil
+    import tempfile
+    import threading
+    import urllib.request
+
+    from flight_index import synthetic_flights
+
+    root = tempfile.mkdtemp(prefix="heatmap_")
+    try:
+        flights = synthetic_flights(args.flights, args.points)
+        lat = np.concatenate([f["lat"] for f in flights[:-1]])
+        lon = np.concatenate([f["lon"] for f in flights[:-1]])
+        pyramid = TilePyramid(root)
+        t0 = time.perf_counter()
+        bins = bin_points(lat, lon)
+        t1 = time.perf_counter()
+        tiles = pyramid.add(*bins)
+        t2 = time.perf_counter()
+        print(f"🧪 {lat.size:,} fixes ({len(flights) - 1} flights): binned in {t1 - t0:.2f}s "
+              f"({lat.size / (t1 - t0) / 1e6:.1f} M fixes/s), {tiles} tiles z{MIN_ZOOM}-{BASE_ZOOM} in {t2 - t1:.1f}s")
+
+        last = flights[-1]
+        t0 = time.perf_counter()
+        tiles = pyramid.add(*bin_points(last["lat"], last["lon"]))
+        print(f"   One new flight: {tiles} tiles updated in {time.perf_counter() - t0:.2f}s")
+
+        # Parent == sum of base counts over the same area
+        x, y = to_pixels(lat[:1], lon[:1], MIN_ZOOM)
+        top = pyramid.load(MIN_ZOOM, int(x[0] >> 8), int(y[0] >> 8))
+        total = int(bins[1].sum()) + last["lat"].size
+        print(f"   z{MIN_ZOOM} tile sum {int(top.sum()):,} vs {total:,} fixes "
+              f"{'✅' if int(top.sum()) == total else '❌'}")
+
+        server = serve(root, 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+        times = []
+        for z in range(MIN_ZOOM, BASE_ZOOM + 1):
+            x, y = to_pixels(last["lat"][:1], last["lon"][:1], z)
+            q0 = time.perf_counter()
+            body = urllib.request.urlopen(f"http://127.0.0.1:{port}/{z}/{x[0] >> 8}/{y[0] >> 8}.png").read()
+            times.append((time.perf_counter() - q0) * 1000)
+        print(f"   Tile fetch: median {np.median(times):.2f} ms over z{MIN_ZOOM}-{BASE_ZOOM} "
+              f"({len(body)} bytes at z{BASE_ZOOM})")
+        server.shutdown()
+        server.server_close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precomputed flight density heatmap tiles.")
+    parser.add_argument("--out", default=HEATMAP_DIR)
+    parser.add_argument("--min-height", type=float, default=AIRBORNE_HEIGHT_M,
+                        help="Ignore fixes at or below this height (pads, ground handling)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("logs", help="Bin new flight_recorder logs")
+    p.add_argument("logs", nargs="*", help=f"Default: {flight_logs.LOG_DIR}/{flight_logs.LOG_PATTERN}")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+
+    p = sub.add_parser("influx", help=f"Bin {MEASUREMENT} hours not yet in the heatmap")
+    p.add_argument("--range", dest="time_range", default="-30d")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    p.add_argument("--no-cache", action="store_true")
+
+    p = sub.add_parser("serve", help="Serve the rendered tiles")
+    p.add_argument("--port", type=int, default=PORT)
+
+    p = sub.add_parser("bench", help="Synthetic build/update/serve benchmark")
+    p.add_argument("--flights", type=int, default=1000)
+    p.add_argument("--points", type=int, default=6000)
+    args = parser.parse_args()
+
+    if args.cmd == "bench":
+        run_bench(args)
+    elif args.cmd == "logs":
+        logs = args.logs or flight_logs.list_logs()
+        if not logs:
+            print(f"❌ No flight logs found in {flight_logs.LOG_DIR}/")
+            return
+        build_from_logs(TilePyramid(args.out), logs, args.workers, args.min_height)
+    elif args.cmd == "influx":
+        build_from_influx(TilePyramid(args.out), args.time_range, args.min_height, args.workers,
+                          not args.no_cache)
+    elif args.cmd == "serve":
+        server = serve(args.out, args.port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n🛑 Stopped.")
+        finally:
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,25 @@
-import os
+import argparse
 import time
-import statistics
+import numpy as np
 from influxdb_client import InfluxDBClient
 
+import flight_events as fe
+from flux_arrays import split_fields, align_to_grid
+from query_cache import QueryCache
+from altitude_calibration import load_offset
+
 # ==============================================================================
 # Script Name: inspect_telemetry.py
 # Description: Development-grade telemetry inspector.
-#              1. Scans data volume (Last 4 Hours).
-#              2. Checks Sensor Health (RTK vs Baro).
-#              3. "Action Finder": Locates Takeoff/Landing by detecting motion.
-#              4. Calculates Geoid Offset (Truth Analysis).
-# Version:     1.4.1 (Dev Mode: Hardcoded Token)
+#              1. Scans data volume (Last 4 Hours by default).
+#              2. Streams RTK + Baro heights as CSV into NumPy arrays.
+#              3. "Action Finder": Vectorized Takeoff/Landing/Climb/Drift
+#                 detection over the whole window, every flight reported.
+#              4. Calculates Geoid Offset residuals (Truth Analysis).
+#              Closed hours are served from the local query cache.
+# Version:     2.0.0 (Vectorized analysis engine, no row limit)
 # Author:      System Architect (Gemini)
-# Date:        2025-12-15
+# Date:        2025-12-19
 # ==============================================================================
 
 # Configuration
@@ -25,138 +32,187 @@ INFLUX_TOKEN = "my-super-secret-token-change-me"
 
 # Analysis Settings
 # Look back 4 hours to find the flight session
-TIME_RANGE = "-4h"       
-# Correction factor detected in previous runs (RTK is ~3.13m higher than Baro)
-GEOID_OFFSET = 3.13      
+TIME_RANGE = "-4h"
+# Correction factor fitted per flight by altitude_calibration.py
+# (falls back to the legacy 3.13m until a flight has been calibrated)
+GEOID_OFFSET = load_offset()
+
+RTK_FIELD = "data_position_state_rtk_hgt"
+BARO_FIELD = "data_drone_list_0_height"
+STEP_S = 1.0             # Analysis grid resolution
+MAX_FILL_S = 30          # Never carry a value across a longer data gap
 
 def print_header(text):
     print(f"\n============================================================")
     print(f" {text}")
     print(f"============================================================")
 
-def inspect_bucket():
-    print_header(f"📡 TELEMETRY INSPECTOR v1.4.1 | Window: {TIME_RANGE}")
+def fmt_time(t):
+    return str(t.astype("datetime64[s]")).replace("T", " ")
+
+def fmt_duration(seconds):
+    m, s = divmod(int(seconds), 60)
+    return f"{m:d}m{s:02d}s"
+
+def build_altitude_grid(arrays):
+    """Align RTK and Baro samples on a common 1s grid (replaces Flux pivot/map)."""
+    series = split_fields(arrays, [RTK_FIELD, BARO_FIELD])
+    if BARO_FIELD not in series:
+        return None
+
+    all_times = np.concatenate([t for t, _ in series.values()])
+    step = np.timedelta64(int(STEP_S * 1e9), "ns")
+    start = all_times.min().astype("datetime64[s]").astype("datetime64[ns]")
+    n = int((all_times.max() - start) // step) + 1
+    gap = int(MAX_FILL_S / STEP_S)
+
+    baro = align_to_grid(*series[BARO_FIELD], start, STEP_S, n, gap)
+    if RTK_FIELD in series:
+        rtk = align_to_grid(*series[RTK_FIELD], start, STEP_S, n, gap)
+        # RTK height of 0.0 means "no RTK solution", not sea level
+        rtk[rtk == 0.0] = np.nan
+    else:
+        rtk = np.full(n, np.nan)
+
+    times = start + np.arange(n) * step
+    error = (rtk - GEOID_OFFSET) - baro
+    return times, rtk, baro, error
+
+def report_flights(times, rtk, baro, error):
+    """Detect and print every flight and event in the window."""
+    f_start, f_end = fe.detect_flights(baro, STEP_S)
+    (c_start, c_end), (d_start, d_end) = fe.detect_vertical(baro, STEP_S)
+    x_start, x_end = fe.detect_drift(error, STEP_S)
+
+    if f_start.size == 0:
+        print("   ⚠️  No flights detected (aircraft never left the ground).")
+        return
+
+    max_alt = fe.segment_reduce(np.nan_to_num(baro, nan=-np.inf), f_start, f_end, np.fmax)
+    mean_err = fe.segment_mean(np.abs(error), f_start, f_end)
+    climbs = np.bincount(fe.assign_to_flights(c_start, f_start, f_end) + 1, minlength=f_start.size + 1)[1:]
+    descents = np.bincount(fe.assign_to_flights(d_start, f_start, f_end) + 1, minlength=f_start.size + 1)[1:]
+    drifts = np.bincount(fe.assign_to_flights(x_start, f_start, f_end) + 1, minlength=f_start.size + 1)[1:]
+
+    print(f"   Found {f_start.size} flight(s)\n")
+    print(f"   {'#':<3} | {'TAKEOFF':<19} | {'LANDING':<19} | {'DURATION':<8} | {'MAX ALT':>8} | {'CLIMB':>5} | {'DESC':>5} | {'|ERR|':>6} | {'DRIFT':>5}")
+    print("   " + "-"*105)
+    for i in range(f_start.size):
+        duration = (f_end[i] - f_start[i]) * STEP_S
+        err = f"{mean_err[i]:6.3f}" if np.isfinite(mean_err[i]) else f"{'n/a':>6}"
+        print(f"   {i + 1:<3} | {fmt_time(times[f_start[i]]):<19} | {fmt_time(times[f_end[i] - 1]):<19} | "
+              f"{fmt_duration(duration):<8} | {max_alt[i]:>8.1f} | {climbs[i]:>5} | {descents[i]:>5} | {err} | {drifts[i]:>5}")
+
+    # Full event timeline (no row limit)
+    kinds = np.concatenate([
+        np.full(f_start.size, "🛫 TAKEOFF"), np.full(f_end.size, "🛬 LANDING"),
+        np.full(c_start.size, "⬆️  CLIMB"), np.full(d_start.size, "⬇️  DESCENT"),
+        np.full(x_start.size, "⚠️ DRIFT"),
+    ])
+    at = np.concatenate([f_start, f_end - 1, c_start, d_start, x_start])
+    until = np.concatenate([f_start, f_end - 1, c_end - 1, d_end - 1, x_end - 1])
+    order = np.argsort(at, kind="stable")
+
+    print_header(f"🎬 Event Timeline ({order.size} events)")
+    print(f"   {'TIMESTAMP':<19} | {'EVENT':<12} | {'RTK (Adj)':>10} | {'BARO (m)':>10} | {'ERROR':>10} | SPAN")
+    print("   " + "-"*80)
+    rtk_adj = rtk - GEOID_OFFSET
+    for k in order:
+        i = at[k]
+        span = (until[k] - at[k]) * STEP_S
+        span_str = f"{span:.0f}s" if span > 0 else ""
+        print(f"   {fmt_time(times[i]):<19} | {kinds[k]:<12} | {rtk_adj[i]:>10.3f} | {baro[i]:>10.3f} | {error[i]:>10.3f} | {span_str}")
+
+    # Overall calibration over airborne samples only
+    marks = np.zeros(baro.size + 1, dtype=np.int64)
+    np.add.at(marks, f_start, 1)
+    np.add.at(marks, f_end, -1)
+    airborne = np.cumsum(marks[:-1]) > 0
+    valid = airborne & np.isfinite(error)
+    if valid.any():
+        mean_abs = float(np.mean(np.abs(error[valid])))
+        print("   " + "-"*80)
+        print(f"   📊 CALIBRATION STATUS: Mean Error: {mean_abs:.3f}m over {int(valid.sum())} airborne samples")
+        if mean_abs < 0.5:
+            print("   ✅ SYSTEM OPTIMIZED: Geoid Offset is perfectly calibrated.")
+            print("      Your Grafana 'Altitude Truth' panel should now look perfect.")
+        else:
+            print("   ⚠️ RESIDUAL DRIFT: Barometer might be drifting due to weather.")
+
+def inspect_bucket(time_range=TIME_RANGE, use_cache=True):
+    print_header(f"📡 TELEMETRY INSPECTOR v2.0.0 | Window: {time_range}")
 
     client = InfluxDBClient(
-        url=INFLUX_URL, 
-        token=INFLUX_TOKEN, 
-        org=INFLUX_ORG, 
+        url=INFLUX_URL,
+        token=INFLUX_TOKEN,
+        org=INFLUX_ORG,
         timeout=60_000
     )
     query_api = client.query_api()
+    cache = QueryCache(enabled=use_cache)
 
     try:
         # ---------------------------------------------------------
         # PART 1: General Volume Scan
         # ---------------------------------------------------------
         print("🔍 Step 1: Scanning Data Volume...")
-        
-        # We count fields to verify data exists
+
+        # We count fields per cached block to verify data exists
         stats_query = f"""
         from(bucket: "{INFLUX_BUCKET}")
-          |> range(start: {TIME_RANGE})
+          |> range(start: v.timeRangeStart, stop: v.timeRangeStop)
           |> filter(fn: (r) => r["_measurement"] == "mqtt_consumer")
           |> count()
           |> group(columns: ["_field"])
           |> sum()
+          |> keep(columns: ["_field", "_value"])
         """
-        
-        result = query_api.query(stats_query)
-        field_counts = {}
-        
-        for table in result:
-            for record in table:
-                field = record.get_field()
-                count = record.get_value()
-                if field and count:
-                    field_counts[field] = count
-
-        if not field_counts:
-            print(f"   ⚠️  No data found in the last {TIME_RANGE}.")
+
+        counts = cache.query(query_api, stats_query, time_range)
+        if counts.get("_field", np.empty(0)).size:
+            names, inverse = np.unique(counts["_field"], return_inverse=True)
+            totals = np.bincount(inverse, weights=np.nan_to_num(counts["_value"]))
+            active = int(np.count_nonzero(totals > 0))
+        else:
+            active = 0
+
+        if not active:
+            print(f"   ⚠️  No data found in the last {time_range}.")
             return
 
-        print(f"   ✅ Data Found! Total Active Fields: {len(field_counts)}")
+        print(f"   ✅ Data Found! Total Active Fields: {active}")
 
         # ---------------------------------------------------------
         # PART 2: Find the "Action" (Dynamic Movement)
         # ---------------------------------------------------------
-        print_header("🎬 Step 2: Locating High-Motion Segment (Takeoff/Landing)")
-        print(f"   Applying Geoid Offset of -{GEOID_OFFSET}m to RTK data...")
-
-        # Dynamic query that:
-        # 1. Resamples to 1s
-        # 2. Applies the offset math
-        # 3. Sorts by time to show the flight sequence
-        accuracy_query = f"""
+        print_header("🎬 Step 2: Locating Flights (Takeoff/Landing/Climb/Drift)")
+        print(f"   Applying Geoid Offset of -{GEOID_OFFSET:.3f}m to RTK data...")
+
+        # Only the 1s downsample runs in InfluxDB; gap filling, alignment and
+        # the offset math happen in NumPy over the whole window.
+        heights_query = f"""
         from(bucket: "{INFLUX_BUCKET}")
-          |> range(start: {TIME_RANGE})
+          |> range(start: v.timeRangeStart, stop: v.timeRangeStop)
           |> filter(fn: (r) => r["_measurement"] == "mqtt_consumer")
-          |> filter(fn: (r) => r["_field"] == "data_position_state_rtk_hgt" or r["_field"] == "data_drone_list_0_height")
-          // 1. Resample to 1s resolution
-          |> aggregateWindow(every: 1s, fn: mean, createEmpty: true)
-          // 2. Fill gaps
-          |> fill(usePrevious: true)
-          // 3. Ungroup to merge streams
-          |> group() 
-          // 4. Pivot to get columns side-by-side
-          |> pivot(rowKey:["_time"], columnKey:["_field"], valueColumn:"_value")
-          |> map(fn: (r) => ({{
-              _time: r._time,
-              rtk: r["data_position_state_rtk_hgt"],
-              baro: r["data_drone_list_0_height"],
-              // Apply Calibration: (RTK - Offset) - Baro
-              error: (r["data_position_state_rtk_hgt"] - {GEOID_OFFSET}) - r["data_drone_list_0_height"]
-          }}))
-          // 5. Validity Filter
-          |> filter(fn: (r) => exists r.rtk and exists r.baro)
-          // 6. Sort Oldest -> Newest to replay the flight
-          |> sort(columns: ["_time"], desc: false)
+          |> filter(fn: (r) => r["_field"] == "{RTK_FIELD}" or r["_field"] == "{BARO_FIELD}")
+          |> aggregateWindow(every: 1s, fn: mean, createEmpty: false)
+          |> keep(columns: ["_time", "_field", "_value"])
         """
 
-        accuracy_tables = query_api.query(accuracy_query)
-        
-        print(f"\n   {'TIMESTAMP':<25} | {'RTK (Adj)':<10} | {'BARO (m)':<10} | {'ERROR':<10}")
-        print("   " + "-"*65)
-
-        errors = []
-        rows_printed = 0
-        last_alt = -999
-
-        for table in accuracy_tables:
-            for record in table:
-                t_str = record["_time"].strftime("%H:%M:%S")
-                # Apply offset visually for the table
-                rtk = record["rtk"] - GEOID_OFFSET if record["rtk"] else 0
-                baro = record["baro"] if record["baro"] else 0
-                err = record["error"] if record["error"] else 0
-                
-                # MOTION FILTER: Only print if altitude changed by > 0.5m since last print
-                # This effectively finds "Takeoff" and "Landing" events
-                if abs(rtk - last_alt) > 0.5 or rows_printed < 5:
-                    errors.append(abs(err))
-                    
-                    marker = ""
-                    if abs(err) > 1.0: marker = "⚠️ DRIFT"
-
-                    print(f"   {t_str:<25} | {rtk:>10.3f} | {baro:>10.3f} | {err:>10.3f} {marker}")
-                    
-                    last_alt = rtk
-                    rows_printed += 1
-                
-                # Limit output to first 25 significant events to keep terminal clean
-                if rows_printed > 25:
-                    break
-
-        if errors:
-            mean_err = statistics.mean(errors)
-            print("   " + "-"*65)
-            print(f"   📊 CALIBRATION STATUS: Mean Error: {mean_err:.3f}m")
-            
-            if mean_err < 0.5:
-                print("   ✅ SYSTEM OPTIMIZED: Geoid Offset is perfectly calibrated.")
-                print("      Your Grafana 'Altitude Truth' panel should now look perfect.")
-            else:
-                print("   ⚠️ RESIDUAL DRIFT: Barometer might be drifting due to weather.")
+        t0 = time.perf_counter()
+        arrays = cache.query(query_api, heights_query, time_range)
+        fetched = time.perf_counter() - t0
+        grid = build_altitude_grid(arrays)
+        if grid is None:
+            print(f"   ⚠️  No '{BARO_FIELD}' samples in the last {time_range}.")
+            return
+
+        print(f"   Loaded {arrays['_value'].size:,} samples in {fetched:.2f}s\n")
+        t0 = time.perf_counter()
+        report_flights(*grid)
+        print(f"\n   ⏱️  Analysis took {time.perf_counter() - t0:.3f}s")
+        if use_cache:
+            print(f"   💾 Query cache: {cache.stats()}")
 
     except Exception as e:
         print(f"\n❌ CRITICAL ERROR: {e}")
@@ -164,4 +220,9 @@ def inspect_bucket():
         client.close()
 
 if __name__ == "__main__":
-    inspect_bucket()
+    parser = argparse.ArgumentParser(description="Inspect flights stored in InfluxDB.")
+    parser.add_argument("--range", dest="time_range", default=TIME_RANGE,
+                        help="Flux range start, e.g. -24h or 2025-12-15T00:00:00Z")
+    parser.add_argument("--no-cache", action="store_true", help="Always query InfluxDB directly")
+    args = parser.parse_args()
+    inspect_bucket(args.time_range, use_cache=not args.no_cache)
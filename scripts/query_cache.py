@@ -0,0 +1,294 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: query_cache.py
+Description: Local on-disk cache for InfluxDB analysis queries.
+             Queries are written Grafana-style with v.timeRangeStart /
+             v.timeRangeStop. The requested window is split into aligned
+             blocks; each block is keyed by the normalized Flux text plus its
+             absolute bounds and stored as a compact columnar .npz file.
+             Blocks that ended before the "settle" horizon are immutable and
+             never re-queried; only the open tail goes back to InfluxDB.
+             Total size is capped with LRU eviction.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from flux_arrays import query_arrays
+
+# CONFIGURATION
+CACHE_DIR = os.getenv("FLUX_CACHE_DIR", ".flux_cache")
+MAX_BYTES = int(os.getenv("FLUX_CACHE_MAX_MB", 512)) * 1024 * 1024
+BLOCK = timedelta(hours=1)        # Cache granularity (aligned to the epoch)
+SETTLE = timedelta(minutes=5)     # Telegraf/late-packet grace before a block is "closed"
+INDEX_FILE = "index.json"
+
+_DURATION_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+_FLUX_TOKENS = re.compile(r'"(?:\\.|[^"\\])*"|//[^\n]*|\s+')
+
+
+def normalize_flux(flux):
+    """Strip comments and collapse whitespace outside string literals."""
+    def _sub(m):
+        token = m.group(0)
+        if token.startswith('"'):
+            return token
+        return "" if token.startswith("//") else " "
+    return _FLUX_TOKENS.sub(_sub, flux).strip()
+
+
+def parse_time(value, now=None):
+    """Accept datetimes, RFC3339 strings or Flux-style relative durations ('-4h')."""
+    now = now or datetime.now(timezone.utc)
+    if value is None or value == "now()":
+        return now
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    m = re.fullmatch(r"-(\d+)([smhdw])", str(value).strip())
+    if m:
+        return now - timedelta(**{_DURATION_UNITS[m.group(2)]: int(m.group(1))})
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+def rfc3339(dt):
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def floor_time(dt, block=BLOCK):
+    """Round a datetime down to the previous block boundary."""
+    return _EPOCH + ((dt - _EPOCH) // block) * block
+
+
+def split_blocks(start, stop, block=BLOCK):
+    """Split [start, stop) into epoch-aligned blocks (first/last may be partial)."""
+    blocks = []
+    cursor = start
+    while cursor < stop:
+        edge = min(floor_time(cursor, block) + block, stop)
+        blocks.append((cursor, edge))
+        cursor = edge
+    return blocks
+
+
+# ---------------------------------------------------------------------------
+# COLUMNAR STORAGE
+# ---------------------------------------------------------------------------
+def save_arrays(path, arrays):
+    """
+    Write {column: ndarray} as a compressed .npz. String columns are stored
+    dictionary-encoded (codes + categories): tags repeat on every row.
+    """
+    payload = {}
+    names = []
+    for i, (name, arr) in enumerate(arrays.items()):
+        names.append(name)
+        if arr.dtype.kind == "U":
+            cats, codes = np.unique(arr, return_inverse=True)
+            payload[f"{i}_cat"] = cats
+            payload[f"{i}_codes"] = codes.astype(np.int32 if cats.size > 32767 else np.int16)
+        else:
+            payload[str(i)] = arr
+    payload["__columns__"] = np.asarray(names, dtype=str)
+    tmp = f"{path}.tmp.npz"
+    np.savez_compressed(tmp, **payload)
+    os.replace(tmp, path)
+
+
+def load_arrays(path):
+    arrays = {}
+    with np.load(path, allow_pickle=False) as data:
+        for i, name in enumerate(data["__columns__"]):
+            if f"{i}_cat" in data.files:
+                arrays[str(name)] = data[f"{i}_cat"][data[f"{i}_codes"]]
+            else:
+                arrays[str(name)] = data[str(i)]
+    return arrays
+
+
+def concat_arrays(parts):
+    """Concatenate block results; columns missing from a block are padded."""
+    parts = [p for p in parts if p and any(a.size for a in p.values())]
+    if not parts:
+        return {}
+    if len(parts) == 1:
+        return parts[0]
+    names = list(dict.fromkeys(name for p in parts for name in p))
+    out = {}
+    for name in names:
+        template = next(p[name] for p in parts if name in p)
+        chunks = []
+        for p in parts:
+            if name in p:
+                chunks.append(p[name])
+                continue
+            n = len(next(iter(p.values())))
+            if template.dtype.kind == "M":
+                chunks.append(np.full(n, np.datetime64("NaT"), dtype=template.dtype))
+            elif template.dtype.kind == "f":
+                chunks.append(np.full(n, np.nan))
+            else:
+                chunks.append(np.full(n, "", dtype=str))
+        out[name] = np.concatenate(chunks)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# CACHE
+# ---------------------------------------------------------------------------
+class QueryCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, block=BLOCK,
+                 settle=SETTLE, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.block = block
+        self.settle = settle
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = {}
+        if enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._index = self._load_index()
+
+    # --- Index ------------------------------------------------------------
+    def _index_path(self):
+        return os.path.join(self.cache_dir, INDEX_FILE)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path()) as f:
+                index = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        # Drop entries whose data file vanished
+        return {k: v for k, v in index.items() if os.path.exists(self._entry_path(k))}
+
+    def _save_index(self):
+        tmp = self._index_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self._index_path())
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _evict(self):
+        total = sum(e["bytes"] for e in self._index.values())
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(self._index.items(), key=lambda kv: kv[1]["last_used"]):
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+            total -= entry["bytes"]
+            del self._index[key]
+            if total <= self.max_bytes:
+                break
+
+    # --- Lookup -----------------------------------------------------------
+    @staticmethod
+    def make_key(flux, start, stop):
+        text = f"{normalize_flux(flux)}\n{rfc3339(start)}\n{rfc3339(stop)}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            entry["last_used"] = time.time()
+        try:
+            return load_arrays(self._entry_path(key))
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self._index.pop(key, None)
+            return None
+
+    def _put(self, key, arrays, start, stop):
+        path = self._entry_path(key)
+        save_arrays(path, arrays)
+        with self._lock:
+            self._index[key] = {
+                "bytes": os.path.getsize(path),
+                "last_used": time.time(),
+                "start": rfc3339(start),
+                "stop": rfc3339(stop),
+            }
+            self._evict()
+            self._save_index()
+
+    def flush(self):
+        """Persist LRU timestamps updated by cache hits."""
+        if self.enabled:
+            with self._lock:
+                self._save_index()
+
+    # --- Query ------------------------------------------------------------
+    def query(self, query_api, flux, start, stop=None, split=True, block=None):
+        """
+        Run a v.timeRangeStart/v.timeRangeStop templated Flux query over
+        [start, stop) and return {column: ndarray}.
+        With split=True the window is cut into epoch-aligned blocks (default
+        self.block): closed blocks come from the cache, the open tail up to
+        'stop' always goes to InfluxDB. A partial first block is fetched and
+        cached as the whole aligned block, then trimmed back to 'start' on
+        _time; results without a _time column query the partial block as is.
+        With split=False the window is one entry, cached only if closed.
+        """
+        now = datetime.now(timezone.utc)
+        start, stop = parse_time(start, now), parse_time(stop, now)
+        block = block or self.block
+        blocks = split_blocks(start, stop, block) if split else [(start, stop)]
+
+        parts = []
+        for b_start, b_stop in blocks:
+            aligned = floor_time(b_start, block)
+            if split and aligned < b_start:
+                arrays = self._block(query_api, flux, aligned, b_stop, now)
+                if "_time" in arrays:
+                    keep = arrays["_time"] >= np.datetime64(b_start.astimezone(timezone.utc).replace(tzinfo=None), "ns")
+                    parts.append({name: col[keep] for name, col in arrays.items()})
+                    continue
+            parts.append(self._block(query_api, flux, b_start, b_stop, now))
+
+        self.flush()
+        return concat_arrays(parts)
+
+    def _block(self, query_api, flux, b_start, b_stop, now):
+        text = (flux.replace("v.timeRangeStart", rfc3339(b_start))
+                    .replace("v.timeRangeStop", rfc3339(b_stop)))
+        closed = b_stop <= now - self.settle
+        key = self.make_key(flux, b_start, b_stop) if (self.enabled and closed) else None
+
+        cached = self._get(key) if key else None
+        with self._lock:
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if cached is not None:
+            return cached
+        arrays = query_arrays(query_api, text)
+        if key:
+            self._put(key, arrays, b_start, b_stop)
+        return arrays
+
+    def stats(self):
+        total = sum(e["bytes"] for e in self._index.values())
+        return f"{self.hits} hit(s), {self.misses} miss(es), {len(self._index)} entries, {total / 1e6:.1f} MB"
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+-----------------------------------------------------------------------------
+Script: schema_profiler.py
+Version: v1.0.0 (The Field Profiler)
+Author: RW
+Date: 2025-12-19
+Description:
+    Streaming, fixed-memory profile of every JSON path in the Autel stream.
+    Where capture_mqtt_schema.py keeps only the latest value of each key,
+    this keeps mergeable sketches per path:
+      * observed JSON types, null rate, zero rate, min/max
+      * approximate quantiles (DDSketch-style log buckets, ~1% rel. error)
+      * approximate distinct count (HyperLogLog, 1024 registers)
+      * update frequency and change rate (how often the value moves)
+
+    Paths use Telegraf's flattened names (data_battery_capacity_percent), so
+    the report's "allowlist" and "string_fields" plug straight into
+    config/telegraf.conf.
+
+    Live:     python schema_profiler.py --live --duration 120
+    Archive:  python schema_profiler.py flight_logs/*.jsonl --workers 8
+
+    Output: docs/autel_field_profile.json
+-----------------------------------------------------------------------------
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import flight_logs
+
+# ---------------------------------------------------------------------------
+# CONFIGURATION
+# ---------------------------------------------------------------------------
+BROKER = "localhost"
+PORT = 1883
+TOPICS = [
+    ("thing/product/+/osd", 0),
+    ("thing/product/+/static", 1),     # Slim OSD is merged back with it (static_dedup)
+    ("thing/product/+/events", 0)
+]
+DURATION = 60
+OUTPUT_PATH = "docs/autel_field_profile.json"
+
+HLL_PRECISION = 10            # 2^10 registers -> ~3% standard error
+SKETCH_ALPHA = 0.01           # Relative accuracy of quantiles
+SKETCH_MAX_BUCKETS = 512      # Per sign; lowest buckets collapse beyond this
+STATIC_CHANGE_RATE = 0.001    # Below this a path is reported as static
+ENUM_MAX_DISTINCT = 16        # Integer paths with few values are enums
+QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+
+
+# ---------------------------------------------------------------------------
+# SKETCHES
+# ---------------------------------------------------------------------------
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(repr(value).encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """Fixed-size distinct counter; merge = register-wise max."""
+    __slots__ = ("p", "m", "registers")
+
+    def __init__(self, p=HLL_PRECISION):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, h):
+        idx = h >> (64 - self.p)
+        rest = (h << self.p) & 0xFFFFFFFFFFFFFFFF
+        rank = (64 - self.p + 1) if rest == 0 else (64 - rest.bit_length() + 1)
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def estimate(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * self.m and zeros:
+            return self.m * math.log(self.m / zeros)   # Linear counting for small sets
+        return raw
+
+
+class QuantileSketch:
+    """
+    DDSketch-style quantile sketch: values land in logarithmic buckets with
+    relative width alpha. Memory is bounded by collapsing the lowest buckets.
+    """
+    __slots__ = ("gamma_log", "pos", "neg", "zeros", "count")
+
+    def __init__(self, alpha=SKETCH_ALPHA):
+        self.gamma_log = math.log((1 + alpha) / (1 - alpha))
+        self.pos = {}
+        self.neg = {}
+        self.zeros = 0
+        self.count = 0
+
+    def _key(self, v):
+        return math.ceil(math.log(v) / self.gamma_log)
+
+    def add(self, v):
+        self.count += 1
+        if v > 0:
+            k = self._key(v)
+            self.pos[k] = self.pos.get(k, 0) + 1
+            if len(self.pos) > SKETCH_MAX_BUCKETS:
+                self._collapse(self.pos)
+        elif v < 0:
+            k = self._key(-v)
+            self.neg[k] = self.neg.get(k, 0) + 1
+            if len(self.neg) > SKETCH_MAX_BUCKETS:
+                self._collapse(self.neg)
+        else:
+            self.zeros += 1
+
+    @staticmethod
+    def _collapse(store):
+        keys = sorted(store)
+        lowest, second = keys[0], keys[1]
+        store[second] += store.pop(lowest)
+
+    def merge(self, other):
+        for mine, theirs in ((self.pos, other.pos), (self.neg, other.neg)):
+            for k, c in theirs.items():
+                mine[k] = mine.get(k, 0) + c
+            while len(mine) > SKETCH_MAX_BUCKETS:
+                self._collapse(mine)
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def _value(self, k):
+        return 2 * math.exp(k * self.gamma_log) / (1 + math.exp(self.gamma_log))
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for k in sorted(self.neg, reverse=True):
+            seen += self.neg[k]
+            if seen > rank:
+                return -self._value(k)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.pos):
+            seen += self.pos[k]
+            if seen > rank:
+                return self._value(k)
+        return self._value(max(self.pos)) if self.pos else 0.0
+
+
+class PathStats:
+    __slots__ = ("count", "types", "nulls", "zeros", "nonfinite", "min", "max", "sketch", "distinct",
+                 "changes", "last_hash", "first_ts", "last_ts")
+
+    def __init__(self):
+        self.count = 0
+        self.types = {}
+        self.nulls = 0
+        self.zeros = 0
+        self.nonfinite = 0      # NaN / ±Infinity: kept out of min/max/quantiles
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch()
+        self.distinct = HyperLogLog()
+        self.changes = 0
+        self.last_hash = None
+        self.first_ts = None
+        self.last_ts = None
+
+    def add(self, value, ts):
+        self.count += 1
+        kind = "null" if value is None else type(value).__name__
+        self.types[kind] = self.types.get(kind, 0) + 1
+        if self.first_ts is None or ts < self.first_ts:
+            self.first_ts = ts
+        if self.last_ts is None or ts > self.last_ts:
+            self.last_ts = ts
+
+        if value is None:
+            self.nulls += 1
+        elif isinstance(value, float) and not math.isfinite(value):
+            self.nonfinite += 1
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if value == 0:
+                self.zeros += 1
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+            self.sketch.add(float(value))
+
+        h = _hash64(value)
+        self.distinct.add(h)
+        if self.last_hash is not None and h != self.last_hash:
+            self.changes += 1
+        self.last_hash = h
+
+    def merge(self, other):
+        self.count += other.count
+        for k, c in other.types.items():
+            self.types[k] = self.types.get(k, 0) + c
+        self.nulls += other.nulls
+        self.zeros += other.zeros
+        self.nonfinite += other.nonfinite
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        self.sketch.merge(other.sketch)
+        self.distinct.merge(other.distinct)
+        # Change counts are per stream; the boundary between streams is not a change
+        self.changes += other.changes
+        for attr, pick in (("first_ts", min), ("last_ts", max)):
+            ours, theirs = getattr(self, attr), getattr(other, attr)
+            setattr(self, attr, theirs if ours is None else ours if theirs is None else pick(ours, theirs))
+
+
+# ---------------------------------------------------------------------------
+# PROFILE
+# ---------------------------------------------------------------------------
+def walk(obj, prefix=""):
+    """Yield (flattened path, leaf value) for every leaf, strings and nulls included."""
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            yield from walk(value, f"{prefix}_{key}" if prefix else str(key))
+    elif isinstance(obj, list):
+        for i, value in enumerate(obj):
+            yield from walk(value, f"{prefix}_{i}" if prefix else str(i))
+    else:
+        yield prefix, obj
+
+
+class Profile:
+    def __init__(self):
+        self.paths = {}
+        self.messages = 0
+        self.topics = {}
+
+    def add_message(self, topic, payload, ts_ms):
+        self.messages += 1
+        kind = topic.rsplit("/", 1)[-1]
+        self.topics[kind] = self.topics.get(kind, 0) + 1
+        ts = ts_ms / 1000.0
+        paths = self.paths
+        for path, value in walk(payload):
+            stats = paths.get(path)
+            if stats is None:
+                stats = paths[path] = PathStats()
+            stats.add(value, ts)
+
+    def merge(self, other):
+        self.messages += other.messages
+        for k, c in other.topics.items():
+            self.topics[k] = self.topics.get(k, 0) + c
+        for path, stats in other.paths.items():
+            if path in self.paths:
+                self.paths[path].merge(stats)
+            else:
+                self.paths[path] = stats
+        return self
+
+    def report(self):
+        fields = {}
+        allowlist, string_fields, static = [], [], []
+        for path in sorted(self.paths):
+            s = self.paths[path]
+            span = (s.last_ts - s.first_ts) if s.first_ts is not None else 0.0
+            distinct = round(s.distinct.estimate())
+            change_rate = s.changes / max(s.count - 1, 1)
+            non_null = s.count - s.nulls
+            numeric = s.types.get("int", 0) + s.types.get("float", 0)
+
+            if non_null == 0:
+                inferred = "null"
+            elif s.types.get("str", 0) == non_null:
+                inferred = "string"
+            elif s.types.get("bool", 0) == non_null:
+                inferred = "bool"
+            elif numeric == non_null:
+                inferred = "enum" if s.types.get("float", 0) == 0 and distinct <= ENUM_MAX_DISTINCT else \
+                    ("int" if s.types.get("float", 0) == 0 else "float")
+            else:
+                inferred = "mixed"
+
+            is_static = s.count > 1 and change_rate < STATIC_CHANGE_RATE
+            if is_static:
+                static.append(path)
+            if inferred in ("int", "float", "enum", "bool") and not is_static:
+                allowlist.append(path)
+            elif inferred in ("string", "mixed"):
+                string_fields.append(path)
+
+            fields[path] = {
+                "inferred_type": inferred,
+                "types": s.types,
+                "count": s.count,
+                "null_rate": round(s.nulls / s.count, 4),
+                "zero_rate": round(s.zeros / s.count, 4),
+                "nonfinite": s.nonfinite,
+                "min": s.min,
+                "max": s.max,
+                "quantiles": {f"p{int(q * 100)}": s.sketch.quantile(q) for q in QUANTILES} if s.sketch.count else None,
+                "distinct_approx": distinct,
+                "updates_per_s": round(s.count / span, 3) if span > 0 else None,
+                "change_rate": round(change_rate, 4),
+                "static": is_static,
+            }
+        return {
+            "messages": self.messages,
+            "topics": self.topics,
+            "paths": len(fields),
+            "allowlist": allowlist,
+            "string_fields": string_fields,
+            "static_paths": static,
+            "fields": fields,
+        }
+
+
+# ---------------------------------------------------------------------------
+# SOURCES
+# ---------------------------------------------------------------------------
+def profile_chunk(path, start, end):
+    """Worker entry point: profile one line-aligned chunk of a flight log."""
+    profile = Profile()
+    for ts_ms, topic, payload in flight_logs.iter_records(path, start, end):
+        profile.add_message(topic, payload, ts_ms)
+    return profile
+
+
+def profile_archive(logs, workers, chunk_bytes=32 * 1024 * 1024):
+    units = [(p, s, e) for p in logs for s, e in flight_logs.chunk_offsets(p, chunk_bytes)]
+    print(f"🗄️  Profiling {len(logs)} log(s) as {len(units)} chunk(s) on {workers} worker(s)...")
+    total = Profile()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(profile_chunk, *u) for u in units]
+        for i, fut in enumerate(futures, 1):
+            total.merge(fut.result())
+            sys.stdout.write(f"\r   📦 {i}/{len(units)} chunks | {total.messages:,} messages")
+            sys.stdout.flush()
+    print()
+    return total
+
+
+def profile_live(duration):
+    import paho.mqtt.client as mqtt
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+    from static_dedup import StaticCache
+
+    profile = Profile()
+    cache = StaticCache()
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            print(f"✅ Connected to MQTT Broker. Profiling for {duration} seconds...")
+            client.subscribe(TOPICS)
+        else:
+            print(f"❌ Connection Failed. Code: {rc}")
+            sys.exit(1)
+
+    def on_message(client, userdata, msg):
+        try:
+            payload = json.loads(msg.payload.decode())
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return
+        if not isinstance(payload, dict):
+            return
+        if msg.topic.endswith("/osd") or msg.topic.endswith("/static"):
+            payload = cache.on_message(msg.topic, payload)
+            if payload is None:
+                return      # Static message, or slim OSD still waiting for it
+        ts = payload.get("timestamp")
+        profile.add_message(msg.topic, payload, ts if isinstance(ts, (int, float)) else time.time() * 1000)
+        sys.stdout.write(f"\r📡 Profiled Packet #{profile.messages} | Topic: {msg.topic}")
+        sys.stdout.flush()
+
+    client = mqtt.Client("SchemaProfiler")
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(BROKER, PORT, 60)
+    client.loop_start()
+    try:
+        time.sleep(duration)
+    except KeyboardInterrupt:
+        print("\n🛑 Stopped by user.")
+    client.loop_stop()
+    print()
+    return profile
+
+
+# ---------------------------------------------------------------------------
+# MAIN EXECUTION
+# ---------------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sketch-based schema profiler for Autel telemetry.")
+    parser.add_argument("logs", nargs="*", help="Recorded flight logs (default: flight_logs/)")
+    parser.add_argument("--live", action="store_true", help="Profile the live MQTT stream instead")
+    parser.add_argument("--duration", type=int, default=DURATION)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    if args.live:
+        result = profile_live(args.duration)
+    else:
+        logs = args.logs or flight_logs.list_logs()
+        if not logs:
+            print(f"❌ No flight logs found in {flight_logs.LOG_DIR}/")
+            sys.exit(1)
+        result = profile_archive(logs, args.workers)
+
+    report = result.report()
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+
+    print(f"✅ {report['paths']} paths from {report['messages']:,} messages")
+    print(f"   allowlist: {len(report['allowlist'])} | string fields: {len(report['string_fields'])} "
+          f"| static: {len(report['static_paths'])}")
+    print(f"📄 Field profile saved to: {args.output}")
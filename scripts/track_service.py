@@ -0,0 +1,371 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: track_service.py
+Description: Simplified flight tracks for the Grafana live map route layer.
+             Serves lat/lon tracks from 'telemetry_normalized' reduced with
+             Douglas-Peucker (track_simplify) at a tolerance of TOLERANCE_PX
+             screen pixels for the requested zoom, so route layers draw a
+             few hundred points instead of every 10 Hz fix.
+
+               GET /flights?serial=SN&range=-24h
+               GET /track?serial=SN&from=<ms|RFC3339|-1h>&to=<ms|now>
+                          [&zoom=16][&max_points=500][&format=rows|geojson]
+               GET /stats
+
+             Tracks are cached per flight and zoom. A track whose 'to' is
+             within LIVE_WINDOW_S of now is the live flight: it is kept per
+             serial and only the points newer than its last fix are fetched
+             and appended to the simplified prefix on each refresh.
+             Point a JSON datasource (e.g. Infinity) at
+             /track?serial=$serial&from=${__from}&to=${__to}.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import flight_events as fe
+import track_simplify as ts
+from flux_arrays import align_to_grid, query_arrays, split_fields
+from query_cache import QueryCache, parse_time, rfc3339
+
+# Configuration
+INFLUX_URL = "http://localhost:8086"
+INFLUX_ORG = "autel_ops"
+INFLUX_BUCKET = "telemetry"
+INFLUX_TOKEN = "my-super-secret-token-change-me"
+MEASUREMENT = "telemetry_normalized"
+
+PORT = 8765
+MAX_POINTS = 500                  # Relax the tolerance until a track fits
+MAX_TRACKS = 64                   # LRU bound on cached flights
+LIVE_WINDOW_S = 10                # 'to' this close to now means "live"
+LIVE_REFRESH_S = 1.0              # Minimum interval between tail fetches
+LIVE_REBUILD_S = 3600             # Rebuild a live track whose history outgrew the request
+STEP_S = 1.0                      # Flight detection grid
+MAX_FILL_S = 30
+# Request values end up in Flux text: accept only plain serials and time forms
+SERIAL_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+STAMP_RE = re.compile(r"^(\d{1,15}|-\d+[smhdw]|now\(\)|\d{4}-\d{2}-\d{2}T[0-9:.]+(Z|[+-]\d{2}:\d{2}))$")
+
+
+def check_serial(serial):
+    """The serial, or ValueError (-> HTTP 400) if it is not a plain identifier."""
+    if not isinstance(serial, str) or not SERIAL_RE.match(serial):
+        raise ValueError(f"invalid serial {serial!r}")
+    return serial
+
+
+def parse_stamp(value, now=None):
+    """Grafana ${__from} (epoch ms), RFC3339 or '-1h' -> aware datetime."""
+    value = (value or "").strip()
+    if value and not STAMP_RE.match(value):
+        raise ValueError(f"invalid time {value!r}")
+    if value.isdigit():
+        return datetime.fromtimestamp(int(value) / 1000.0, tz=timezone.utc)
+    return parse_time(value or None, now)
+
+
+def track_query(serial, fields=("lat", "lon")):
+    check_serial(serial)
+    field_filter = " or ".join(f'r["_field"] == "{f}"' for f in fields)
+    return f"""
+    from(bucket: "{INFLUX_BUCKET}")
+      |> range(start: v.timeRangeStart, stop: v.timeRangeStop)
+      |> filter(fn: (r) => r["_measurement"] == "{MEASUREMENT}" and r["serial"] == "{serial}")
+      |> filter(fn: (r) => {field_filter})
+      |> keep(columns: ["_time", "_field", "_value"])
+    """
+
+
+def to_track(arrays):
+    """Long-format lat/lon arrays -> (times, lat, lon) with fix-less points dropped."""
+    series = split_fields(arrays, ["lat", "lon"])
+    if "lat" not in series or "lon" not in series:
+        return np.empty(0, dtype="datetime64[ns]"), np.empty(0), np.empty(0)
+    (t_lat, lat), (t_lon, lon) = series["lat"], series["lon"]
+    # Both fields come from the same record, so the timestamps normally match 1:1
+    times, i, j = np.intersect1d(t_lat, t_lon, assume_unique=False, return_indices=True)
+    lat, lon = lat[i], lon[j]
+    ok = np.isfinite(lat) & np.isfinite(lon) & ((lat != 0.0) | (lon != 0.0))
+    return times[ok], lat[ok], lon[ok]
+
+
+class _Track:
+    """Raw fixes of one flight plus its simplified vertex indices per zoom."""
+
+    def __init__(self, serial, start, stop):
+        self.serial = serial
+        self.start = start
+        self.stop = stop                # None = live
+        self.times = np.empty(0, dtype="datetime64[ns]")
+        self.lat = np.empty(0)
+        self.lon = np.empty(0)
+        self.views = {}                 # zoom key -> IncrementalSimplifier | ndarray
+        self.fetched = 0.0
+        self.lock = threading.Lock()
+
+    def append(self, times, lat, lon):
+        if times.size and self.times.size:
+            keep = times > self.times[-1]
+            times, lat, lon = times[keep], lat[keep], lon[keep]
+        if not times.size:
+            return
+        self.times = np.concatenate([self.times, times])
+        self.lat = np.concatenate([self.lat, lat])
+        self.lon = np.concatenate([self.lon, lon])
+        for view in self.views.values():
+            if isinstance(view, ts.IncrementalSimplifier):
+                view.extend(lat, lon)
+
+
+class TrackStore:
+    def __init__(self, query_api, cache, max_tracks=MAX_TRACKS, max_points=MAX_POINTS):
+        self.query_api = query_api
+        self.cache = cache
+        self.max_tracks = max_tracks
+        self.max_points = max_points
+        self.tracks = OrderedDict()     # key -> _Track
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+        self.tail_fetches = 0
+
+    # --- Loading ----------------------------------------------------------
+    def _load(self, track):
+        arrays = self.cache.query(self.query_api, track_query(track.serial), track.start,
+                                  track.stop)
+        times, lat, lon = to_track(arrays)
+        keep = times >= np.datetime64(track.start.replace(tzinfo=None), "ns")
+        track.append(times[keep], lat[keep], lon[keep])
+        track.fetched = time.monotonic()
+
+    def _refresh_live(self, track):
+        now = time.monotonic()
+        if now - track.fetched < LIVE_REFRESH_S:
+            return
+        track.fetched = now
+        since = track.start
+        if track.times.size:
+            last = track.times[-1].astype("datetime64[us]").item().replace(tzinfo=timezone.utc)
+            since = last + timedelta(microseconds=1)
+        flux = (track_query(track.serial)
+                .replace("v.timeRangeStart", rfc3339(since))
+                .replace("v.timeRangeStop", "now()"))
+        track.append(*to_track(query_arrays(self.query_api, flux)))
+        self.tail_fetches += 1
+
+    def _get(self, serial, start, stop, live):
+        key = (serial, None) if live else (serial, start, stop)
+        with self.lock:
+            self.requests += 1
+            track = self.tracks.get(key)
+            if track is not None and live and (
+                    start < track.start or (start - track.start).total_seconds() > LIVE_REBUILD_S):
+                track = None
+            if track is None:
+                track = self.tracks[key] = _Track(serial, start, None if live else stop)
+                while len(self.tracks) > self.max_tracks:
+                    self.tracks.popitem(last=False)
+            else:
+                self.hits += 1
+                self.tracks.move_to_end(key)
+        return track
+
+    # --- Simplification -----------------------------------------------------
+    def _view(self, track, zoom, max_points, live):
+        """Kept vertex indices for this zoom (None = fit the whole track)."""
+        key = (zoom, max_points)
+        view = track.views.get(key)
+        if view is None:
+            if not track.lat.size:
+                return np.empty(0, dtype=np.int64)
+            x, y = ts.project(track.lat, track.lon)
+            lat0 = float(track.lat[0])
+            tolerance = ts.zoom_tolerance(zoom if zoom is not None else ts.fit_zoom(x, y, lat0), lat0)
+            if live:
+                view = ts.IncrementalSimplifier(tolerance)
+                view.extend(track.lat, track.lon)
+            else:
+                view = ts.simplify(track.lat, track.lon, tolerance, max_points)
+            track.views[key] = view
+        if isinstance(view, ts.IncrementalSimplifier):
+            idx = view.indices()
+            max_points = max(max_points, ts.MIN_POINTS)
+            for _ in range(ts.MAX_RELAX_STEPS):
+                if idx.size <= max_points:
+                    break
+                # Live track outgrew the budget: rebuild one tolerance step coarser
+                view = ts.IncrementalSimplifier(view.tolerance * 1.5)
+                track.views[key] = view
+                idx = view.extend(track.lat, track.lon)
+            return idx
+        return view
+
+    def track(self, serial, start, stop, zoom=None, max_points=None):
+        """Simplified (times, lat, lon) for one serial over [start, stop)."""
+        now = datetime.now(timezone.utc)
+        live = (now - stop).total_seconds() <= LIVE_WINDOW_S
+        track = self._get(serial, start, stop, live)
+        with track.lock:
+            if not track.fetched:
+                self._load(track)
+            elif live:
+                self._refresh_live(track)
+            idx = self._view(track, zoom, max_points or self.max_points, live)
+            times, lat, lon = track.times[idx], track.lat[idx], track.lon[idx]
+            raw = track.times.size
+        if live:
+            keep = times >= np.datetime64(start.replace(tzinfo=None), "ns")
+            times, lat, lon = times[keep], lat[keep], lon[keep]
+        return times, lat, lon, raw
+
+    # --- Flights ------------------------------------------------------------
+    def flights(self, serial, time_range):
+        """Takeoff/landing windows from the 1s altitude series (flight_events)."""
+        check_serial(serial)
+        time_range = parse_stamp(time_range)
+        query = f"""
+        from(bucket: "{INFLUX_BUCKET}")
+          |> range(start: v.timeRangeStart, stop: v.timeRangeStop)
+          |> filter(fn: (r) => r["_measurement"] == "{MEASUREMENT}" and r["serial"] == "{serial}")
+          |> filter(fn: (r) => r["_field"] == "alt")
+          |> aggregateWindow(every: 1s, fn: last, createEmpty: false)
+          |> keep(columns: ["_time", "_field", "_value"])
+        """
+        series = split_fields(self.cache.query(self.query_api, query, time_range), ["alt"])
+        if "alt" not in series or not series["alt"][0].size:
+            return []
+        t, alt = series["alt"]
+        start = t[0]
+        n = int((t[-1] - start) / np.timedelta64(1, "s")) + 1
+        height = align_to_grid(t, alt, start, STEP_S, n, int(MAX_FILL_S / STEP_S))
+        f_start, f_end = fe.detect_flights(height, STEP_S)
+        out = []
+        for a, b in zip(f_start, f_end):
+            t0 = start + np.timedelta64(int(a * STEP_S), "s")
+            t1 = start + np.timedelta64(int(b * STEP_S), "s")
+            ms0 = int(t0.astype("datetime64[ms]").astype(np.int64))
+            ms1 = int(t1.astype("datetime64[ms]").astype(np.int64))
+            out.append({"id": f"{serial}@{ms0}", "serial": serial, "from": ms0, "to": ms1,
+                        "duration_s": int((b - a) * STEP_S)})
+        return out
+
+    def stats(self):
+        with self.lock:
+            points = sum(t.times.size for t in self.tracks.values())
+            return {"tracks": len(self.tracks), "raw_points": int(points), "requests": self.requests,
+                    "hits": self.hits, "tail_fetches": self.tail_fetches}
+
+
+# ---------------------------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------------------------
+def track_rows(times, lat, lon):
+    ms = times.astype("datetime64[ms]").astype(np.int64)
+    return [{"time": int(t), "lat": float(a), "lon": float(o)} for t, a, o in zip(ms, lat, lon)]
+
+
+def track_geojson(serial, times, lat, lon):
+    return {"type": "Feature",
+            "properties": {"serial": serial, "points": int(times.size)},
+            "geometry": {"type": "LineString",
+                         "coordinates": np.column_stack([lon, lat]).tolist()}}
+
+
+class TrackHandler(BaseHTTPRequestHandler):
+    store = None
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path == "/track":
+                self._track(q)
+            elif url.path == "/flights":
+                if "serial" not in q:
+                    raise ValueError("serial is required")
+                self._send(200, self.store.flights(check_serial(q["serial"]), q.get("range", "-24h")))
+            elif url.path == "/stats":
+                self._send(200, self.store.stats())
+            else:
+                self._send(404, {"error": f"unknown path {url.path}"})
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+
+    def _track(self, q):
+        if "serial" not in q:
+            raise ValueError("serial is required")
+        check_serial(q["serial"])
+        now = datetime.now(timezone.utc)
+        start = parse_stamp(q.get("from", "-1h"), now)
+        stop = parse_stamp(q.get("to", ""), now)
+        zoom = int(q["zoom"]) if q.get("zoom") else None
+        max_points = int(q["max_points"]) if q.get("max_points") else None
+        if max_points is not None and max_points < ts.MIN_POINTS:
+            raise ValueError(f"max_points must be >= {ts.MIN_POINTS}")
+
+        t0 = time.perf_counter()
+        times, lat, lon, raw = self.store.track(q["serial"], start, stop, zoom, max_points)
+        headers = {"X-Track-Points": f"{times.size}/{raw}",
+                   "X-Track-Time-Ms": f"{(time.perf_counter() - t0) * 1000:.1f}"}
+        if q.get("format") == "geojson":
+            self._send(200, track_geojson(q["serial"], times, lat, lon), headers)
+        else:
+            self._send(200, track_rows(times, lat, lon), headers)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def main():
+    from influxdb_client import InfluxDBClient
+
+    parser = argparse.ArgumentParser(description="Simplified flight tracks for Grafana map panels.")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-points", type=int, default=MAX_POINTS)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG, timeout=60_000)
+    TrackHandler.store = TrackStore(client.query_api(), QueryCache(enabled=not args.no_cache),
+                                    max_points=args.max_points)
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), TrackHandler)
+    print(f"🗺️  TRACK SERVICE | http://0.0.0.0:{args.port}/track?serial=SN&from=-1h | "
+          f"max {args.max_points} points")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Stopped.")
+    finally:
+        server.server_close()
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
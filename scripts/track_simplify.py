@@ -0,0 +1,145 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: track_simplify.py
+Description: Track simplification for map rendering.
+             Douglas-Peucker on local ENU metres (track_kinematics), with
+             every split evaluated as one vectorized point-to-segment
+             distance pass, so a 36k-point flight reduces in milliseconds.
+             IncrementalSimplifier keeps a frozen simplified prefix for a
+             live flight and only re-simplifies the tail after the last
+             stable vertex as points arrive. zoom_tolerance() turns a web
+             map zoom level into a tolerance in metres.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import math
+
+import numpy as np
+
+import track_kinematics as tk
+
+TOLERANCE_PX = 1.5              # Deviation allowed on screen
+METERS_PER_PX_Z0 = 156543.03392  # Web Mercator ground resolution at zoom 0 (equator)
+MAX_ZOOM = 22
+MIN_POINTS = 2                  # Douglas-Peucker always keeps both endpoints
+MAX_RELAX_STEPS = 64            # 1.5**64 ~ 2e11: coarser than any real track
+
+
+def zoom_tolerance(zoom, lat, px=TOLERANCE_PX):
+    """Metres one screen pixel spans at this zoom and latitude, times px."""
+    zoom = min(max(int(zoom), 0), MAX_ZOOM)
+    return px * METERS_PER_PX_Z0 * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def fit_zoom(x, y, lat, map_px=1000):
+    """Largest zoom at which the track extent fits in map_px pixels."""
+    extent = max(float(np.ptp(x)) if x.size else 0.0, float(np.ptp(y)) if y.size else 0.0, 1.0)
+    mpp = extent / map_px
+    zoom = math.log2(METERS_PER_PX_Z0 * math.cos(math.radians(lat)) / mpp)
+    return min(max(int(zoom), 0), MAX_ZOOM)
+
+
+def project(lat, lon, origin=None):
+    """lat/lon (deg) -> local east/north metres around origin (default: first point)."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if origin is None:
+        origin = (lat[0], lon[0]) if lat.size else (0.0, 0.0)
+    east, north, _ = tk.geodetic_to_enu(lat, lon, 0.0, origin[0], origin[1], 0.0)
+    return east, north
+
+
+def _segment_distance(x, y, i, j):
+    """Distance of points i+1..j-1 to the segment (i, j)."""
+    px, py = x[i + 1:j], y[i + 1:j]
+    ax, ay = x[i], y[i]
+    dx, dy = x[j] - ax, y[j] - ay
+    length2 = dx * dx + dy * dy
+    if length2 == 0.0:
+        return np.hypot(px - ax, py - ay)
+    t = np.clip(((px - ax) * dx + (py - ay) * dy) / length2, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def douglas_peucker(x, y, tolerance, start=0, end=None):
+    """Sorted indices of the vertices kept between start and end (inclusive)."""
+    n = len(x)
+    end = n - 1 if end is None else end
+    if end - start < 2:
+        return np.arange(start, end + 1)
+    keep = np.zeros(end - start + 1, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(start, end)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        d = _segment_distance(x, y, i, j)
+        k = int(np.argmax(d))
+        if d[k] > tolerance:
+            k += i + 1
+            keep[k - start] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return np.flatnonzero(keep) + start
+
+
+def simplify(lat, lon, tolerance, max_points=None):
+    """
+    Simplify a lat/lon track; returns kept indices. With max_points the
+    tolerance is relaxed (x1.5 per step, at most MAX_RELAX_STEPS) until the
+    result fits; max_points below MIN_POINTS is treated as MIN_POINTS.
+    """
+    x, y = project(lat, lon)
+    idx = douglas_peucker(x, y, tolerance)
+    if not max_points:
+        return idx
+    max_points = max(int(max_points), MIN_POINTS)
+    for _ in range(MAX_RELAX_STEPS):
+        if idx.size <= max_points:
+            break
+        tolerance *= 1.5
+        idx = douglas_peucker(x, y, tolerance)
+    return idx
+
+
+class IncrementalSimplifier:
+    """
+    Simplification of a growing track. Vertices before the anchor are final;
+    extend() re-runs Douglas-Peucker only from the anchor to the newest point
+    and moves the anchor to the last vertex that cannot change any more.
+    """
+
+    def __init__(self, tolerance, origin=None):
+        self.tolerance = tolerance
+        self.origin = origin
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.frozen = []            # Final vertex indices (before anchor)
+        self.tail = np.empty(0, dtype=np.int64)
+        self.anchor = 0
+
+    def extend(self, lat, lon):
+        """Append new points; returns the current kept indices."""
+        lat = np.asarray(lat, dtype=np.float64)
+        if lat.size == 0:
+            return self.indices()
+        if self.origin is None:
+            self.origin = (float(lat[0]), float(np.asarray(lon)[0]))
+        x, y = project(lat, lon, self.origin)
+        self.x = np.concatenate([self.x, x])
+        self.y = np.concatenate([self.y, y])
+        tail = douglas_peucker(self.x, self.y, self.tolerance, self.anchor)
+        if tail.size > 2:
+            # Everything up to the second-to-last vertex is settled
+            self.frozen.extend(tail[:-2].tolist())
+            self.anchor = int(tail[-2])
+            tail = tail[-2:]
+        self.tail = tail
+        return self.indices()
+
+    def indices(self):
+        return np.concatenate([np.asarray(self.frozen, dtype=np.int64), self.tail])
@@ -0,0 +1,361 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: alerts.py
+Description: Rule-based alert engine on the normalized record stream.
+             Each rule is a small expression over normalized fields
+             ("batt < 25", "alt > height_limit", ...). Expressions are parsed
+             once, checked against a whitelist of AST nodes and compiled into
+             plain Python functions, so evaluating a packet costs one call
+             per rule and nothing else: fixed CPU per packet, no Grafana /
+             InfluxDB polling in the loop.
+
+             Per (aircraft, rule):
+               for_s        condition must hold this long before the alert fires
+               clear        optional hysteresis expression (default: not when)
+               clear_for_s  clear must hold this long before the alert clears
+               after        rule is armed only once this has been true
+                            (RTK FIX -> NONE fires only after a FIX)
+             Rules with silent_s fire when an aircraft has sent nothing for
+             that long (loss of signal) and clear on its next record; they are
+             checked by tick() instead of per packet.
+
+             Rules load from ALERT_RULES_FILE (JSON list) or DEFAULT_RULES.
+             Missing fields read as NaN, so a rule never fires on data the
+             aircraft does not report.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import argparse
+import ast
+import json
+import logging
+import math
+import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+ALERT_RULES_FILE = os.getenv("ALERT_RULES_FILE", "")
+ALERT_TOPIC_ROOT = "alerts"     # alerts/{serial}/{rule}, retained
+
+DEFAULT_RULES = [
+    {"name": "low_battery", "when": "batt < 25", "clear": "batt >= 30",
+     "for_s": 2, "severity": "warning", "message": "Battery {batt:.0f}%"},
+    {"name": "critical_battery", "when": "batt < 15", "clear": "batt >= 20",
+     "for_s": 1, "severity": "critical", "message": "Battery {batt:.0f}%"},
+    {"name": "rtk_lost", "when": "rtk_status == 'NONE'", "clear": "rtk_status == 'FIX'",
+     "after": "rtk_status == 'FIX'", "for_s": 1, "clear_for_s": 2,
+     "severity": "warning", "message": "RTK FIX lost"},
+    {"name": "low_satellites", "when": "airborne == 1 and sat_count < 8", "clear": "sat_count >= 10",
+     "for_s": 3, "clear_for_s": 3, "severity": "warning", "message": "{sat_count} satellites"},
+    {"name": "height_limit", "when": "height_limit > 0 and alt > height_limit", "clear": "alt < height_limit - 5",
+     "for_s": 0.5, "severity": "critical", "message": "Height {alt:.1f} m above limit {height_limit:.0f} m"},
+    {"name": "no_fly", "when": "no_fly > 0", "clear": "no_fly == 0", "clear_for_s": 2,
+     "severity": "critical", "message": "Inside {no_fly} no-fly zone(s)"},
+    {"name": "signal_lost", "silent_s": 3, "severity": "critical", "message": "No telemetry for {silent_s:.1f} s"},
+]
+
+_NAN = float("nan")
+_FUNCTIONS = {"abs": abs, "min": min, "max": max}
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn,
+    ast.Name, ast.Load, ast.Constant, ast.Call, ast.Tuple, ast.List,
+)
+
+
+class _FieldLookup(ast.NodeTransformer):
+    """Rewrites every field name `x` into `_r.get('x', nan)`."""
+
+    def __init__(self):
+        self.fields = set()
+
+    def visit_Call(self, node):
+        node.args = [self.visit(a) for a in node.args]
+        return node
+
+    def visit_Name(self, node):
+        if node.id in ("True", "False", "None"):
+            return node
+        self.fields.add(node.id)
+        call = ast.Call(func=ast.Attribute(value=ast.Name(id="_r", ctx=ast.Load()), attr="get", ctx=ast.Load()),
+                        args=[ast.Constant(node.id), ast.Name(id="_nan", ctx=ast.Load())], keywords=[])
+        return ast.copy_location(call, node)
+
+
+def compile_expression(expr, name="rule"):
+    """
+    Compile a rule expression into (predicate(record) -> bool, field names).
+    Raises ValueError for syntax errors or anything outside the whitelist.
+    """
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"{name}: {e.msg} in {expr!r}") from None
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"{name}: {type(node).__name__} not allowed in {expr!r}")
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS):
+            raise ValueError(f"{name}: only {sorted(_FUNCTIONS)} may be called in {expr!r}")
+    lookup = _FieldLookup()
+    body = lookup.visit(tree.body)
+    lookup.fields -= set(_FUNCTIONS)
+    # lambda _r: bool(<body>)
+    fn = ast.Expression(body=ast.Lambda(
+        args=ast.arguments(posonlyargs=[], args=[ast.arg(arg="_r")], kwonlyargs=[],
+                           kw_defaults=[], defaults=[]),
+        body=ast.Call(func=ast.Name(id="bool", ctx=ast.Load()), args=[body], keywords=[])))
+    ast.fix_missing_locations(fn)
+    namespace = {"__builtins__": {}, "bool": bool, "_nan": _NAN, **_FUNCTIONS}
+    return eval(compile(fn, f"<alert:{name}>", "eval"), namespace), lookup.fields
+
+
+class Rule:
+    __slots__ = ("name", "when", "clear", "after", "for_s", "clear_for_s", "silent_s",
+                 "severity", "message", "device_type", "fields")
+
+    def __init__(self, spec):
+        self.name = spec["name"]
+        self.severity = spec.get("severity", "warning")
+        self.message = spec.get("message", self.name)
+        self.device_type = spec.get("device_type", "drone")
+        self.for_s = float(spec.get("for_s", 0))
+        self.clear_for_s = float(spec.get("clear_for_s", 0))
+        self.silent_s = float(spec["silent_s"]) if spec.get("silent_s") else None
+        self.when = self.clear = self.after = None
+        self.fields = set()
+        if self.silent_s is None:
+            if "when" not in spec:
+                raise ValueError(f"{self.name}: needs 'when' or 'silent_s'")
+            self.when, fields = compile_expression(spec["when"], self.name)
+            self.fields |= fields
+            if spec.get("clear"):
+                self.clear, fields = compile_expression(spec["clear"], self.name)
+                self.fields |= fields
+            if spec.get("after"):
+                self.after, fields = compile_expression(spec["after"], self.name)
+                self.fields |= fields
+
+
+def load_rules(path=ALERT_RULES_FILE):
+    """Rules from a JSON file (list of rule objects), else DEFAULT_RULES."""
+    specs = DEFAULT_RULES
+    if path:
+        with open(path) as f:
+            specs = json.load(f)
+    rules = [Rule(spec) for spec in specs]
+    names = [r.name for r in rules]
+    if len(set(names)) != len(names):
+        raise ValueError(f"duplicate rule names in {path or 'DEFAULT_RULES'}")
+    return rules
+
+
+class _State:
+    __slots__ = ("active", "armed", "pending", "clearing", "since")
+
+    def __init__(self, armed):
+        self.active = False
+        self.armed = armed
+        self.pending = None     # Record time the condition started holding
+        self.clearing = None    # Record time the clear condition started holding
+        self.since = None       # Record time the alert fired
+
+
+class AlertEngine:
+    def __init__(self, rules=None):
+        self.rules = load_rules() if rules is None else rules
+        self.packet_rules = [r for r in self.rules if r.silent_s is None]
+        self.silence_rules = [r for r in self.rules if r.silent_s is not None]
+        self.aircraft = {}      # serial -> [_State per packet rule]
+        self.last_seen = {}     # serial -> (monotonic arrival, device_type, record timestamp)
+        self.silent = {}        # (serial, rule name) -> monotonic time it fired
+        self.fired = 0
+        self.cleared = 0
+        self.evaluated = 0
+        self.eval_s = 0.0
+
+    def update(self, record, now=None):
+        """
+        Evaluate every packet rule against one normalized record.
+        Returns the alert / clear events it produced (usually none).
+        """
+        t0 = time.perf_counter()
+        now = time.monotonic() if now is None else now
+        serial = record.get("serial")
+        device_type = record.get("device_type")
+        ts = record.get("timestamp", 0) / 1000.0
+        events = []
+
+        self.last_seen[serial] = (now, device_type, record.get("timestamp", 0))
+        if self.silent:
+            for rule in self.silence_rules:
+                fired_at = self.silent.pop((serial, rule.name), None)
+                if fired_at is not None:
+                    events.append(self._event(rule, serial, "clear", record.get("timestamp", 0), record,
+                                              duration_s=now - fired_at))
+
+        states = self.aircraft.get(serial)
+        if states is None:
+            states = self.aircraft[serial] = [_State(r.after is None) for r in self.packet_rules]
+        for rule, st in zip(self.packet_rules, states):
+            if rule.device_type and rule.device_type != device_type:
+                continue
+            if not st.active:
+                if not st.armed:
+                    st.armed = rule.after(record)
+                    continue
+                if rule.when(record):
+                    if st.pending is None:
+                        st.pending = ts
+                    if ts - st.pending >= rule.for_s:
+                        st.active, st.since, st.clearing = True, ts, None
+                        events.append(self._event(rule, serial, "alert", record.get("timestamp", 0), record))
+                else:
+                    st.pending = None
+            else:
+                clear = rule.clear(record) if rule.clear is not None else not rule.when(record)
+                if clear:
+                    if st.clearing is None:
+                        st.clearing = ts
+                    if ts - st.clearing >= rule.clear_for_s:
+                        events.append(self._event(rule, serial, "clear", record.get("timestamp", 0), record,
+                                                  duration_s=ts - st.since))
+                        st.active, st.pending, st.since = False, None, None
+                        st.armed = rule.after is None or rule.after(record)
+                else:
+                    st.clearing = None
+
+        self.evaluated += 1
+        self.eval_s += time.perf_counter() - t0
+        return events
+
+    def tick(self, now=None):
+        """Loss-of-signal rules: fire for aircraft silent longer than silent_s."""
+        if not self.silence_rules:
+            return []
+        now = time.monotonic() if now is None else now
+        events = []
+        for serial, (seen, device_type, timestamp) in self.last_seen.items():
+            for rule in self.silence_rules:
+                if rule.device_type and rule.device_type != device_type:
+                    continue
+                key = (serial, rule.name)
+                if key not in self.silent and now - seen >= rule.silent_s:
+                    self.silent[key] = now
+                    events.append(self._event(rule, serial, "alert", timestamp, {"silent_s": now - seen}))
+        return events
+
+    def _event(self, rule, serial, state, timestamp, record, duration_s=None):
+        if state == "alert":
+            self.fired += 1
+        else:
+            self.cleared += 1
+        event = {
+            "timestamp": timestamp,
+            "serial": serial,
+            "alert": rule.name,
+            "state": state,
+            "severity": rule.severity,
+        }
+        if state == "alert":
+            try:
+                event["message"] = rule.message.format(**record)
+            except (KeyError, ValueError, TypeError):
+                event["message"] = rule.message
+            for field in rule.fields:
+                if field in record:
+                    event[field] = record[field]
+        if duration_s is not None:
+            event["duration_s"] = round(duration_s, 3)
+        return event
+
+    def active(self):
+        """(serial, rule) pairs currently in alert."""
+        out = [(serial, rule.name) for serial, states in self.aircraft.items()
+               for rule, st in zip(self.packet_rules, states) if st.active]
+        return out + list(self.silent)
+
+    def stats(self):
+        return {
+            "alert_rules": len(self.rules),
+            "alerts_active": len(self.active()),
+            "alerts_fired": self.fired,
+            "alerts_cleared": self.cleared,
+            "alert_eval_us": round(1e6 * self.eval_s / self.evaluated, 2) if self.evaluated else 0.0,
+        }
+
+
+def alert_topic(event):
+    return f"{ALERT_TOPIC_ROOT}/{event['serial']}/{event['alert']}"
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def synthetic_records(aircraft=100, seconds=60, hz=10, seed=1):
+    """Normalized drone records for a fleet that drifts through every default rule."""
+    rng = random.Random(seed)
+    for i in range(seconds * hz):
+        ts = 1_700_000_000_000 + i * (1000 // hz)
+        for a in range(aircraft):
+            phase = (i / hz + a) % 40
+            yield {
+                "timestamp": ts,
+                "device_type": "drone",
+                "serial": f"SIM{a:04d}",
+                "batt": max(5.0, 100.0 - i / hz * 1.5 - a % 10),
+                "lat": 22.5 + a * 1e-4, "lon": 113.9,
+                "alt": 118.0 + 6.0 * math.sin(phase / 3.0),
+                "height_limit": 120.0,
+                "sat_count": 6 if 20 <= phase < 26 else 18,
+                "rtk_status": "NONE" if 10 <= phase < 14 else "FIX",
+                "airborne": 1,
+                "heading": rng.uniform(0, 360),
+            }
+
+
+def cmd_check(args):
+    rules = load_rules(args.rules)
+    for r in rules:
+        kind = f"silent {r.silent_s:g}s" if r.silent_s else f"for {r.for_s:g}s / clear {r.clear_for_s:g}s"
+        print(f"✅ {r.name:<18} {r.severity:<9} {kind:<24} fields: {', '.join(sorted(r.fields)) or '-'}")
+
+
+def cmd_bench(args):
+    engine = AlertEngine(load_rules(args.rules))
+    records = list(synthetic_records(args.aircraft, args.seconds))
+    worst = 0.0
+    events = 0
+    t0 = time.perf_counter()
+    for rec in records:
+        t = time.perf_counter()
+        events += len(engine.update(rec, now=rec["timestamp"] / 1000.0))
+        worst = max(worst, time.perf_counter() - t)
+    elapsed = time.perf_counter() - t0
+    print(f"📊 {len(records):,} records, {len(engine.packet_rules)} packet rules, {args.aircraft} aircraft")
+    print(f"   {1e6 * elapsed / len(records):.2f} µs/record avg, {1e6 * worst:.1f} µs worst")
+    print(f"   {events:,} alert/clear events, {len(engine.active())} active at end")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alert rule engine for normalized telemetry")
+    parser.add_argument("--rules", default=ALERT_RULES_FILE, help="JSON rules file (default: built-in rules)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("check", help="Compile the rules and list them")
+    p.set_defaults(func=cmd_check)
+    p = sub.add_parser("bench", help="Per-record cost on a synthetic fleet")
+    p.add_argument("--aircraft", type=int, default=100)
+    p.add_argument("--seconds", type=int, default=60)
+    p.set_defaults(func=cmd_bench)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: altitude_fusion.py
+Description: Ingest-time "Altitude Truth" for the Telemetry Bridge.
+             Per aircraft, a complementary filter blends the smooth but
+             drifting baro height with RTK height minus the calibrated
+             geoid/baro offset (calibration.json from
+             scripts/altitude_calibration.py):
+
+                 bias      += k * ((rtk_hgt - offset - baro) - bias)
+                 alt_fused  = baro + bias        k = dt / (TAU_S + dt)
+
+             The bias only tracks while RTK is FIX (FLOAT with a reduced
+             gain) and holds otherwise. alt_error is the instantaneous
+             (rtk_hgt - offset) - baro the old Flux pivot/map computed.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+CALIBRATION_FILE = os.getenv("ALT_CALIBRATION_FILE", "calibration.json")
+FALLBACK_OFFSET = 3.13          # Same legacy constant as altitude_calibration.py
+TAU_S = 10.0                    # Bias time constant: RTK corrects baro drift over ~10s
+FLOAT_GAIN = 0.2                # RTK FLOAT is trusted at 20% of FIX
+MAX_DT_S = 5.0                  # Longer gaps restart the filter from RTK
+RELOAD_S = 60.0                 # Re-read calibration.json this often (if changed)
+
+
+class CalibrationOffsets:
+    """Per-aircraft offsets from calibration.json, reloaded when the file changes."""
+
+    def __init__(self, path=CALIBRATION_FILE, default=FALLBACK_OFFSET):
+        self.path = path
+        self.default = default
+        self.offsets = {}
+        self.fleet = default
+        self._mtime = None
+        self._next_check = 0.0
+
+    def _reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime == self._mtime:
+                return
+            with open(self.path) as f:
+                aircraft = json.load(f).get("aircraft", {})
+        except (OSError, json.JSONDecodeError):
+            return
+        self._mtime = mtime
+        self.offsets = {sn: a["offset_m"] for sn, a in aircraft.items() if "offset_m" in a}
+        if self.offsets:
+            values = sorted(self.offsets.values())
+            mid = len(values) // 2
+            self.fleet = values[mid] if len(values) % 2 else 0.5 * (values[mid - 1] + values[mid])
+        logger.info(f"📐 Altitude calibration loaded for {len(self.offsets)} aircraft")
+
+    def get(self, serial):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + RELOAD_S
+            self._reload()
+        return self.offsets.get(serial, self.fleet)
+
+
+class AltitudeFusion:
+    def __init__(self, offsets=None, tau_s=TAU_S):
+        self.offsets = offsets or CalibrationOffsets()
+        self.tau_s = tau_s
+        self.state = {}         # serial -> [last_ts_ms, bias]
+
+    def update(self, record):
+        """Add alt_fused / alt_error to a normalized drone record (in place)."""
+        baro = record.get("alt")
+        rtk = record.get("rtk_hgt")
+        if baro is None:
+            return record
+        serial = record.get("serial")
+        ts = record.get("timestamp", 0)
+        status = record.get("rtk_status")
+
+        error = None
+        if rtk and status in ("FIX", "FLOAT"):
+            error = (rtk - self.offsets.get(serial)) - baro
+
+        st = self.state.get(serial)
+        if st is None or ts < st[0] or ts - st[0] > MAX_DT_S * 1000:
+            # First packet / long gap / clock jump: start from the measured bias
+            st = self.state[serial] = [ts, error if error is not None else (st[1] if st else 0.0)]
+        elif error is not None and ts > st[0]:
+            dt = (ts - st[0]) / 1000.0
+            k = dt / (self.tau_s + dt)
+            if status == "FLOAT":
+                k *= FLOAT_GAIN
+            st[1] += k * (error - st[1])
+        st[0] = ts
+
+        record["alt_fused"] = round(baro + st[1], 3)
+        if error is not None:
+            record["alt_error"] = round(error, 3)
+        return record
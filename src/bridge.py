@@ -3,10 +3,11 @@
 Script Name: bridge.py
 Description: Core Telemetry Bridge for Autel Max 4T.
              Intercepts UDP broadcast packets, decodes binary/JSON structures,
-             Normalizes data into a standard schema, and publishes to MQTT.
-Version:     1.2.0 (Fix: Added RTK FIX status handling)
+             Normalizes data into a standard schema, and publishes through
+             pluggable output sinks (MQTT, file recorder, UDP relay).
+Version:     1.14.0 (Proximity / deconfliction)
 Author:      RW
-Date:        2025-12-17
+Date:        2025-12-19
 -----------------------------------------------------------------------------
 """
 
@@ -15,18 +16,48 @@ import json
 import time
 import logging
 import os
+import re
 import signal
 import sys
+import threading
 from datetime import datetime
 import paho.mqtt.client as mqtt
 
+from shape_registry import ShapeRegistry, ROUTE_DRONE, ROUTE_CONTROLLER, route_for
+from priority_lanes import PriorityLanes, LANE_EVENT
+from buffer_pool import BufferPool
+from sinks import (SinkSet, DEFAULT_SINKS, KIND_OSD, KIND_SLIM, KIND_STATIC, KIND_EVENT,
+                   KIND_NORMALIZED, KIND_DIAGNOSTIC, KIND_ALERT)
+from static_dedup import StaticDeduper, static_topic
+from rollups import RollupAggregator
+from altitude_fusion import AltitudeFusion
+from derived_metrics import DerivedMetrics
+from alerts import AlertEngine, alert_topic
+from geofence import GeofenceEngine, geofence_topic
+from proximity import ProximityMonitor, PROXIMITY_TOPIC
+
 # --- Configuration ---
 # Load from Environment or use Defaults
 UDP_IP = "0.0.0.0"
 UDP_PORT = 12000  # Standard Autel broadcast port
+UDP_RCVBUF = int(os.getenv("UDP_RCVBUF", 4 * 1024 * 1024))  # Kernel socket buffer (bytes), absorbs bursts
 MQTT_BROKER = os.getenv("MQTT_BROKER_HOST", "localhost")
 MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
+MQTT_MAX_QUEUED = 1000  # Per sink client: QoS>0 messages paho holds while the broker lags
 MQTT_TOPIC_ROOT = "autel"
+DRIFT_TOPIC = "diagnostics/schema_drift"
+NORMALIZED_TOPIC = "telemetry/normalized"
+LANES_TOPIC = "diagnostics/bridge_lanes"
+SINKS_TOPIC = "diagnostics/bridge_sinks"
+ROLLUP_TOPIC = "telemetry/rollups"
+BRIDGE_SINKS = os.getenv("BRIDGE_SINKS", DEFAULT_SINKS)
+STATS_INTERVAL_S = 10
+ALERT_TICK_S = 0.1      # Loss-of-signal check cadence (also the idle wake-up of the worker)
+
+# Cheap pre-parse classification on the receive thread: event packets carry
+# a 'method' (hms, alarms, ...); the gateway serial keys the per-aircraft OSD lane.
+EVENT_MARKER = b'"method"'
+GATEWAY_RE = re.compile(rb'"gateway"\s*:\s*"([^"]*)"')
 
 # Logging Setup
 logging.basicConfig(
@@ -39,8 +70,20 @@ logger = logging.getLogger(__name__)
 class TelemetryBridge:
     def __init__(self):
         self.running = True
-        self.mqtt_client = None
+        self.mqtt_clients = []
         self.udp_sock = None
+        self.shapes = ShapeRegistry()
+        self.static = StaticDeduper()
+        self.rollups = RollupAggregator()
+        self.altitude = AltitudeFusion()
+        self.derived = DerivedMetrics()
+        self.geofence = GeofenceEngine()
+        self.proximity = ProximityMonitor()
+        self.alerts = AlertEngine()
+        self.pool = BufferPool()
+        self.lanes = PriorityLanes(on_drop=self.pool.release)
+        self.worker = None
+        self.sinks = None
         
         # Graceful Shutdown
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -51,13 +94,16 @@ class TelemetryBridge:
         logger.info("🛑 Shutdown signal received. Stopping loop...")
         self.running = False
 
-    def connect_mqtt(self):
-        """Establish connection to the MQTT Broker."""
+    def connect_mqtt(self, name):
+        """Establish one MQTT Broker connection for the sink 'name'."""
         try:
-            self.mqtt_client = mqtt.Client(client_id="autel_bridge_v1.2", protocol=mqtt.MQTTv311)
-            self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-            self.mqtt_client.loop_start()
-            logger.info(f"✅ MQTT Connected: {MQTT_BROKER}:{MQTT_PORT}")
+            client = mqtt.Client(client_id=f"autel_bridge_v1.2_{name}", protocol=mqtt.MQTTv311)
+            client.max_queued_messages_set(MQTT_MAX_QUEUED)
+            client.connect(MQTT_BROKER, MQTT_PORT, 60)
+            client.loop_start()
+            self.mqtt_clients.append(client)
+            logger.info(f"✅ MQTT Connected ({name}): {MQTT_BROKER}:{MQTT_PORT}")
+            return client
         except Exception as e:
             logger.error(f"🔴 MQTT Connection Failed: {e}")
             sys.exit(1)
@@ -66,6 +112,12 @@ class TelemetryBridge:
         """Bind to the UDP port to listen for drone broadcasts."""
         try:
             self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            if UDP_RCVBUF:
+                self.udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF)
+                effective = self.udp_sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+                # Linux reports double the request, capped by net.core.rmem_max
+                if effective < UDP_RCVBUF:
+                    logger.warning(f"⚠️ SO_RCVBUF capped at {effective} bytes (requested {UDP_RCVBUF}); raise net.core.rmem_max")
             self.udp_sock.bind((UDP_IP, UDP_PORT))
             # CRITICAL FIX: Set timeout so the loop can check self.running
             self.udp_sock.settimeout(1.0) 
@@ -74,18 +126,21 @@ class TelemetryBridge:
             logger.error(f"🔴 UDP Bind Failed: {e}")
             sys.exit(1)
 
-    def _normalize_payload(self, raw_data):
+    def _normalize_payload(self, raw_data, route=None):
         """
         CRITICAL: Takes messy, vendor-specific JSON and converts it 
         into a clean, standardized format for the database.
+        'route' is the cached ShapeRegistry decision for this payload shape.
         """
+        if route is None:
+            route = route_for(raw_data)
         normalized = {}
         
         # Extract Timestamp
         normalized['timestamp'] = raw_data.get('timestamp', int(time.time() * 1000))
         
         # --- PATH A: DATA FROM DRONE ---
-        if 'data' in raw_data and 'battery' in raw_data['data']:
+        if route == ROUTE_DRONE:
             data = raw_data['data']
             normalized['device_type'] = 'drone'
             normalized['serial'] = raw_data.get('gateway', 'unknown_drone')
@@ -98,19 +153,21 @@ class TelemetryBridge:
             # --- RTK STATUS LOGIC ---
             pos = data.get('position_state', {})
             normalized['sat_count'] = int(pos.get('gps_number', 0))
-            
-            rtk_val = pos.get('rtk_inpos', 0)
-            if rtk_val == 2:
-                normalized['rtk_status'] = "FIX"    # High Precision (CM level)
-            elif rtk_val == 1:
-                normalized['rtk_status'] = "FLOAT"  # Medium Precision
-            else:
-                normalized['rtk_status'] = "NONE"   # Standard GPS
+            normalized['rtk_status'] = self._rtk_status(pos.get('rtk_inpos', 0))
+            normalized['rtk_hgt'] = round(float(pos.get('rtk_hgt', 0)), 3)
 
             normalized['heading'] = round(float(data.get('attitude_head', 0)), 2)
+            if 'height_limit' in data:
+                normalized['height_limit'] = float(data['height_limit'])
+            if 'horizontal_speed' in data:
+                normalized['horizontal_speed'] = round(float(data['horizontal_speed']), 2)
+            if 'vel_ned_x' in data and 'vel_ned_y' in data:
+                # NED frame: x north, y east (m/s)
+                normalized['vel_n'] = round(float(data['vel_ned_x']), 3)
+                normalized['vel_e'] = round(float(data['vel_ned_y']), 3)
 
         # --- PATH B: DATA FROM CONTROLLER ---
-        elif 'data' in raw_data and 'device_list' in raw_data['data']:
+        elif route == ROUTE_CONTROLLER:
             data = raw_data['data']
             normalized['device_type'] = 'controller'
             normalized['serial'] = raw_data.get('gateway', 'unknown_controller')
@@ -122,48 +179,215 @@ class TelemetryBridge:
             normalized['sat_count'] = 0
             normalized['heading'] = 0.0
             normalized['rtk_status'] = "NONE"
+            normalized['aircraft_count'] = len(data.get('device_list') or [])
 
         else:
             return None 
 
         return normalized
 
+    @staticmethod
+    def _rtk_status(rtk_val):
+        if rtk_val == 2:
+            return "FIX"    # High Precision (CM level)
+        elif rtk_val == 1:
+            return "FLOAT"  # Medium Precision
+        return "NONE"       # Standard GPS
+
+    def _expand_device_list(self, raw_data, parent, timestamp):
+        """
+        PATH B fan-out: one normalized 'drone' record per controller
+        device_list entry, tagged with the parent controller. Camera/video
+        counts come from the device_list entry itself instead of an opaque
+        string blob. Position, battery and RTK come from the drone_list
+        entry with the same 'sn'; without one those keys are left out
+        rather than reported as zeros.
+        """
+        data = raw_data['data']
+        drones = {d.get('sn'): d for d in (data.get('drone_list') or []) if isinstance(d, dict)}
+        records = []
+        for entry in data.get('device_list') or []:
+            if not isinstance(entry, dict) or not entry.get('sn'):
+                continue
+            sn = entry['sn']
+            cameras = entry.get('camera_list') or []
+            record = {
+                'timestamp': timestamp,
+                'device_type': 'drone',
+                'serial': sn,
+                'parent_serial': parent,
+                'camera_count': len(cameras),
+                'video_count': sum(len(c.get('video_list') or []) for c in cameras if isinstance(c, dict)),
+                'available_video_number': int(entry.get('available_video_number', 0)),
+            }
+            drone = drones.get(sn)
+            if drone is not None:
+                pos = drone.get('position_state') or {}
+                record.update({
+                    'batt': float((drone.get('battery') or {}).get('capacity_percent', 0)),
+                    'lat': round(float(drone.get('latitude', 0)), 6),
+                    'lon': round(float(drone.get('longitude', 0)), 6),
+                    'alt': round(float(drone.get('height', 0)), 2),
+                    'sat_count': int(pos.get('gps_number', 0)),
+                    'rtk_status': self._rtk_status(pos.get('rtk_inpos', 0)),
+                    'rtk_hgt': round(float(pos.get('rtk_hgt', 0)), 3),
+                    'heading': round(float(drone.get('attitude_head', 0)), 2),
+                })
+                if 'horizontal_speed' in drone:
+                    record['horizontal_speed'] = round(float(drone['horizontal_speed']), 2)
+            records.append(record)
+        return records
+
+    def _normalize_records(self, raw_data, route=None):
+        """All normalized records for one packet (controller + fanned-out aircraft)."""
+        if route is None:
+            route = route_for(raw_data)
+        record = self._normalize_payload(raw_data, route)
+        if record is None:
+            return []
+        if route == ROUTE_CONTROLLER:
+            records = [record] + self._expand_device_list(raw_data, record['serial'], record['timestamp'])
+        else:
+            records = [record]
+        for rec in records:
+            if rec['device_type'] == 'drone':
+                self.altitude.update(rec)
+                self.derived.update(rec)
+        return records
+
+    def _publish_packet(self, lane, slot):
+        """
+        Decode -> Normalize -> Publish one pooled packet taken from the lanes.
+        This makes one copy of the packet (Slot.data()): paho queues the
+        payload after publish() returns, so it cannot alias the slot. The
+        same bytes feed json.loads and the raw publish (no str round-trip).
+        """
+        raw = slot.data()
+        try:
+            json_data = json.loads(raw)
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return
+        sn = json_data.get('gateway', 'unknown')
+
+        # Events: forward untouched, at-least-once
+        if lane == LANE_EVENT:
+            self.sinks.emit(KIND_EVENT, f"thing/product/{sn}/events", raw, qos=1)
+            return
+
+        # Classify by shape (cached per fingerprint)
+        route, drift = self.shapes.classify(json_data)
+        if drift:
+            self.sinks.emit(KIND_DIAGNOSTIC, DRIFT_TOPIC, json.dumps(drift))
+
+        # Publish RAW: full bytes for recorders/relays, slim + retained static for MQTT
+        osd_topic = f"thing/product/{sn}/osd"
+        self.sinks.emit(KIND_OSD, osd_topic, raw)
+        if self.sinks.wants(KIND_SLIM):
+            slim, static = self.static.split(sn, json_data)
+            if static:
+                self.sinks.emit(KIND_STATIC, static_topic(sn), json.dumps(static, separators=(",", ":")), qos=1, retain=True)
+            self.sinks.emit(KIND_SLIM, osd_topic, raw if slim is json_data else json.dumps(slim, separators=(",", ":")))
+
+        # Publish NORMALIZED (controllers fan out per aircraft)
+        for clean_data in self._normalize_records(json_data, route):
+            if clean_data['device_type'] == 'drone':
+                for event in self.geofence.update(clean_data):
+                    self.sinks.emit(KIND_ALERT, geofence_topic(event), json.dumps(event), qos=1)
+                self._emit_conflicts(self.proximity.update(clean_data))
+            self.sinks.emit(KIND_NORMALIZED, NORMALIZED_TOPIC, json.dumps(clean_data))
+            self._emit_rollups(self.rollups.add(clean_data))
+            self._emit_alerts(self.alerts.update(clean_data))
+            
+            if int(time.time()) % 5 == 0: 
+                logger.debug(f"Processed packet for {clean_data['device_type']}")
+
+    def _emit_rollups(self, rollups):
+        for rollup in rollups:
+            self.sinks.emit(KIND_NORMALIZED, ROLLUP_TOPIC, json.dumps(rollup))
+
+    def _emit_alerts(self, events):
+        # Retained per (serial, rule): late subscribers see what is active now
+        for event in events:
+            self.sinks.emit(KIND_ALERT, alert_topic(event), json.dumps(event), qos=1, retain=True)
+            if event['state'] == 'alert':
+                logger.warning(f"🚨 {event['serial']} {event['alert']}: {event.get('message', '')}")
+
+    def _emit_conflicts(self, events):
+        for event in events:
+            self.sinks.emit(KIND_ALERT, PROXIMITY_TOPIC, json.dumps(event), qos=1)
+            if event['state'] == 'conflict':
+                logger.warning(f"🚨 Proximity {event['serial_a']} / {event['serial_b']}: "
+                               f"{event['cpa_m']} m in {event['cpa_s']} s, vertical {event['vertical_m']} m")
+
+    def _publish_loop(self):
+        """Worker: drains the lanes (events first) until stopped and empty."""
+        next_stats = time.monotonic() + STATS_INTERVAL_S
+        next_expire = time.monotonic() + 1.0
+        next_tick = time.monotonic() + ALERT_TICK_S
+        while self.running or len(self.lanes):
+            entry = self.lanes.get(timeout=ALERT_TICK_S)
+            if entry is not None:
+                try:
+                    self._publish_packet(*entry)
+                except Exception as e:
+                    logger.error(f"Publish Error: {e}")
+                finally:
+                    self.pool.release(entry[1])
+            if time.monotonic() >= next_tick:
+                next_tick = time.monotonic() + ALERT_TICK_S
+                self._emit_alerts(self.alerts.tick())
+            if time.monotonic() >= next_expire:
+                next_expire = time.monotonic() + 1.0
+                self._emit_rollups(self.rollups.expire())
+                self._emit_conflicts(self.proximity.expire())
+            if time.monotonic() >= next_stats:
+                next_stats += STATS_INTERVAL_S
+                stats = self.lanes.stats()
+                stats.update(self.pool.stats())
+                stats.update(self.shapes.stats())
+                stats.update(self.static.stats())
+                stats.update(self.rollups.stats())
+                stats.update(self.derived.stats())
+                stats.update(self.geofence.stats())
+                stats.update(self.proximity.stats())
+                stats.update(self.alerts.stats())
+                self.sinks.emit(KIND_DIAGNOSTIC, LANES_TOPIC, json.dumps(stats))
+                sink_stats = self.sinks.stats()
+                self.sinks.emit(KIND_DIAGNOSTIC, SINKS_TOPIC, json.dumps(sink_stats))
+                dropping = {name: s['dropped'] for name, s in sink_stats.items() if s['dropped']}
+                if dropping:
+                    logger.warning(f"⚠️ Sink drops so far: {dropping}")
+                if stats['osd_shed'] or stats['osd_merged']:
+                    logger.info(f"📉 OSD load shedding: merged={stats['osd_merged']} shed={stats['osd_shed']} "
+                                f"event_wait_max={stats['event_wait_max_ms']}ms")
+
     def run(self):
-        """Main Loop: Receive -> Decode -> Normalize -> Publish"""
-        self.connect_mqtt()
+        """Main Loop: Receive -> Classify -> Enqueue (worker: Decode -> Normalize -> Publish)"""
+        self.sinks = SinkSet.from_names(BRIDGE_SINKS, self.connect_mqtt)
+        self.sinks.start()
         self.setup_udp()
+        self.worker = threading.Thread(target=self._publish_loop, name="bridge-publisher", daemon=True)
+        self.worker.start()
 
-        buffer_size = 65535 
-
+        slot = None
         while self.running:
             try:
-                # 1. Receive Packet (With Timeout)
+                # 1. Receive Packet into a pooled buffer (With Timeout)
+                if slot is None:
+                    slot = self.pool.acquire()
                 try:
-                    data, addr = self.udp_sock.recvfrom(buffer_size)
+                    slot.recv_into(self.udp_sock)
                 except socket.timeout:
                     # Timeout reached, loop back to check self.running
                     continue
-                
-                # 2. Decode
-                try:
-                    decoded_str = data.decode('utf-8')
-                    json_data = json.loads(decoded_str)
-                except json.JSONDecodeError:
-                    continue
-
-                # 3. Publish RAW
-                sn = json_data.get('gateway', 'unknown')
-                raw_topic = f"thing/product/{sn}/osd"
-                self.mqtt_client.publish(raw_topic, decoded_str)
 
-                # 4. Publish NORMALIZED
-                clean_data = self._normalize_payload(json_data)
-                if clean_data:
-                    clean_topic = "telemetry/normalized"
-                    self.mqtt_client.publish(clean_topic, json.dumps(clean_data))
-                    
-                    if int(time.time()) % 5 == 0: 
-                        logger.debug(f"Processed packet for {clean_data['device_type']}")
+                # 2. Priority lane: events never shed, OSD newest-wins per aircraft
+                if slot.find(EVENT_MARKER) >= 0:
+                    self.lanes.put_event(slot)
+                else:
+                    m = GATEWAY_RE.search(slot.buf, 0, slot.n)
+                    self.lanes.put_osd(m.group(1) if m else b'unknown', slot)
+                slot = None
 
             except socket.error as e:
                 logger.error(f"Socket Error: {e}")
@@ -172,9 +396,13 @@ class TelemetryBridge:
                 logger.error(f"Unexpected Error: {e}")
                 
         # Cleanup
-        if self.mqtt_client:
-            self.mqtt_client.loop_stop()
-            self.mqtt_client.disconnect()
+        if self.worker:
+            self.worker.join(timeout=5)
+        if self.sinks:
+            self.sinks.stop()
+        for client in self.mqtt_clients:
+            client.loop_stop()
+            client.disconnect()
         if self.udp_sock:
             self.udp_sock.close()
         logger.info("👋 Bridge Stopped.")
@@ -0,0 +1,96 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: buffer_pool.py
+Description: Preallocated receive buffers for the Telemetry Bridge.
+             Each Slot owns a bytearray and a memoryview over it; the receive
+             loop fills a slot with recv_into() and hands the slot (not a new
+             bytes object) through the priority lanes. Slots return to the
+             pool once the packet is published or shed. If every slot is in
+             flight a temporary slot is handed out instead: it receives into
+             an exact-size bytes object (not a BUFFER_SIZE buffer) and is not
+             kept on release, so the pool never blocks reception and a
+             backlog costs its packet size, not 64 KB, per packet.
+             The publish path makes one copy per packet (Slot.data(): the
+             MQTT client queues the payload past publish(), so it must not
+             alias a slot that is about to be reused); temporary slots need
+             none.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = 65535     # Largest UDP datagram
+# ~16 MB. Slots in flight = queued OSD frames (<= priority_lanes.MAX_OSD, i.e.
+# OSD_DEPTH per aircraft in steady state) + queued events (unbounded) + the
+# one being received + the one being published. 256 covers the steady state
+# of ~60 aircraft; a backlog beyond it takes exact-size temporary slots
+# (pool_misses), e.g. MAX_OSD frames of ~7 KB ~ 14 MB on top of the pool.
+POOL_SLOTS = 256
+MISS_LOG_EVERY = 1000   # Warn on the first pool miss and then every N
+
+
+class Slot:
+    """A pooled receive buffer; size=0 makes a temporary exact-size slot."""
+    __slots__ = ("buf", "view", "n", "size")
+
+    def __init__(self, size=BUFFER_SIZE):
+        self.size = size
+        self.buf = bytearray(size) if size else b""
+        self.view = memoryview(self.buf)
+        self.n = 0
+
+    def recv_into(self, sock):
+        if self.size:
+            self.n = sock.recv_into(self.buf)
+        else:
+            self.buf = sock.recv(BUFFER_SIZE)
+            self.view = memoryview(self.buf)
+            self.n = len(self.buf)
+        return self.n
+
+    def payload(self):
+        """View of the received bytes (no copy)."""
+        return self.view[:self.n]
+
+    def data(self):
+        """The received bytes as an immutable object: one copy, none for a temporary slot."""
+        return self.buf if not self.size else bytes(self.view[:self.n])
+
+    def find(self, sub):
+        return self.buf.find(sub, 0, self.n)
+
+
+class BufferPool:
+    def __init__(self, slots=POOL_SLOTS, size=BUFFER_SIZE):
+        self.size = size
+        self.capacity = slots
+        self._free = [Slot(size) for _ in range(slots)]
+        self._lock = threading.Lock()
+        self.misses = 0         # Temporary slots allocated because the pool was empty
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            self.misses += 1
+            misses = self.misses
+        if misses % MISS_LOG_EVERY == 1:
+            logger.warning(f"⚠️ Buffer pool empty ({self.capacity} slots in flight): allocating "
+                           f"({misses} temporary slot(s) so far)")
+        return Slot(0)
+
+    def release(self, slot):
+        with self._lock:
+            if slot.size == self.size and len(self._free) < self.capacity:
+                slot.n = 0
+                self._free.append(slot)
+
+    def stats(self):
+        with self._lock:
+            return {"pool_free": len(self._free), "pool_capacity": self.capacity, "pool_misses": self.misses}
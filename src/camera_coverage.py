@@ -0,0 +1,536 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: camera_coverage.py
+Description: Camera ground footprints and coverage rasters.
+             Every OSD frame's sensor footprint is projected onto the ground
+             plane (flat ground at takeoff elevation, 'height' above it):
+             the four FOV corner rays are pitched/yawed with the gimbal and
+             intersected with the plane for all frames at once in NumPy.
+             Rays at or above the horizon are clipped at MAX_RANGE_M.
+
+             Footprints are rasterized on the Web Mercator pixel grid of
+             COVERAGE_ZOOM (0.6 m pixels at 60°N) as scanline spans: each
+             covered row adds +1/-1 to a per-tile difference array, so a
+             frame costs O(rows) instead of O(pixels). Counts are "frames
+             that saw this pixel" (dwell in 1/OSD-rate seconds).
+
+             Tiles export as {z}/{x}/{y}.png (dwell colour ramp) plus
+             {z}/{x}/{y}.npy counts and coverage.json statistics.
+
+             python camera_coverage.py batch flight_logs/*.jsonl --out coverage
+             python camera_coverage.py live --out coverage    (osd + static topics)
+             python camera_coverage.py bench
+             python camera_coverage.py roundtrip   (bridge -> recorder -> batch)
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import time
+
+import numpy as np
+
+from geodesy import offset
+from recordings import iter_records
+from tiles import TILE, mercator_pixels, write_png
+
+logger = logging.getLogger(__name__)
+
+# CONFIGURATION
+COVERAGE_DIR = os.getenv("COVERAGE_DIR", "coverage")
+COVERAGE_ZOOM = 17              # 1.19 m pixels at the equator, 0.6 m at 60°N
+LENS = "zoom"                   # zoom_fov_h/v or ir_fov_h/v
+MAX_RANGE_M = 500.0             # Horizontal clip for rays near/above the horizon
+MIN_HEIGHT_M = 2.0              # On the ground: no footprint
+FLUSH_S = 1.0                   # Live: rasterize buffered frames this often
+EXPORT_S = 10.0                 # Live: write dirty tiles and stats this often
+POSELESS_WARN = 100             # Live: warn once after this many aircraft frames without a pose
+METERS_PER_PX_Z0 = 156543.03392
+PAYLOAD_KEY_RE = re.compile(r"^\d+-\d+-\d+$")   # "10052-0-0" gimbal payload entries
+
+# Dwell ramp: frames seen -> RGBA (1 frame, ~1 s, ~3 s, ~10 s at 10 Hz)
+DWELL_EDGES = np.array([1, 10, 30, 100])
+DWELL_COLORS = np.array([[0, 0, 0, 0],
+                         [255, 237, 160, 140],
+                         [254, 178, 76, 170],
+                         [240, 59, 32, 200],
+                         [189, 0, 38, 230]], dtype=np.uint8)
+
+FRAME_FIELDS = ("ts", "lat", "lon", "height", "pitch", "yaw", "fov_h", "fov_v")
+
+
+# ---------------------------------------------------------------------------
+# PROJECTION
+# ---------------------------------------------------------------------------
+def footprints(lat, lon, height, pitch, yaw, fov_h, fov_v, max_range=MAX_RANGE_M):
+    """
+    Ground corners of N frames -> (corner_lat (N,4), corner_lon (N,4), valid, clipped).
+    pitch: gimbal degrees (0 = horizon, -90 = nadir); yaw: degrees from north.
+    Corners run top-left, top-right, bottom-right, bottom-left (a convex quad).
+    """
+    lat, lon, height = (np.asarray(a, dtype=np.float64) for a in (lat, lon, height))
+    th = np.radians(np.asarray(pitch, dtype=np.float64))[:, None]
+    psi = np.radians(np.asarray(yaw, dtype=np.float64))[:, None]
+    tu = np.tan(np.radians(np.asarray(fov_h, dtype=np.float64)) / 2)[:, None]
+    tv = np.tan(np.radians(np.asarray(fov_v, dtype=np.float64)) / 2)[:, None]
+    su = np.array([-1.0, 1.0, 1.0, -1.0])       # image right
+    sv = np.array([-1.0, -1.0, 1.0, 1.0])       # image down
+    u, v = su * tu, sv * tv
+
+    # Camera axes after pitch: forward (cos th, 0, -sin th), down (sin th, 0, cos th)
+    fwd = np.cos(th) + v * np.sin(th)
+    right = u
+    down = -np.sin(th) + v * np.cos(th)
+    north = fwd * np.cos(psi) - right * np.sin(psi)
+    east = fwd * np.sin(psi) + right * np.cos(psi)
+
+    h = height[:, None]
+    horiz = np.hypot(north, east)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(down > 0, h / down, np.inf)
+        scale = np.minimum(t, max_range / np.where(horiz > 0, horiz, 1e-12))
+    clipped = (t * horiz > max_range).any(axis=1)
+    dn, de = north * scale, east * scale
+
+    valid = (height >= MIN_HEIGHT_M) & (down > 0).any(axis=1) & np.isfinite(dn).all(axis=1)
+    c_lat, c_lon = offset(lat[:, None], lon[:, None], dn, de)
+    return c_lat, c_lon, valid, clipped & valid
+
+
+def pixel_lat(y, zoom=COVERAGE_ZOOM):
+    n = math.pi - 2.0 * math.pi * np.asarray(y, dtype=np.float64) / (TILE * 2.0 ** zoom)
+    return np.degrees(np.arctan(np.sinh(n)))
+
+
+def pixel_area_m2(lat, zoom=COVERAGE_ZOOM):
+    return (METERS_PER_PX_Z0 * np.cos(np.radians(lat)) / 2.0 ** zoom) ** 2
+
+
+def polygon_spans(px, py):
+    """
+    Scanline spans of N convex quads (pixel coords (N,4)):
+    (rows, col_first, col_last) for every pixel row whose centre lies inside.
+    """
+    y0 = np.ceil(py.min(axis=1) - 0.5).astype(np.int64)
+    y1 = np.floor(py.max(axis=1) - 0.5).astype(np.int64)
+    n_rows = np.maximum(y1 - y0 + 1, 0)
+    quad = np.repeat(np.arange(px.shape[0]), n_rows)
+    rows = np.arange(n_rows.sum()) - np.repeat(np.cumsum(n_rows) - n_rows, n_rows) + y0[quad]
+    yc = rows + 0.5
+
+    ax, ay = px[quad], py[quad]
+    bx, by = np.roll(ax, -1, axis=1), np.roll(ay, -1, axis=1)
+    lo, hi = np.minimum(ay, by), np.maximum(ay, by)
+    cross = (yc[:, None] >= lo) & (yc[:, None] <= hi) & (hi > lo)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = ax + (yc[:, None] - ay) * (bx - ax) / (by - ay)
+    x_min = np.where(cross, x, np.inf).min(axis=1)
+    x_max = np.where(cross, x, -np.inf).max(axis=1)
+    c0 = np.ceil(x_min - 0.5)
+    c1 = np.floor(x_max - 0.5)
+    ok = np.isfinite(c0) & np.isfinite(c1) & (c1 >= c0)
+    return rows[ok], c0[ok].astype(np.int64), c1[ok].astype(np.int64)
+
+
+# ---------------------------------------------------------------------------
+# RASTER
+# ---------------------------------------------------------------------------
+class CoverageRaster:
+    """Sparse tiled dwell raster; tiles hold row-wise difference arrays."""
+
+    def __init__(self, zoom=COVERAGE_ZOOM):
+        self.zoom = zoom
+        self.tiles = {}             # (tx, ty) -> int32 (TILE, TILE + 1)
+        self.dirty = set()
+        self.frames = 0
+        self.valid_frames = 0
+        self.clipped_frames = 0
+        self.first_ts = None
+        self.last_ts = None
+
+    def add_frames(self, frames):
+        """Rasterize a batch of frames ({field: array} with FRAME_FIELDS)."""
+        n = len(frames["lat"])
+        if not n:
+            return 0
+        self.frames += n
+        c_lat, c_lon, valid, clipped = footprints(
+            frames["lat"], frames["lon"], frames["height"], frames["pitch"],
+            frames["yaw"], frames["fov_h"], frames["fov_v"])
+        self.valid_frames += int(valid.sum())
+        self.clipped_frames += int(clipped.sum())
+        ts = np.asarray(frames["ts"])
+        self.first_ts = int(ts.min()) if self.first_ts is None else min(self.first_ts, int(ts.min()))
+        self.last_ts = int(ts.max()) if self.last_ts is None else max(self.last_ts, int(ts.max()))
+        if not valid.any():
+            return 0
+        px, py = mercator_pixels(c_lat[valid], c_lon[valid], self.zoom)
+        self.add_spans(*polygon_spans(px, py))
+        return int(valid.sum())
+
+    def add_spans(self, rows, c0, c1):
+        # Cut spans at tile columns
+        t0, t1 = c0 // TILE, c1 // TILE
+        pieces = t1 - t0 + 1
+        idx = np.repeat(np.arange(rows.size), pieces)
+        tc = t0[idx] + (np.arange(idx.size) - np.repeat(np.cumsum(pieces) - pieces, pieces))
+        ls = np.maximum(c0[idx], tc * TILE) - tc * TILE
+        le = np.minimum(c1[idx], tc * TILE + TILE - 1) - tc * TILE
+        tr, lr = rows[idx] // TILE, rows[idx] % TILE
+
+        key = tr * (1 << 32) + tc
+        order = np.argsort(key, kind="stable")
+        key, lr, ls, le = key[order], lr[order], ls[order], le[order]
+        bounds = np.flatnonzero(np.r_[True, key[1:] != key[:-1], True])
+        width = TILE + 1
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            k = int(key[a])
+            tile = (k & 0xFFFFFFFF, k >> 32)
+            diff = self.tiles.get(tile)
+            if diff is None:
+                diff = self.tiles[tile] = np.zeros((TILE, width), dtype=np.int32)
+            flat = diff.reshape(-1)
+            flat += np.bincount(lr[a:b] * width + ls[a:b], minlength=flat.size).astype(np.int32)
+            flat -= np.bincount(lr[a:b] * width + le[a:b] + 1, minlength=flat.size).astype(np.int32)
+            self.dirty.add(tile)
+
+    def counts(self, tile):
+        """Frames-seen counts of one tile (TILE x TILE)."""
+        return np.cumsum(self.tiles[tile], axis=1)[:, :TILE]
+
+    def stats(self):
+        covered = 0.0
+        dwell = np.zeros(len(DWELL_EDGES), dtype=np.float64)
+        pixels = 0
+        for (tx, ty) in self.tiles:
+            counts = self.counts((tx, ty))
+            area = pixel_area_m2(pixel_lat(np.arange(TILE) + ty * TILE + 0.5, self.zoom), self.zoom)
+            seen = counts > 0
+            pixels += int(seen.sum())
+            covered += float((seen * area[:, None]).sum())
+            level = np.searchsorted(DWELL_EDGES, counts, side="right")
+            dwell += np.bincount(level.ravel(), weights=np.broadcast_to(area[:, None], counts.shape).ravel(),
+                                 minlength=len(DWELL_EDGES) + 1)[1:]
+        return {
+            "zoom": self.zoom,
+            "frames": self.frames,
+            "footprint_frames": self.valid_frames,
+            "clipped_frames": self.clipped_frames,
+            "tiles": len(self.tiles),
+            "covered_pixels": pixels,
+            "covered_m2": round(covered, 1),
+            "dwell_m2": {f">={edge}": round(float(a), 1) for edge, a in zip(DWELL_EDGES, dwell)},
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts,
+        }
+
+    def export(self, out_dir, dirty_only=False):
+        """Write {z}/{x}/{y}.png + .npy for (dirty) tiles and coverage.json."""
+        tiles = list(self.dirty) if dirty_only else list(self.tiles)
+        for tx, ty in tiles:
+            counts = self.counts((tx, ty))
+            path = os.path.join(out_dir, str(self.zoom), str(tx))
+            os.makedirs(path, exist_ok=True)
+            np.save(os.path.join(path, f"{ty}.npy"), np.minimum(counts, 65535).astype(np.uint16))
+            write_png(os.path.join(path, f"{ty}.png"),
+                      DWELL_COLORS[np.searchsorted(DWELL_EDGES, counts, side="right")])
+        self.dirty.clear()
+        os.makedirs(out_dir, exist_ok=True)
+        stats = self.stats()
+        tmp = os.path.join(out_dir, "coverage.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(stats, f, indent=2)
+        os.replace(tmp, os.path.join(out_dir, "coverage.json"))
+        return len(tiles), stats
+
+
+# ---------------------------------------------------------------------------
+# OSD
+# ---------------------------------------------------------------------------
+def pose_from_osd(payload, lens=LENS):
+    """One frame tuple (FRAME_FIELDS order) from a full aircraft OSD payload, or None."""
+    data = payload.get("data")
+    if not isinstance(data, dict) or "latitude" not in data:
+        return None
+    gimbal = next((v for k, v in data.items() if PAYLOAD_KEY_RE.match(k) and isinstance(v, dict)
+                   and "gimbal_pitch" in v), None)
+    if gimbal is None:
+        return None
+    camera = next((c for c in data.get("cameras") or []
+                   if isinstance(c, dict) and c.get("payload_index") == gimbal.get("payload_index")), None)
+    if camera is None or f"{lens}_fov_h" not in camera:
+        return None
+    return (payload.get("timestamp", 0), data["latitude"], data["longitude"], data.get("height", 0.0),
+            gimbal["gimbal_pitch"], gimbal.get("gimbal_yaw", data.get("attitude_head", 0.0)),
+            camera[f"{lens}_fov_h"], camera[f"{lens}_fov_v"])
+
+
+def frames_from_rows(rows):
+    arr = np.asarray(rows, dtype=np.float64).reshape(-1, len(FRAME_FIELDS))
+    return {name: arr[:, i] for i, name in enumerate(FRAME_FIELDS)}
+
+
+def read_recordings(paths):
+    """(topic, payload) of every OSD record in flight_recorder logs."""
+    for path in paths:
+        for _, topic, payload in iter_records(path):
+            if topic.endswith("/osd"):
+                yield topic, payload
+
+
+class LiveCoverage:
+    """Per-serial rasters fed frame by frame; rasterized in FLUSH_S batches."""
+
+    def __init__(self, out_dir=COVERAGE_DIR, lens=LENS, zoom=COVERAGE_ZOOM):
+        self.out_dir = out_dir
+        self.lens = lens
+        self.zoom = zoom
+        self.rasters = {}
+        self.pending = {}
+        self.poseless = {}          # serial -> aircraft frames seen without any pose yet
+        self.last_flush = time.monotonic()
+        self.last_export = self.last_flush
+
+    def update(self, serial, payload):
+        pose = pose_from_osd(payload, self.lens)
+        if pose is not None:
+            self.pending.setdefault(serial, []).append(pose)
+            self.poseless.pop(serial, None)
+        elif serial not in self.rasters and "latitude" in (payload.get("data") or {}):
+            n = self.poseless[serial] = self.poseless.get(serial, 0) + 1
+            if n == POSELESS_WARN:
+                logger.warning(f"⚠️ {serial}: {n} aircraft OSD frames and no camera pose "
+                               f"(no gimbal / cameras[].{self.lens}_fov_h)")
+
+    def tick(self):
+        now = time.monotonic()
+        if now - self.last_flush >= FLUSH_S:
+            self.flush()
+        if now - self.last_export >= EXPORT_S:
+            self.export()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        for serial, rows in self.pending.items():
+            if rows:
+                raster = self.rasters.get(serial)
+                if raster is None:
+                    raster = self.rasters[serial] = CoverageRaster(self.zoom)
+                raster.add_frames(frames_from_rows(rows))
+        self.pending = {}
+
+    def export(self):
+        self.last_export = time.monotonic()
+        for serial, raster in self.rasters.items():
+            if raster.dirty:
+                n, stats = raster.export(os.path.join(self.out_dir, serial), dirty_only=True)
+                logger.info(f"🗺️  {serial}: {stats['covered_m2'] / 1e4:.2f} ha covered, {n} tile(s) updated")
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def cmd_batch(args):
+    t0 = time.perf_counter()
+    rows = {}
+    aircraft_frames = {}
+    for topic, payload in read_recordings(args.logs):
+        serial = payload.get("gateway") or topic.split("/")[2]
+        if "latitude" in (payload.get("data") or {}):
+            aircraft_frames[serial] = aircraft_frames.get(serial, 0) + 1
+        pose = pose_from_osd(payload, args.lens)
+        if pose is not None:
+            rows.setdefault(serial, []).append(pose)
+    t1 = time.perf_counter()
+    for serial, n in aircraft_frames.items():
+        if serial not in rows:
+            print(f"   ⚠️  {serial}: {n} aircraft OSD frames but no camera pose "
+                  f"(no gimbal / cameras[].{args.lens}_fov_h: slim recording or other payload?)")
+    if aircraft_frames and not rows:
+        print("❌ No camera poses in any log.")
+        raise SystemExit(1)
+    for serial, frames in rows.items():
+        raster = CoverageRaster(args.zoom)
+        raster.add_frames(frames_from_rows(frames))
+        n, stats = raster.export(os.path.join(args.out, serial))
+        print(f"   ✈️  {serial}: {stats['frames']} frames, {stats['covered_m2'] / 1e4:.2f} ha covered, "
+              f"{n} tile(s) -> {os.path.join(args.out, serial)}")
+    print(f"🗺️  Parsed in {t1 - t0:.2f}s, rasterized + exported in {time.perf_counter() - t1:.2f}s")
+
+
+def cmd_live(args):
+    import paho.mqtt.client as mqtt
+    from static_dedup import StaticCache
+
+    cache = StaticCache()
+    live = LiveCoverage(args.out, args.lens, args.zoom)
+
+    def on_message(client, userdata, msg):
+        try:
+            payload = cache.on_message(msg.topic, msg.payload)
+        except ValueError:
+            return
+        if payload is not None:
+            live.update(msg.topic.split("/")[2], payload)
+
+    client = mqtt.Client(client_id="autel_camera_coverage", protocol=mqtt.MQTTv311)
+    client.on_message = on_message
+    client.connect(args.broker, args.port, 60)
+    client.subscribe([("thing/product/+/osd", 0), ("thing/product/+/static", 1)])
+    client.loop_start()
+    print(f"🗺️  Live coverage -> {args.out}/<serial>/{args.zoom}/x/y.png")
+    try:
+        while True:
+            time.sleep(0.2)
+            live.tick()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        live.flush()
+        live.export()
+
+
+def survey_frames(minutes=20, rate_hz=10, height=80.0, speed=8.0, spacing=60.0):
+    """Synthetic lawnmower survey with a nadir gimbal."""
+    n = int(minutes * 60 * rate_hz)
+    s = np.arange(n) * speed / rate_hz
+    leg = 600.0
+    k = (s // (leg + spacing)).astype(np.int64)
+    pos = s % (leg + spacing)
+    along = np.where(k % 2 == 0, np.minimum(pos, leg), leg - np.minimum(pos, leg))
+    across = k * spacing + np.maximum(pos - leg, 0.0)
+    lat, lon = offset(60.3195, 24.8307, along, across)
+    return {"ts": 1765729922498 + np.arange(n) * 1000 // rate_hz, "lat": lat, "lon": lon,
+            "height": np.full(n, height), "pitch": np.full(n, -90.0),
+            "yaw": np.where(k % 2 == 0, 0.0, 180.0), "fov_h": np.full(n, 58.59527),
+            "fov_v": np.full(n, 45.456676)}
+
+
+def cmd_bench(args):
+    frames = survey_frames(args.minutes)
+    n = frames["lat"].size
+
+    raster = CoverageRaster(args.zoom)
+    t0 = time.perf_counter()
+    raster.add_frames(frames)
+    batch_s = time.perf_counter() - t0
+
+    live = CoverageRaster(args.zoom)
+    step = 10                       # One FLUSH_S batch at 10 Hz
+    t0 = time.perf_counter()
+    for i in range(0, n, step):
+        live.add_frames({k: v[i:i + step] for k, v in frames.items()})
+    live_s = time.perf_counter() - t0
+    same = all(np.array_equal(raster.counts(t), live.counts(t)) for t in raster.tiles)
+
+    t0 = time.perf_counter()
+    stats = raster.stats()
+    stats_s = time.perf_counter() - t0
+    fh, fv = math.radians(58.59527), math.radians(45.456676)
+    nadir = (2 * 80 * math.tan(fh / 2)) * (2 * 80 * math.tan(fv / 2))
+    one = CoverageRaster(args.zoom)
+    one.add_frames({k: v[:1] for k, v in frames.items()})
+    print(f"🧪 {n} frames ({args.minutes} min survey at 10 Hz, 80 m, nadir), zoom {args.zoom}")
+    print(f"   Batch      : {batch_s:.3f}s ({n / batch_s:,.0f} frames/s)")
+    print(f"   Live (1 s) : {live_s:.3f}s ({n / live_s:,.0f} frames/s, {live_s / (n / step) * 1000:.2f} ms per flush)"
+          f" {'✅ identical' if same else '❌ differs'}")
+    print(f"   Stats      : {stats_s * 1000:.1f} ms | {stats['tiles']} tiles, {stats['covered_m2'] / 1e4:.2f} ha")
+    print(f"   Single frame footprint {one.stats()['covered_m2']:.0f} m² vs analytic {nadir:.0f} m²")
+
+
+def survey_payloads(frames, serial="SIM-4T"):
+    """Full aircraft OSD payloads (gimbal + recording camera) for synthetic frames."""
+    for i in range(frames["lat"].size):
+        yield {
+            "bid": f"bid-{i}", "gateway": serial, "timestamp": int(frames["ts"][i]),
+            "data": {
+                "latitude": float(frames["lat"][i]), "longitude": float(frames["lon"][i]),
+                "height": float(frames["height"][i]), "attitude_head": float(frames["yaw"][i]),
+                "10052-0-0": {"payload_index": "10052-0-0", "gimbal_pitch": float(frames["pitch"][i]),
+                              "gimbal_yaw": float(frames["yaw"][i])},
+                "cameras": [{"payload_index": "10052-0-0", "camera_mode": 1, "recording_state": 1,
+                             "record_time": i // 10, "remain_record_duration": 7200 - i // 10,
+                             "zoom_fov_h": float(frames["fov_h"][i]), "zoom_fov_v": float(frames["fov_v"][i]),
+                             "ir_fov_h": 41.0, "ir_fov_v": 33.0}],
+                "storage": {"total": 60000, "used": 1200},
+            },
+        }
+
+
+def cmd_roundtrip(args):
+    """
+    Default bridge publish path -> flight_recorder -> batch parsing: every
+    frame must come back as the same pose, with one static republish only.
+    """
+    import sys
+    import tempfile
+    # The offline recorder is part of the path under test
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+    from flight_recorder import Recorder
+    from static_dedup import StaticDeduper, static_topic
+
+    frames = survey_frames(args.minutes)
+    expected = []
+    dedup = StaticDeduper()
+    with tempfile.TemporaryDirectory() as tmp:
+        recorder = Recorder(os.path.join(tmp, "flight_roundtrip.jsonl"))
+        for payload in survey_payloads(frames):
+            expected.append(pose_from_osd(payload, args.lens))
+            sn = payload["gateway"]
+            slim, static = dedup.split(sn, payload)
+            if static:
+                recorder.on_message(static_topic(sn), json.dumps(static).encode())
+            recorder.on_message(f"thing/product/{sn}/osd", json.dumps(slim).encode())
+        poses = [pose_from_osd(p, args.lens) for _, p in read_recordings([recorder.filename])]
+
+    ok = poses == expected and None not in poses and dedup.updates == 1
+    print(f"🧪 {len(expected)} frames published slim+static ({dedup.updates} static update(s)), "
+          f"{len(poses)} recorded, {sum(p is not None for p in poses)} poses recovered, "
+          f"{recorder.unmerged} unmerged")
+    print("   ✅ round trip exact" if ok else "   ❌ round trip lost or changed frames")
+    if not ok:
+        raise SystemExit(1)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - [COVERAGE] - %(levelname)s - %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(description="Camera footprint projection and coverage rasters.")
+    parser.add_argument("--zoom", type=int, default=COVERAGE_ZOOM)
+    parser.add_argument("--lens", choices=("zoom", "ir"), default=LENS)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("batch", help="Coverage of recorded flights")
+    p.add_argument("logs", nargs="+")
+    p.add_argument("--out", default=COVERAGE_DIR)
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser("live", help="Accumulate coverage from the live OSD stream")
+    p.add_argument("--out", default=COVERAGE_DIR)
+    p.add_argument("--broker", default=os.getenv("MQTT_BROKER_HOST", "localhost"))
+    p.add_argument("--port", type=int, default=int(os.getenv("MQTT_PORT", 1883)))
+    p.set_defaults(func=cmd_live)
+
+    p = sub.add_parser("bench", help="Synthetic survey throughput")
+    p.add_argument("--minutes", type=float, default=20)
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("roundtrip", help="Check bridge slim/static -> recorder -> batch poses")
+    p.add_argument("--minutes", type=float, default=2)
+    p.set_defaults(func=cmd_roundtrip)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: derived_metrics.py
+Description: Incremental per-aircraft kinematics for normalized records.
+             One small state per serial, O(1) per packet:
+               home_distance   great-circle metres to the home point
+               distance_flown  path length since takeoff
+               ground_speed    m/s over the last step (smoothed)
+               heading_rate    deg/s, ±180° wrap removed (smoothed)
+               airborne        1 while in flight
+             Home is captured at takeoff (the last ground fix before the
+             height first exceeds AIRBORNE_HEIGHT_M) and kept after landing
+             until the next takeoff. Thresholds match scripts/flight_events.py.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+from geodesy import haversine_scalar as haversine
+
+AIRBORNE_HEIGHT_M = 1.0         # Same as flight_events.AIRBORNE_HEIGHT_M
+LANDED_AFTER_S = 5.0            # Same as flight_events.MAX_GROUND_GAP_S
+MAX_STEP_S = 5.0                # Longer gaps do not produce a speed/turn rate
+SMOOTHING = 0.3                 # EMA weight of the newest step (10 Hz GNSS jitter)
+
+
+class _Track:
+    __slots__ = ("ts", "lat", "lon", "heading", "home", "airborne", "ground_since",
+                 "distance", "speed", "turn")
+
+    def __init__(self):
+        self.ts = None
+        self.lat = None
+        self.lon = None
+        self.heading = None
+        self.home = None
+        self.airborne = False
+        self.ground_since = None
+        self.distance = 0.0
+        self.speed = 0.0
+        self.turn = 0.0
+
+
+class DerivedMetrics:
+    def __init__(self):
+        self.tracks = {}        # serial -> _Track
+        self.takeoffs = 0
+
+    def update(self, record):
+        """Add derived fields to a normalized drone record (in place)."""
+        lat, lon = record.get("lat", 0.0), record.get("lon", 0.0)
+        if lat == 0.0 and lon == 0.0:
+            return record           # No fix: nothing to derive from
+        serial = record.get("serial")
+        tr = self.tracks.get(serial)
+        if tr is None:
+            tr = self.tracks[serial] = _Track()
+        ts = record.get("timestamp", 0) / 1000.0
+        alt = record.get("alt", 0.0)
+        heading = record.get("heading")
+
+        # --- Takeoff / landing -------------------------------------------------
+        if alt > AIRBORNE_HEIGHT_M:
+            if not tr.airborne:
+                tr.airborne = True
+                tr.home = (tr.lat, tr.lon) if tr.lat is not None else (lat, lon)
+                tr.distance = 0.0
+                self.takeoffs += 1
+            tr.ground_since = None
+        elif tr.airborne:
+            if tr.ground_since is None:
+                tr.ground_since = ts
+            elif ts - tr.ground_since >= LANDED_AFTER_S:
+                tr.airborne = False
+        if tr.home is None:
+            tr.home = (lat, lon)    # Bridge started mid-flight: best effort
+
+        # --- Step ----------------------------------------------------------------
+        if tr.ts is not None and 0 < ts - tr.ts <= MAX_STEP_S:
+            dt = ts - tr.ts
+            step = haversine(tr.lat, tr.lon, lat, lon)
+            if tr.airborne:
+                tr.distance += step
+            tr.speed += SMOOTHING * (step / dt - tr.speed)
+            if heading is not None and tr.heading is not None:
+                dh = (heading - tr.heading + 180.0) % 360.0 - 180.0
+                tr.turn += SMOOTHING * (dh / dt - tr.turn)
+        elif tr.ts is None or ts - tr.ts > MAX_STEP_S:
+            tr.speed = 0.0
+            tr.turn = 0.0
+        if tr.ts is None or ts > tr.ts:
+            tr.ts, tr.lat, tr.lon, tr.heading = ts, lat, lon, heading
+
+        record["home_distance"] = round(haversine(tr.home[0], tr.home[1], lat, lon), 2)
+        record["distance_flown"] = round(tr.distance, 2)
+        record["ground_speed"] = round(tr.speed, 2)
+        record["heading_rate"] = round(tr.turn, 2)
+        record["airborne"] = int(tr.airborne)
+        return record
+
+    def stats(self):
+        return {"tracked_aircraft": len(self.tracks), "takeoffs": self.takeoffs}
@@ -0,0 +1,44 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: geodesy.py
+Description: Spherical-earth distance and offset helpers, shared so every
+             consumer uses one radius and one formula: derived_metrics.py
+             (per packet, scalar), camera_coverage.py (footprints) and,
+             through the scripts -> src import path,
+             scripts/track_kinematics.py (whole tracks, vectorized).
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8          # Mean radius (IUGG) for haversine
+
+
+def haversine(lat1, lon1, lat2, lon2, radius=EARTH_RADIUS_M):
+    """Great-circle distance in metres (inputs in degrees, broadcastable)."""
+    p1, p2 = np.radians(lat1), np.radians(lat2)
+    dphi = p2 - p1
+    dlmb = np.radians(np.asarray(lon2) - np.asarray(lon1))
+    a = np.sin(dphi * 0.5) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dlmb * 0.5) ** 2
+    return 2.0 * radius * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_scalar(lat1, lon1, lat2, lon2, radius=EARTH_RADIUS_M):
+    """haversine() for single floats with math (no NumPy per-call overhead)."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dphi = p2 - p1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi * 0.5) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlmb * 0.5) ** 2
+    return 2.0 * radius * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def offset(lat, lon, north, east, radius=EARTH_RADIUS_M):
+    """(lat, lon) moved by north/east metres (local flat earth, broadcastable)."""
+    lat = np.asarray(lat, dtype=np.float64)
+    return (lat + np.degrees(north / radius),
+            lon + np.degrees(east / (radius * np.cos(np.radians(lat)))))
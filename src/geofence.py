@@ -0,0 +1,336 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: geofence.py
+Description: Geofence evaluation for normalized aircraft records.
+             Polygons / MultiPolygons (holes allowed) load from a GeoJSON
+             FeatureCollection (GEOFENCE_FILE). At load time every fence is
+             rasterized onto a lat/lon grid of CELL_DEG cells; each cell keeps
+             only the fences whose bounding box touches it, as either
+               interior  cell entirely inside the fence: no test at all
+               boundary  the few fence edges crossing the cell, plus whether
+                         the cell centre is inside
+             A lookup is one dict probe for the aircraft's cell, then for
+             boundary entries a crossing count of the segment centre -> point
+             against that cell's edges only. Cost per packet depends on the
+             fences near the aircraft, not on how many are loaded.
+
+             GeofenceEngine tracks the fences each aircraft is inside and
+             returns enter / exit transitions; it also sets 'no_fly' (number
+             of no-fly fences the aircraft is in) on the record so alert
+             rules (alerts.py) can debounce breaches.
+
+             Feature properties: name, kind (no_fly | mission | ...;
+             default no_fly), min_alt / max_alt (optional height band, m).
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import math
+import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+GEOFENCE_FILE = os.getenv("GEOFENCE_FILE", "")
+GEOFENCE_TOPIC_ROOT = "geofence"    # geofence/{serial}
+CELL_DEG = float(os.getenv("GEOFENCE_CELL_DEG", 0.005))    # ~550 m of latitude
+KIND_NO_FLY = "no_fly"
+
+
+class Fence:
+    __slots__ = ("index", "id", "name", "kind", "min_alt", "max_alt", "rings", "bbox")
+
+    def __init__(self, index, fid, name, kind, rings, min_alt=None, max_alt=None):
+        self.index = index
+        self.id = fid
+        self.name = name
+        self.kind = kind
+        self.rings = rings          # [[(lon, lat), ...], ...] closed or open, even-odd fill
+        self.min_alt = min_alt
+        self.max_alt = max_alt
+        xs = [x for ring in rings for x, _ in ring]
+        ys = [y for ring in rings for _, y in ring]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+
+    def edges(self):
+        for ring in self.rings:
+            for i in range(len(ring)):
+                (x0, y0), (x1, y1) = ring[i - 1], ring[i]
+                if (x0, y0) != (x1, y1):
+                    yield (x0, y0, x1, y1)
+
+    def contains(self, lon, lat):
+        """Plain even-odd ray cast over every edge (reference / index build)."""
+        inside = False
+        for x0, y0, x1, y1 in self.edges():
+            if (y0 > lat) != (y1 > lat) and lon < x0 + (lat - y0) * (x1 - x0) / (y1 - y0):
+                inside = not inside
+        return inside
+
+    def in_band(self, alt):
+        if self.min_alt is not None and alt < self.min_alt:
+            return False
+        if self.max_alt is not None and alt > self.max_alt:
+            return False
+        return True
+
+
+def load_fences(path):
+    """Fences from a GeoJSON FeatureCollection (Polygon / MultiPolygon features)."""
+    with open(path) as f:
+        doc = json.load(f)
+    features = doc.get("features", []) if doc.get("type") == "FeatureCollection" else [doc]
+    fences = []
+    for i, feature in enumerate(features):
+        geom = feature.get("geometry") or {}
+        props = feature.get("properties") or {}
+        if geom.get("type") == "Polygon":
+            polygons = [geom["coordinates"]]
+        elif geom.get("type") == "MultiPolygon":
+            polygons = geom["coordinates"]
+        else:
+            logger.warning(f"⚠️ Geofence feature {i} skipped: geometry {geom.get('type')!r}")
+            continue
+        rings = [[(float(p[0]), float(p[1])) for p in ring] for poly in polygons for ring in poly if len(ring) >= 3]
+        if not rings:
+            continue
+        fid = feature.get("id", props.get("id", i))
+        fences.append(Fence(len(fences), fid, props.get("name", str(fid)), props.get("kind", KIND_NO_FLY), rings,
+                            props.get("min_alt"), props.get("max_alt")))
+    return fences
+
+
+def _crosses(ax, ay, bx, by, edge):
+    """Segment a-b crosses the edge (half-open at the edge end points, so vertices count once)."""
+    x0, y0, x1, y1 = edge
+    d3 = (bx - ax) * (y0 - ay) - (by - ay) * (x0 - ax)
+    d4 = (bx - ax) * (y1 - ay) - (by - ay) * (x1 - ax)
+    if (d3 > 0) == (d4 > 0):
+        return False
+    d1 = (x1 - x0) * (ay - y0) - (y1 - y0) * (ax - x0)
+    d2 = (x1 - x0) * (by - y0) - (y1 - y0) * (bx - x0)
+    return (d1 > 0) != (d2 > 0)
+
+
+class FenceIndex:
+    """Uniform lat/lon grid: (ix, iy) -> [(fence, edges or None, centre_inside, cx, cy), ...]."""
+
+    def __init__(self, fences, cell_deg=CELL_DEG):
+        self.fences = fences
+        self.cell = cell_deg
+        self.grid = {}
+        self.boundary_cells = 0
+        for fence in fences:
+            self._add(fence)
+
+    def _add(self, fence):
+        c = self.cell
+        x_min, y_min, x_max, y_max = fence.bbox
+        ix0, ix1 = math.floor(x_min / c), math.floor(x_max / c)
+        iy0, iy1 = math.floor(y_min / c), math.floor(y_max / c)
+
+        # Edges -> the cells they actually pass through
+        cell_edges = {}
+        for edge in fence.edges():
+            x0, y0, x1, y1 = edge
+            for ix in range(math.floor(min(x0, x1) / c), math.floor(max(x0, x1) / c) + 1):
+                for iy in range(math.floor(min(y0, y1) / c), math.floor(max(y0, y1) / c) + 1):
+                    if self._edge_hits_cell(edge, ix, iy):
+                        cell_edges.setdefault((ix, iy), []).append(edge)
+
+        # Scanline per row: centre-inside for every cell in the bbox
+        all_edges = list(fence.edges())
+        for iy in range(iy0, iy1 + 1):
+            cy = (iy + 0.5) * c
+            xs = sorted(x0 + (cy - y0) * (x1 - x0) / (y1 - y0)
+                        for x0, y0, x1, y1 in all_edges if (y0 > cy) != (y1 > cy))
+            for ix in range(ix0, ix1 + 1):
+                cx = (ix + 0.5) * c
+                inside = bisect.bisect_right(xs, cx) % 2 == 1
+                edges = cell_edges.get((ix, iy))
+                if edges:
+                    self.boundary_cells += 1
+                    entry = (fence, tuple(edges), inside, cx, cy)
+                elif inside:
+                    entry = (fence, None, True, cx, cy)
+                else:
+                    continue
+                self.grid.setdefault((ix, iy), []).append(entry)
+
+    def _edge_hits_cell(self, edge, ix, iy):
+        x0, y0, x1, y1 = edge
+        c = self.cell
+        sides = set()
+        for cx, cy in ((ix * c, iy * c), ((ix + 1) * c, iy * c), (ix * c, (iy + 1) * c), ((ix + 1) * c, (iy + 1) * c)):
+            sides.add((x1 - x0) * (cy - y0) - (y1 - y0) * (cx - x0) > 0)
+        return len(sides) == 2 or (x0 == x1 or y0 == y1)
+
+    def locate(self, lon, lat, alt=None):
+        """Fences containing the point (and its height, when a band is set)."""
+        entries = self.grid.get((math.floor(lon / self.cell), math.floor(lat / self.cell)))
+        if not entries:
+            return []
+        hits = []
+        for fence, edges, inside, cx, cy in entries:
+            if edges is not None:
+                x_min, y_min, x_max, y_max = fence.bbox
+                if lon < x_min or lon > x_max or lat < y_min or lat > y_max:
+                    continue
+                for edge in edges:
+                    if _crosses(cx, cy, lon, lat, edge):
+                        inside = not inside
+            if inside and (alt is None or fence.in_band(alt)):
+                hits.append(fence)
+        return hits
+
+    def stats(self):
+        return {"geofences": len(self.fences), "geofence_cells": len(self.grid),
+                "geofence_boundary_cells": self.boundary_cells}
+
+
+class GeofenceEngine:
+    def __init__(self, fences=None):
+        if fences is None:
+            fences = load_fences(GEOFENCE_FILE) if GEOFENCE_FILE else []
+        self.index = FenceIndex(fences)
+        self.inside = {}        # serial -> frozenset of fence indexes
+        self.transitions = 0
+        self.checked = 0
+        self.check_s = 0.0
+        if fences:
+            logger.info(f"🗺️ {len(fences)} geofences indexed into {len(self.index.grid)} cells")
+
+    def update(self, record):
+        """
+        Check one normalized drone record; returns enter / exit events and
+        sets record['no_fly'].
+        """
+        if not self.index.fences:
+            return []
+        lat, lon = record.get("lat", 0.0), record.get("lon", 0.0)
+        if lat == 0.0 and lon == 0.0:
+            return []               # No fix: keep the last known state
+        t0 = time.perf_counter()
+        hits = self.index.locate(lon, lat, record.get("alt"))
+        record["no_fly"] = sum(1 for f in hits if f.kind == KIND_NO_FLY)
+        serial = record.get("serial")
+        now = frozenset(f.index for f in hits)
+        before = self.inside.get(serial, frozenset())
+        events = []
+        if now != before:
+            self.inside[serial] = now
+            fences = self.index.fences
+            for i in sorted(now - before):
+                events.append(self._event(record, fences[i], "enter"))
+            for i in sorted(before - now):
+                events.append(self._event(record, fences[i], "exit"))
+        self.checked += 1
+        self.check_s += time.perf_counter() - t0
+        return events
+
+    def _event(self, record, fence, transition):
+        self.transitions += 1
+        return {
+            "timestamp": record.get("timestamp"),
+            "serial": record.get("serial"),
+            "transition": transition,
+            "fence_id": fence.id,
+            "fence": fence.name,
+            "kind": fence.kind,
+            "lat": record.get("lat"),
+            "lon": record.get("lon"),
+            "alt": record.get("alt"),
+        }
+
+    def stats(self):
+        stats = self.index.stats()
+        stats["geofence_transitions"] = self.transitions
+        stats["geofence_check_us"] = round(1e6 * self.check_s / self.checked, 2) if self.checked else 0.0
+        return stats
+
+
+def geofence_topic(event):
+    return f"{GEOFENCE_TOPIC_ROOT}/{event['serial']}"
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def synthetic_fences(n=300, vertices=48, seed=1, center=(22.5, 113.9), spread_deg=0.1):
+    """Random star-shaped fences (some with a hole) scattered around center."""
+    rng = random.Random(seed)
+    fences = []
+    for i in range(n):
+        lat0 = center[0] + rng.uniform(-spread_deg, spread_deg)
+        lon0 = center[1] + rng.uniform(-spread_deg, spread_deg)
+        radius = rng.uniform(0.001, 0.008)
+        ring = []
+        for k in range(vertices):
+            a = 2 * math.pi * k / vertices
+            r = radius * rng.uniform(0.5, 1.0)
+            ring.append((lon0 + r * math.cos(a), lat0 + r * math.sin(a)))
+        rings = [ring]
+        if i % 5 == 0:
+            rings.append([(lon0 + 0.2 * radius * math.cos(a), lat0 + 0.2 * radius * math.sin(a))
+                          for a in (2 * math.pi * k / 12 for k in range(12))])
+        fences.append(Fence(i, i, f"fence-{i}", KIND_NO_FLY if i % 2 else "mission", rings))
+    return fences
+
+
+def cmd_check(args):
+    fences = load_fences(args.file)
+    t0 = time.perf_counter()
+    index = FenceIndex(fences)
+    print(f"✅ {len(fences)} fences indexed in {time.perf_counter() - t0:.2f}s: {index.stats()}")
+    kinds = {}
+    for f in fences:
+        kinds[f.kind] = kinds.get(f.kind, 0) + 1
+    print(f"   kinds: {kinds}")
+
+
+def cmd_bench(args):
+    fences = synthetic_fences(args.fences)
+    t0 = time.perf_counter()
+    index = FenceIndex(fences)
+    print(f"🗺️ {len(fences)} fences indexed in {time.perf_counter() - t0:.2f}s: {index.stats()}")
+    rng = random.Random(2)
+    points = [(113.9 + rng.uniform(-0.11, 0.11), 22.5 + rng.uniform(-0.11, 0.11)) for _ in range(args.points)]
+
+    t0 = time.perf_counter()
+    fast = [sorted(f.index for f in index.locate(lon, lat)) for lon, lat in points]
+    indexed = time.perf_counter() - t0
+    sample = points[:args.verify]
+    t0 = time.perf_counter()
+    slow = [sorted(f.index for f in fences if f.contains(lon, lat)) for lon, lat in sample]
+    naive = time.perf_counter() - t0
+    mismatches = sum(a != b for a, b in zip(fast, slow))
+    print(f"   indexed: {1e6 * indexed / len(points):.2f} µs/point, "
+          f"naive loop: {1e6 * naive / len(sample):.0f} µs/point")
+    print(f"   {sum(map(len, fast)):,} hits, {mismatches} mismatches vs naive on {len(sample):,} points")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Geofence index for normalized telemetry")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("check", help="Load and index a GeoJSON fence file")
+    p.add_argument("file", nargs="?", default=GEOFENCE_FILE)
+    p.set_defaults(func=cmd_check)
+    p = sub.add_parser("bench", help="Indexed vs naive lookups on synthetic fences")
+    p.add_argument("--fences", type=int, default=300)
+    p.add_argument("--points", type=int, default=100000)
+    p.add_argument("--verify", type=int, default=5000, help="Points also checked with the naive loop")
+    p.set_defaults(func=cmd_bench)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
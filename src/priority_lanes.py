@@ -0,0 +1,137 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: priority_lanes.py
+Description: Two-lane ingest queue for the Telemetry Bridge.
+             EVENT packets (hms, alarms, mission progress) go into a FIFO
+             lane that is always served first and never sheds. OSD frames go
+             into a per-aircraft lane served round-robin; under overload the
+             oldest frames of an aircraft are merged away (the newest state
+             wins) and, past the global bound, the oldest frame of the most
+             backlogged aircraft is shed. Shed/merge counts and event wait
+             times are exposed through stats().
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+LANE_EVENT = "event"
+LANE_OSD = "osd"
+
+MAX_EVENTS = 10000      # Event backlog alarm level (events are still never dropped)
+MAX_OSD = 2000          # Total OSD frames held across all aircraft
+OSD_DEPTH = 4           # OSD frames kept per aircraft; older ones are merged away
+
+
+class PriorityLanes:
+    def __init__(self, max_events=MAX_EVENTS, max_osd=MAX_OSD, osd_depth=OSD_DEPTH, on_drop=None):
+        self.max_events = max_events
+        self.max_osd = max_osd
+        self.osd_depth = osd_depth
+        self.on_drop = on_drop          # Called with every OSD item that is discarded
+        self._cond = threading.Condition()
+        self._events = deque()          # (enqueued_at, item)
+        self._osd = OrderedDict()       # key -> deque of items, in round-robin order
+        self._osd_total = 0
+
+        self.events_in = 0
+        self.events_out = 0
+        self.event_overflow = 0         # Events accepted while above max_events
+        self.event_wait_max = 0.0
+        self.osd_in = 0
+        self.osd_out = 0
+        self.osd_merged = 0             # Replaced by a newer frame of the same aircraft
+        self.osd_shed = 0               # Dropped by the global bound
+
+    # --- Producer -----------------------------------------------------------
+    def put_event(self, item):
+        with self._cond:
+            self.events_in += 1
+            if len(self._events) >= self.max_events:
+                self.event_overflow += 1
+            self._events.append((time.monotonic(), item))
+            self._cond.notify()
+
+    def put_osd(self, key, item):
+        dropped = []
+        with self._cond:
+            self.osd_in += 1
+            frames = self._osd.get(key)
+            if frames is None:
+                frames = self._osd[key] = deque()
+            if len(frames) >= self.osd_depth:
+                dropped.append(frames.popleft())
+                self.osd_merged += 1
+            else:
+                self._osd_total += 1
+            frames.append(item)
+            if self._osd_total > self.max_osd:
+                dropped.append(self._shed_one())
+            self._cond.notify()
+        if self.on_drop is not None:
+            for item in dropped:
+                self.on_drop(item)
+
+    def _shed_one(self):
+        """Drop the oldest frame of the most backlogged aircraft (lock held)."""
+        key = max(self._osd, key=lambda k: len(self._osd[k]))
+        frames = self._osd[key]
+        item = frames.popleft()
+        if not frames:
+            del self._osd[key]
+        self._osd_total -= 1
+        self.osd_shed += 1
+        return item
+
+    # --- Consumer -----------------------------------------------------------
+    def get(self, timeout=None):
+        """
+        Next (lane, item), events first, OSD round-robin across aircraft.
+        Returns None on timeout.
+        """
+        with self._cond:
+            if not self._events and not self._osd:
+                self._cond.wait(timeout)
+            if self._events:
+                enqueued, item = self._events.popleft()
+                self.events_out += 1
+                self.event_wait_max = max(self.event_wait_max, time.monotonic() - enqueued)
+                return LANE_EVENT, item
+            if self._osd:
+                key, frames = next(iter(self._osd.items()))
+                item = frames.popleft()
+                self._osd_total -= 1
+                if frames:
+                    self._osd.move_to_end(key)
+                else:
+                    del self._osd[key]
+                self.osd_out += 1
+                return LANE_OSD, item
+            return None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._events) + self._osd_total
+
+    def stats(self, reset_wait=True):
+        with self._cond:
+            stats = {
+                "event_backlog": len(self._events),
+                "events_in": self.events_in,
+                "events_out": self.events_out,
+                "event_overflow": self.event_overflow,
+                "event_wait_max_ms": round(self.event_wait_max * 1000, 2),
+                "osd_backlog": self._osd_total,
+                "osd_aircraft": len(self._osd),
+                "osd_in": self.osd_in,
+                "osd_out": self.osd_out,
+                "osd_merged": self.osd_merged,
+                "osd_shed": self.osd_shed,
+            }
+            if reset_wait:
+                self.event_wait_max = 0.0
+        return stats
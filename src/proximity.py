@@ -0,0 +1,324 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: proximity.py
+Description: Multi-aircraft proximity / deconfliction on normalized records.
+             Latest position of every airborne aircraft lives in a spatial
+             hash of square cells of HSEP_M + 2 * MAX_SPEED_MPS * LOOKAHEAD_S,
+             so anything that could close to HSEP_M within LOOKAHEAD_S is in
+             the 3x3 neighbourhood. Each packet moves one aircraft
+             between cells and checks it against the aircraft in those 9
+             cells only, never the whole fleet.
+
+             Per candidate pair, both positions are brought to the newer
+             timestamp and projected with the aircraft velocity; the
+             closest point of approach in [0, LOOKAHEAD_S] is a conflict when
+             it is under HSEP_M horizontally and VSEP_M vertically. Vertical
+             uses rtk_hgt when both aircraft are RTK FIX, else alt_fused / alt
+             (height above each takeoff point: only comparable for aircraft
+             launched from the same site). Conflicts clear with CLEAR_FACTOR
+             hysteresis, on landing, or when an aircraft goes silent.
+             Records without a fix (lat = lon = 0) are ignored: the aircraft
+             keeps its last position until it lands or goes stale.
+
+             Velocity is the OSD NED vector (vel_n / vel_e) when present,
+             else horizontal_speed, else the derived ground_speed, along
+             heading. heading is the aircraft yaw, so without the NED vector
+             a multirotor flying sideways is projected along its nose; the
+             separation at t=0 is exact either way.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import argparse
+import math
+import os
+import random
+import time
+
+HSEP_M = float(os.getenv("PROX_HSEP_M", 30.0))           # Horizontal separation minimum
+VSEP_M = float(os.getenv("PROX_VSEP_M", 15.0))           # Vertical separation minimum
+LOOKAHEAD_S = float(os.getenv("PROX_LOOKAHEAD_S", 5.0))  # Projection horizon
+MAX_SPEED_MPS = 25.0            # Max 4T horizontal speed is ~23 m/s
+STALE_S = 5.0                   # Aircraft silent this long leave the hash
+CLEAR_FACTOR = 1.2              # Separation must exceed 1.2x the minimum to clear
+PROXIMITY_TOPIC = "proximity/conflicts"
+M_PER_DEG = 111320.0
+
+
+class _Aircraft:
+    __slots__ = ("serial", "ts", "lat", "lon", "alt", "rtk_hgt", "ve", "vn", "cell", "seen")
+
+    def __init__(self, serial):
+        self.serial = serial
+        self.cell = None
+
+
+class ProximityMonitor:
+    def __init__(self, hsep=HSEP_M, vsep=VSEP_M, lookahead=LOOKAHEAD_S, cell_m=None):
+        self.hsep = hsep
+        self.vsep = vsep
+        self.lookahead = lookahead
+        self.cell_m = cell_m or hsep + 2 * MAX_SPEED_MPS * lookahead
+        self.aircraft = {}      # serial -> _Aircraft (airborne, in the hash)
+        self.cells = {}         # (ix, iy) -> set of serials
+        self.conflicts = {}     # (serial_a, serial_b) sorted -> event that opened it
+        self.partners = {}      # serial -> set of serials it is in conflict with
+        self.pairs_checked = 0
+        self.updates = 0
+        self.update_s = 0.0
+        self.raised = 0
+
+    def _cell(self, lat, lon):
+        # Metres east use cos(lat) of the aircraft itself: the skew between
+        # neighbours a few hundred metres apart is far below one cell.
+        return (math.floor(lon * M_PER_DEG * math.cos(math.radians(lat)) / self.cell_m),
+                math.floor(lat * M_PER_DEG / self.cell_m))
+
+    def update(self, record, now=None):
+        """Move one aircraft in the hash and check it against its neighbours."""
+        lat, lon = record.get("lat", 0.0), record.get("lon", 0.0)
+        serial = record.get("serial")
+        if not record.get("airborne", 1):
+            return self._remove(serial, record.get("timestamp", 0))
+        if lat == 0.0 and lon == 0.0:
+            return []               # No fix: keep the last position until it goes stale
+        t0 = time.perf_counter()
+        ac = self.aircraft.get(serial)
+        if ac is None:
+            ac = self.aircraft[serial] = _Aircraft(serial)
+        ac.ts = record.get("timestamp", 0) / 1000.0
+        ac.seen = time.monotonic() if now is None else now
+        ac.lat, ac.lon = lat, lon
+        ac.alt = record.get("alt_fused", record.get("alt", 0.0))
+        ac.rtk_hgt = record.get("rtk_hgt") if record.get("rtk_status") == "FIX" else None
+        if "vel_n" in record and "vel_e" in record:
+            ac.ve, ac.vn = record["vel_e"], record["vel_n"]
+        else:
+            speed = record.get("horizontal_speed", record.get("ground_speed", 0.0))
+            heading = math.radians(record.get("heading", 0.0))
+            ac.ve, ac.vn = speed * math.sin(heading), speed * math.cos(heading)
+
+        cell = self._cell(lat, lon)
+        if cell != ac.cell:
+            if ac.cell is not None:
+                members = self.cells[ac.cell]
+                members.discard(serial)
+                if not members:
+                    del self.cells[ac.cell]
+            self.cells.setdefault(cell, set()).add(serial)
+            ac.cell = cell
+
+        events = []
+        ix, iy = cell
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                members = self.cells.get((ix + dx, iy + dy))
+                if not members:
+                    continue
+                for other in members:
+                    if other != serial:
+                        event = self._check(ac, self.aircraft[other])
+                        if event:
+                            events.append(event)
+
+        # Pairs that drifted out of the neighbourhood cannot be in conflict
+        for other in list(self.partners.get(serial, ())):
+            oc = self.aircraft[other].cell
+            if abs(oc[0] - ix) > 1 or abs(oc[1] - iy) > 1:
+                pair = (serial, other) if serial < other else (other, serial)
+                events.append(self._clear(pair, record.get("timestamp", 0), "separated"))
+
+        self.updates += 1
+        self.update_s += time.perf_counter() - t0
+        return events
+
+    def _separation(self, a, b):
+        """(horizontal now, vertical, CPA distance, CPA time, reference time) for a pair."""
+        # Relative position at the newer of the two fixes
+        t = max(a.ts, b.ts)
+        coslat = math.cos(math.radians(a.lat))
+        rx = (b.lon - a.lon) * M_PER_DEG * coslat + b.ve * (t - b.ts) - a.ve * (t - a.ts)
+        ry = (b.lat - a.lat) * M_PER_DEG + b.vn * (t - b.ts) - a.vn * (t - a.ts)
+        vx, vy = b.ve - a.ve, b.vn - a.vn
+        v2 = vx * vx + vy * vy
+        t_cpa = min(max(-(rx * vx + ry * vy) / v2, 0.0), self.lookahead) if v2 > 1e-9 else 0.0
+        horizontal = math.hypot(rx, ry)
+        cpa = math.hypot(rx + vx * t_cpa, ry + vy * t_cpa)
+        if a.rtk_hgt is not None and b.rtk_hgt is not None:
+            vertical = abs(b.rtk_hgt - a.rtk_hgt)
+        else:
+            vertical = abs(b.alt - a.alt)
+        return horizontal, vertical, cpa, t_cpa, t
+
+    def _check(self, a, b):
+        self.pairs_checked += 1
+        horizontal, vertical, cpa, t_cpa, t = self._separation(a, b)
+        pair = (a.serial, b.serial) if a.serial < b.serial else (b.serial, a.serial)
+        if pair in self.conflicts:
+            if cpa > self.hsep * CLEAR_FACTOR or vertical > self.vsep * CLEAR_FACTOR:
+                return self._clear(pair, int(t * 1000), "separated", horizontal, vertical)
+            return None
+        if cpa < self.hsep and vertical < self.vsep:
+            self.raised += 1
+            event = {
+                "timestamp": int(t * 1000),
+                "serial_a": pair[0],
+                "serial_b": pair[1],
+                "state": "conflict",
+                "severity": "critical" if horizontal < self.hsep else "warning",
+                "horizontal_m": round(horizontal, 1),
+                "vertical_m": round(vertical, 1),
+                "cpa_m": round(cpa, 1),
+                "cpa_s": round(t_cpa, 2),
+            }
+            self.conflicts[pair] = event
+            self.partners.setdefault(pair[0], set()).add(pair[1])
+            self.partners.setdefault(pair[1], set()).add(pair[0])
+            return event
+        return None
+
+    def _clear(self, pair, timestamp, reason, horizontal=None, vertical=None):
+        opened = self.conflicts.pop(pair)
+        for x, y in (pair, pair[::-1]):
+            partners = self.partners[x]
+            partners.discard(y)
+            if not partners:
+                del self.partners[x]
+        event = {
+            "timestamp": timestamp,
+            "serial_a": pair[0],
+            "serial_b": pair[1],
+            "state": "clear",
+            "severity": opened["severity"],
+            "reason": reason,
+            "duration_s": round(max(timestamp - opened["timestamp"], 0) / 1000.0, 2),
+        }
+        if horizontal is not None:
+            event["horizontal_m"] = round(horizontal, 1)
+            event["vertical_m"] = round(vertical, 1)
+        return event
+
+    def _remove(self, serial, timestamp, reason="landed"):
+        ac = self.aircraft.pop(serial, None)
+        if ac is None:
+            return []
+        members = self.cells.get(ac.cell)
+        if members is not None:
+            members.discard(serial)
+            if not members:
+                del self.cells[ac.cell]
+        return [self._clear((serial, other) if serial < other else (other, serial), timestamp, reason)
+                for other in list(self.partners.get(serial, ()))]
+
+    def expire(self, now=None):
+        """Drop aircraft silent for STALE_S (clears their conflicts)."""
+        now = time.monotonic() if now is None else now
+        events = []
+        for serial in [s for s, ac in self.aircraft.items() if now - ac.seen >= STALE_S]:
+            ac = self.aircraft[serial]
+            events.extend(self._remove(serial, int(ac.ts * 1000), "stale"))
+        return events
+
+    def stats(self):
+        return {
+            "proximity_aircraft": len(self.aircraft),
+            "proximity_cells": len(self.cells),
+            "proximity_conflicts": len(self.conflicts),
+            "proximity_raised": self.raised,
+            "proximity_update_us": round(1e6 * self.update_s / self.updates, 2) if self.updates else 0.0,
+        }
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def synthetic_fleet(aircraft=100, seconds=60, hz=5, area_m=3000.0, seed=1):
+    """Normalized records for a fleet flying straight legs inside a square area."""
+    rng = random.Random(seed)
+    lat0, lon0 = 22.5, 113.9
+    coslat = math.cos(math.radians(lat0))
+    state = []
+    for i in range(aircraft):
+        state.append([rng.uniform(0, area_m), rng.uniform(0, area_m), rng.uniform(40, 60),
+                      rng.uniform(0, 360), rng.uniform(3, 15)])
+    dt = 1.0 / hz
+    for step in range(int(seconds * hz)):
+        ts = 1_700_000_000_000 + int(step * dt * 1000)
+        for i, s in enumerate(state):
+            x, y, alt, heading, speed = s
+            if rng.random() < 0.01:
+                s[3] = heading = rng.uniform(0, 360)
+            x += speed * math.sin(math.radians(heading)) * dt
+            y += speed * math.cos(math.radians(heading)) * dt
+            if not (0 <= x <= area_m and 0 <= y <= area_m):
+                s[3] = heading = (heading + 180.0) % 360.0
+                x, y = min(max(x, 0), area_m), min(max(y, 0), area_m)
+            s[0], s[1] = x, y
+            yield {
+                "timestamp": ts, "device_type": "drone", "serial": f"SIM{i:04d}",
+                "lat": lat0 + y / M_PER_DEG, "lon": lon0 + x / (M_PER_DEG * coslat),
+                "alt": alt, "alt_fused": alt, "heading": heading, "ground_speed": speed,
+                "rtk_status": "NONE", "airborne": 1,
+            }
+
+
+def conflicting_pairs(monitor, neighbours_only):
+    """Pairs under both minima right now: all pairs, or only 3x3-cell neighbours."""
+    found = set()
+    for a in monitor.aircraft.values():
+        if neighbours_only:
+            ix, iy = a.cell
+            others = [o for dx in (-1, 0, 1) for dy in (-1, 0, 1) for o in monitor.cells.get((ix + dx, iy + dy), ())]
+        else:
+            others = monitor.aircraft
+        for other in others:
+            if a.serial < other:
+                _, vertical, cpa, _, _ = monitor._separation(a, monitor.aircraft[other])
+                if cpa < monitor.hsep and vertical < monitor.vsep:
+                    found.add((a.serial, other))
+    return found
+
+
+def cmd_bench(args):
+    records = list(synthetic_fleet(args.aircraft, args.seconds, area_m=args.area))
+    monitor = ProximityMonitor()
+    events = 0
+    worst = 0.0
+    t0 = time.perf_counter()
+    for rec in records:
+        t = time.perf_counter()
+        events += len(monitor.update(rec, now=rec["timestamp"] / 1000.0))
+        worst = max(worst, time.perf_counter() - t)
+    elapsed = time.perf_counter() - t0
+    n = args.aircraft
+    print(f"📊 {len(records):,} records, {n} aircraft in {(args.area / 1000) ** 2:.1f} km², cell {monitor.cell_m:.0f} m")
+    print(f"   {1e6 * elapsed / len(records):.2f} µs/record avg, {1e6 * worst:.0f} µs worst, "
+          f"{monitor.pairs_checked / len(records):.1f} pair checks/record (all pairs: {n - 1})")
+    print(f"   {events:,} conflict/clear events, {len(monitor.conflicts)} open")
+
+    # The hash must not miss anything an all-pairs pass finds
+    t0 = time.perf_counter()
+    reference = conflicting_pairs(monitor, neighbours_only=False)
+    full = time.perf_counter() - t0
+    hashed = conflicting_pairs(monitor, neighbours_only=True)
+    print(f"   final state: {len(reference)} conflicting pairs all-pairs ({1e3 * full:.1f} ms), "
+          f"{len(reference - hashed)} missed by the hash")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proximity / deconfliction on normalized telemetry")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("bench", help="Synthetic fleet load")
+    p.add_argument("--aircraft", type=int, default=100)
+    p.add_argument("--seconds", type=int, default=60)
+    p.add_argument("--area", type=float, default=3000.0, help="Side of the square area (m)")
+    p.set_defaults(func=cmd_bench)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: recordings.py
+Description: Reader for flight_recorder-format logs
+             ("<iso time> | <topic> | <json payload>"), as written by
+             scripts/flight_recorder.py and the bridge 'file' sink.
+             Shared by the bridge modules (uplink, camera_coverage) and,
+             through scripts/flight_logs.py, by the offline tools.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import json
+from datetime import datetime
+
+SEPARATOR = " | "
+
+
+def parse_line(line):
+    """
+    Split one recorder line into (time_ms, topic, payload).
+    The payload's own 'timestamp' (ms) wins over the recorder's wall clock.
+    Returns None for blank, truncated or non-JSON lines.
+    """
+    if isinstance(line, (bytes, bytearray)):
+        line = line.decode("utf-8", errors="replace")
+    parts = line.rstrip("\r\n").split(SEPARATOR, 2)
+    if len(parts) != 3:
+        return None
+    stamp, topic, raw = parts
+    try:
+        payload = json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+
+    ts = payload.get("timestamp")
+    if not isinstance(ts, (int, float)) or ts <= 0:
+        try:
+            ts = datetime.fromisoformat(stamp).timestamp() * 1000
+        except ValueError:
+            return None
+    return int(ts), topic, payload
+
+
+def iter_raw(path, start=0, end=None):
+    """
+    Like iter_records, but yields (topic, payload bytes) with the JSON left
+    as recorded (byte-exact replay, dictionary training).
+    """
+    sep = SEPARATOR.encode("utf-8")
+    with open(path, "rb") as f:
+        f.seek(start)
+        pos = start
+        for line in f:
+            pos += len(line)
+            parts = line.rstrip(b"\r\n").split(sep, 2)
+            if len(parts) == 3 and parts[2][:1] == b"{":
+                yield parts[1].decode("utf-8", errors="replace"), parts[2]
+            if end is not None and pos >= end:
+                break
+
+
+def iter_records(path, start=0, end=None):
+    """
+    Yield (time_ms, topic, payload) for every valid line of a log.
+    'start'/'end' are byte offsets that must sit on line boundaries
+    (see flight_logs.chunk_offsets) so a file can be split across worker
+    processes.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        pos = start
+        for line in f:
+            pos += len(line)
+            record = parse_line(line)
+            if record:
+                yield record
+            if end is not None and pos >= end:
+                break
@@ -0,0 +1,149 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: rollups.py
+Description: Streaming tumbling-window aggregation of normalized records.
+             Every serial keeps one open window per size (1s / 10s / 60s,
+             aligned to the epoch by record timestamp). Each record updates
+             count/sum/min/max/last, the RTK FIX/FLOAT/NONE counters and the
+             battery endpoints in O(1). A window closes when a record for a
+             later window arrives, or when the serial has been silent for
+             window + GRACE_S; closed windows come back as compact rollup
+             records so dashboards stop re-running aggregateWindow on raw data.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import time
+
+WINDOWS_S = (1, 10, 60)
+GRACE_S = 2.0
+STAT_FIELDS = ("alt", "batt", "sat_count")       # mean / min / max / last
+LAST_FIELDS = ("lat", "lon", "heading", "rtk_status", "device_type", "parent_serial")
+RTK_STATES = ("FIX", "FLOAT", "NONE")
+
+
+class _Window:
+    __slots__ = ("start", "seconds", "count", "late", "counts", "sums", "mins", "maxs", "lasts",
+                 "rtk", "first_ts", "last_ts", "first_batt", "arrival", "last")
+
+    def __init__(self, start, seconds):
+        self.start = start
+        self.seconds = seconds
+        self.count = 0
+        self.late = 0
+        n = len(STAT_FIELDS)
+        self.counts = [0] * n         # Records that carried the field
+        self.sums = [0.0] * n
+        self.mins = [float("inf")] * n
+        self.maxs = [float("-inf")] * n
+        self.lasts = [0.0] * n
+        self.rtk = [0, 0, 0]
+        self.first_ts = None
+        self.last_ts = None
+        self.first_batt = None
+        self.arrival = 0.0
+        self.last = {}
+
+    def add(self, record, ts, now):
+        self.count += 1
+        self.arrival = now
+        for i, field in enumerate(STAT_FIELDS):
+            v = record.get(field)
+            if v is None:
+                continue
+            self.counts[i] += 1
+            self.sums[i] += v
+            if v < self.mins[i]:
+                self.mins[i] = v
+            if v > self.maxs[i]:
+                self.maxs[i] = v
+            self.lasts[i] = v
+        # Aircraft without a drone_list entry carry no RTK / battery keys
+        status = record.get("rtk_status")
+        if status is not None:
+            self.rtk[RTK_STATES.index(status) if status in RTK_STATES else 2] += 1
+        batt = record.get("batt")
+        if batt is not None:
+            if self.first_ts is None:
+                self.first_ts = ts
+                self.first_batt = batt
+            self.last_ts = ts
+        for field in LAST_FIELDS:
+            if field in record:
+                self.last[field] = record[field]
+
+    def close(self, serial):
+        n = self.count
+        out = {"timestamp": self.start * 1000, "serial": serial, "window": f"{self.seconds}s", "count": n}
+        out.update(self.last)
+        for i, field in enumerate(STAT_FIELDS):
+            if not self.counts[i]:
+                continue
+            out[f"{field}_mean"] = round(self.sums[i] / self.counts[i], 4)
+            out[f"{field}_min"] = self.mins[i]
+            out[f"{field}_max"] = self.maxs[i]
+            out[f"{field}_last"] = self.lasts[i]
+        rtk_n = sum(self.rtk)
+        if rtk_n:
+            out["rtk_fix_ratio"] = round(self.rtk[0] / rtk_n, 4)
+            out["rtk_float_ratio"] = round(self.rtk[1] / rtk_n, 4)
+            out["rtk_none_ratio"] = round(self.rtk[2] / rtk_n, 4)
+        span_min = (self.last_ts - self.first_ts) / 60000.0 if self.first_ts is not None else 0.0
+        if span_min > 0 and "batt_last" in out:
+            out["batt_drain_per_min"] = round((self.first_batt - out["batt_last"]) / span_min, 3)
+        if self.late:
+            out["late"] = self.late
+        return out
+
+
+class RollupAggregator:
+    def __init__(self, windows=WINDOWS_S, grace_s=GRACE_S):
+        self.windows = tuple(windows)
+        self.grace_s = grace_s
+        self.open = {}          # serial -> [_Window per size]
+        self.closed = 0
+
+    def add(self, record):
+        """Fold one normalized record in; returns the rollups it closed."""
+        serial = record.get("serial")
+        if serial is None:
+            return []
+        ts = record.get("timestamp") or int(time.time() * 1000)
+        sec = ts // 1000
+        now = time.monotonic()
+        windows = self.open.get(serial)
+        if windows is None:
+            windows = self.open[serial] = [None] * len(self.windows)
+        out = []
+        for i, size in enumerate(self.windows):
+            start = sec - sec % size
+            w = windows[i]
+            if w is not None and start > w.start:
+                out.append(w.close(serial))
+                w = None
+            if w is None:
+                w = windows[i] = _Window(start, size)
+            elif start < w.start:
+                w.late += 1             # Out-of-order packet: fold into the open window
+            w.add(record, ts, now)
+        self.closed += len(out)
+        return out
+
+    def expire(self):
+        """Close windows of serials that went silent (no newer record will close them)."""
+        now = time.monotonic()
+        out = []
+        for serial, windows in list(self.open.items()):
+            for i, w in enumerate(windows):
+                if w is not None and now - w.arrival > w.seconds + self.grace_s:
+                    out.append(w.close(serial))
+                    windows[i] = None
+            if not any(windows):
+                del self.open[serial]
+        self.closed += len(out)
+        return out
+
+    def stats(self):
+        return {"rollup_serials": len(self.open), "rollups_closed": self.closed}
@@ -0,0 +1,135 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: shape_registry.py
+Description: Payload shape fingerprinting for the Telemetry Bridge.
+             A fingerprint is the ordered key set of the packet and of its
+             'data' object. The routing decision (drone / controller /
+             unknown) is cached per fingerprint, so known shapes skip the
+             membership checks. An unseen fingerprint whose deep path set
+             differs from the serial's previous shape raises a drift event
+             (added / removed paths) before dashboards break.
+
+             The cache is an LRU of MAX_SHAPES fingerprints; a sender cycling
+             through more shapes only costs evictions (counted, warned once)
+             and drift keeps comparing against each serial's last path set.
+             Limit: the fingerprint only covers the top-level and 'data'
+             keys, so a key added or removed deeper (e.g. data.battery.*)
+             without touching those two levels is not reported as drift.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ROUTE_DRONE = "drone"
+ROUTE_CONTROLLER = "controller"
+ROUTE_UNKNOWN = "unknown"
+
+MAX_SHAPES = 256        # LRU bound if a broken sender emits random shapes
+MAX_REPORTED_PATHS = 200
+
+
+def fingerprint(raw):
+    """Cheap shape key: top-level keys + 'data' keys, in wire order."""
+    data = raw.get("data")
+    if isinstance(data, dict):
+        return hash((tuple(raw), tuple(data)))
+    return hash((tuple(raw), None))
+
+
+def route_for(raw):
+    """The classification _normalize_payload used to do on every packet."""
+    data = raw.get("data")
+    if isinstance(data, dict):
+        if "battery" in data:
+            return ROUTE_DRONE
+        if "device_list" in data:
+            return ROUTE_CONTROLLER
+    return ROUTE_UNKNOWN
+
+
+def key_paths(obj, prefix="", out=None):
+    """Deep key paths; list items collapse to '[]' so list length is not drift."""
+    if out is None:
+        out = set()
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            path = f"{prefix}.{key}" if prefix else str(key)
+            out.add(path)
+            key_paths(value, path, out)
+    elif isinstance(obj, list):
+        for value in obj:
+            key_paths(value, f"{prefix}[]", out)
+    return out
+
+
+class ShapeRegistry:
+    def __init__(self, max_shapes=MAX_SHAPES):
+        self.max_shapes = max_shapes
+        self.routes = OrderedDict()     # fingerprint -> (route, frozenset of paths), LRU order
+        self.last_paths = {}            # serial -> path set of its previous packet
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.drift_events = 0
+
+    def classify(self, raw):
+        """
+        Return (route, drift_event). drift_event is None unless this packet
+        introduced a shape whose paths differ from its serial's last shape.
+        """
+        fp = fingerprint(raw)
+        cached = self.routes.get(fp)
+        serial = raw.get("gateway", "unknown")
+
+        if cached is not None:
+            self.hits += 1
+            self.routes.move_to_end(fp)
+            self.last_paths[serial] = cached[1]
+            return cached[0], None
+
+        self.misses += 1
+        route = route_for(raw)
+        paths = frozenset(key_paths(raw))
+        self.routes[fp] = (route, paths)
+        if len(self.routes) > self.max_shapes:
+            self.routes.popitem(last=False)
+            self.evicted += 1
+            if self.evicted == 1:
+                logger.warning(f"⚠️ More than {self.max_shapes} payload shapes: evicting least recently "
+                               f"used (see 'shapes_evicted' in bridge stats)")
+
+        event = None
+        prev_paths = self.last_paths.get(serial)
+        if prev_paths is not None and prev_paths != paths:
+            event = self._drift_event(serial, fp, route, prev_paths, paths)
+        elif prev_paths is None:
+            logger.info(f"🧬 New payload shape for {serial}: route={route}, {len(paths)} paths")
+        self.last_paths[serial] = paths
+        return route, event
+
+    def _drift_event(self, serial, fp, route, old, new):
+        self.drift_events += 1
+        added = sorted(new - old)
+        removed = sorted(old - new)
+        logger.warning(f"⚠️ Schema drift for {serial}: +{len(added)} / -{len(removed)} paths (route={route})")
+        return {
+            "timestamp": int(time.time() * 1000),
+            "serial": serial,
+            "route": route,
+            "fingerprint": f"{fp & 0xFFFFFFFFFFFFFFFF:016x}",
+            "added": added[:MAX_REPORTED_PATHS],
+            "removed": removed[:MAX_REPORTED_PATHS],
+            "added_count": len(added),
+            "removed_count": len(removed),
+        }
+
+    def stats(self):
+        return {"shapes": len(self.routes), "shape_hits": self.hits, "shape_misses": self.misses,
+                "shapes_evicted": self.evicted, "drift_events": self.drift_events}
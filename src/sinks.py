@@ -0,0 +1,335 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: sinks.py
+Description: Output sinks for the Telemetry Bridge.
+             The publisher emits Messages to a SinkSet; every sink owns a
+             bounded queue and a worker thread, so a slow or dead destination
+             only fills its own queue (and drops per its policy) instead of
+             stalling UDP reception or the other sinks. Urgent messages
+             (events, alerts, static) bypass the bound and are never
+             dropped by the queue policy.
+
+             Built-in sinks (BRIDGE_SINKS, comma separated):
+               mqtt_raw         thing/product/{sn}/osd|events|static (slim OSD)
+               mqtt_raw_full    thing/product/{sn}/osd|events (full vendor JSON)
+               mqtt_normalized  telemetry/normalized + diagnostics/* + alerts/* + geofence/*
+                                + proximity/conflicts
+               file             flight_logs/flight_*.jsonl (flight_recorder format)
+               udp_relay        raw datagrams to RELAY_UDP_TARGET (host:port)
+               uplink           batched/delta/deflate relay to UPLINK_TARGET (uplink.py)
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Message kinds
+KIND_OSD = "osd"                # Raw vendor OSD packet (full, byte-exact)
+KIND_SLIM = "slim"              # OSD packet without its static sub-trees (static_dedup.py)
+KIND_STATIC = "static"          # Retained static sub-trees, sent on change (urgent)
+KIND_EVENT = "event"            # Raw vendor event packet (urgent)
+KIND_NORMALIZED = "normalized"  # Bridge normalized record
+KIND_DIAGNOSTIC = "diagnostic"  # Bridge health / drift / stats
+KIND_ALERT = "alert"            # Alert / geofence / proximity events (urgent)
+
+DROP_OLDEST = "drop_oldest"     # Keep the freshest data (live telemetry)
+DROP_NEWEST = "drop_newest"     # Keep what is queued (ordered archives)
+
+QUEUE_SIZE = 5000
+FILE_FLUSH_S = 1.0
+
+# paho.mqtt.client publish() return codes (sinks.py itself does not need paho)
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+MQTT_ERR_QUEUE_SIZE = 15
+
+Message = namedtuple("Message", "kind topic payload qos retain urgent")
+_IDLE = object()
+
+
+def message(kind, topic, payload, qos=0, retain=False):
+    return Message(kind, topic, payload, qos, retain, kind in (KIND_EVENT, KIND_ALERT, KIND_STATIC))
+
+
+class Sink:
+    """
+    Base sink: subclasses implement write(msg) and optionally open()/close()/idle().
+    write() returns False when the destination discarded the message (counted
+    as dropped); exceptions are counted as errors.
+    """
+    kinds = frozenset()
+    idle_s = 0.5        # Worker wake-up interval while the queue is empty
+
+    def __init__(self, name, kinds=None, maxsize=QUEUE_SIZE, policy=DROP_OLDEST):
+        self.name = name
+        if kinds is not None:
+            self.kinds = frozenset(kinds)
+        self.maxsize = maxsize
+        self.policy = policy
+        self._urgent = deque()
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        self.accepted = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self._rate_mark = (time.monotonic(), 0)
+
+    # --- Lifecycle --------------------------------------------------------
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def write(self, msg):
+        raise NotImplementedError
+
+    def start(self):
+        self.open()
+        self._running = True
+        self._thread = threading.Thread(target=self._work, name=f"sink-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+        self.close()
+
+    # --- Queue ------------------------------------------------------------
+    def submit(self, msg):
+        """Non-blocking enqueue; applies the drop policy when full."""
+        with self._cond:
+            self.accepted += 1
+            if msg.urgent:
+                self._urgent.append(msg)
+            elif len(self._queue) >= self.maxsize:
+                self.dropped += 1
+                if self.policy == DROP_NEWEST:
+                    return
+                self._queue.popleft()
+                self._queue.append(msg)
+            else:
+                self._queue.append(msg)
+            self._cond.notify()
+
+    def _next(self):
+        with self._cond:
+            if self._running and not self._urgent and not self._queue:
+                self._cond.wait(self.idle_s)
+            if self._urgent:
+                return self._urgent.popleft()
+            if self._queue:
+                return self._queue.popleft()
+            return _IDLE if self._running else None
+
+    def idle(self):
+        """Called from the worker every idle_s seconds while the queue is empty."""
+
+    def _work(self):
+        while True:
+            msg = self._next()
+            if msg is None:
+                return
+            if msg is _IDLE:
+                self.idle()
+                continue
+            try:
+                if self.write(msg) is False:
+                    with self._cond:
+                        self.dropped += 1
+                else:
+                    self.written += 1
+            except Exception as e:
+                self.errors += 1
+                if self.errors % 100 == 1:
+                    logger.error(f"🔴 Sink {self.name} write failed ({self.errors} errors): {e}")
+
+    def stats(self):
+        now = time.monotonic()
+        with self._cond:
+            mark_t, mark_n = self._rate_mark
+            rate = (self.written - mark_n) / (now - mark_t) if now > mark_t else 0.0
+            self._rate_mark = (now, self.written)
+            return {
+                "accepted": self.accepted,
+                "written": self.written,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "backlog": len(self._queue) + len(self._urgent),
+                "rate": round(rate, 1),
+            }
+
+
+# ---------------------------------------------------------------------------
+# BUILT-IN SINKS
+# ---------------------------------------------------------------------------
+class MqttSink(Sink):
+    """
+    Publishes through its own paho client (one connection per sink), so the
+    packet-rate raw stream cannot fill the queue the alerts go through.
+    """
+
+    def __init__(self, name, client, kinds, **kw):
+        super().__init__(name, kinds, **kw)
+        self.client = client
+
+    def write(self, msg):
+        rc = self.client.publish(msg.topic, msg.payload, qos=msg.qos, retain=msg.retain).rc
+        if rc == MQTT_ERR_SUCCESS:
+            return True
+        # QoS>0 messages published while disconnected stay queued in paho
+        if rc == MQTT_ERR_NO_CONN and msg.qos > 0:
+            return True
+        if rc in (MQTT_ERR_NO_CONN, MQTT_ERR_QUEUE_SIZE):
+            if self.dropped % 100 == 0:
+                logger.warning(f"⚠️ Sink {self.name} publish dropped (rc={rc}, {self.dropped + 1} so far)")
+            return False
+        raise RuntimeError(f"publish to {msg.topic} failed (rc={rc})")
+
+
+class FileSink(Sink):
+    """Appends flight_recorder-format lines: '<iso> | <topic> | <json>'."""
+    kinds = frozenset({KIND_OSD, KIND_EVENT})
+
+    def __init__(self, name, log_dir=None, **kw):
+        kw.setdefault("policy", DROP_NEWEST)
+        super().__init__(name, **kw)
+        self.log_dir = log_dir or os.getenv("RECORD_DIR", "flight_logs")
+        self.path = None
+        self._fh = None
+        self._last_flush = time.monotonic()
+
+    def open(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        self.path = os.path.join(self.log_dir, f"flight_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+        self._fh = open(self.path, "ab", buffering=1024 * 1024)
+        logger.info(f"🔴 Recording to {self.path}")
+
+    def write(self, msg):
+        payload = msg.payload if isinstance(msg.payload, bytes) else msg.payload.encode("utf-8")
+        if b"\n" in payload:
+            payload = payload.replace(b"\r", b"").replace(b"\n", b" ")
+        self._fh.write(f"{datetime.now().isoformat()} | {msg.topic} | ".encode("utf-8") + payload + b"\n")
+        if time.monotonic() - self._last_flush >= FILE_FLUSH_S:
+            self._flush()
+
+    def idle(self):
+        self._flush()
+
+    def _flush(self):
+        if self._fh:
+            self._fh.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+
+
+class UdpRelaySink(Sink):
+    """Forwards raw datagrams unchanged (e.g. to a second ground station)."""
+    kinds = frozenset({KIND_OSD, KIND_EVENT})
+
+    def __init__(self, name, target=None, **kw):
+        super().__init__(name, **kw)
+        target = target or os.getenv("RELAY_UDP_TARGET", "")
+        host, _, port = target.rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError(f"RELAY_UDP_TARGET must be host:port, got '{target}'")
+        self.target = (host, int(port))
+        self.sock = None
+
+    def open(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def write(self, msg):
+        payload = msg.payload if isinstance(msg.payload, bytes) else msg.payload.encode("utf-8")
+        self.sock.sendto(payload, self.target)
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+
+def _uplink_sink():
+    from uplink import UplinkSink   # uplink.py builds on this module
+    return UplinkSink("uplink")
+
+
+# name -> factory(mqtt_connect) ; mqtt_connect(name) returns a connected
+# paho client owned by that sink. Extend with register_sink().
+SINK_TYPES = {
+    "mqtt_raw": lambda connect: MqttSink("mqtt_raw", connect("mqtt_raw"), {KIND_SLIM, KIND_STATIC, KIND_EVENT}),
+    "mqtt_raw_full": lambda connect: MqttSink("mqtt_raw_full", connect("mqtt_raw_full"), {KIND_OSD, KIND_EVENT}),
+    "mqtt_normalized": lambda connect: MqttSink("mqtt_normalized", connect("mqtt_normalized"),
+                                                {KIND_NORMALIZED, KIND_DIAGNOSTIC, KIND_ALERT}),
+    "file": lambda connect: FileSink("file"),
+    "udp_relay": lambda connect: UdpRelaySink("udp_relay"),
+    "uplink": lambda connect: _uplink_sink(),
+}
+DEFAULT_SINKS = "mqtt_raw,mqtt_normalized"
+
+
+def register_sink(name, factory):
+    SINK_TYPES[name] = factory
+
+
+class SinkSet:
+    """Fan-out of emitted messages to every sink accepting the message kind."""
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+        self._by_kind = {}
+        for sink in self.sinks:
+            for kind in sink.kinds:
+                self._by_kind.setdefault(kind, []).append(sink)
+
+    @classmethod
+    def from_names(cls, names, mqtt_connect):
+        sinks = []
+        for name in filter(None, (n.strip() for n in names.split(","))):
+            if name not in SINK_TYPES:
+                raise ValueError(f"Unknown sink '{name}' (known: {', '.join(sorted(SINK_TYPES))})")
+            sinks.append(SINK_TYPES[name](mqtt_connect))
+        return cls(sinks)
+
+    def start(self):
+        for sink in self.sinks:
+            sink.start()
+            logger.info(f"🔌 Sink {sink.name} started ({', '.join(sorted(sink.kinds))}, max {sink.maxsize}, {sink.policy})")
+
+    def stop(self):
+        for sink in self.sinks:
+            sink.stop()
+
+    def wants(self, kind):
+        return kind in self._by_kind
+
+    def emit(self, kind, topic, payload, qos=0, retain=False):
+        sinks = self._by_kind.get(kind)
+        if sinks:
+            msg = message(kind, topic, payload, qos, retain)
+            for sink in sinks:
+                sink.submit(msg)
+
+    def stats(self):
+        return {sink.name: sink.stats() for sink in self.sinks}
@@ -0,0 +1,156 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: static_dedup.py
+Description: Static sub-tree deduplication for the raw OSD republish path.
+             Sub-trees of 'data' that rarely change (cameras, device_list /
+             camera_list / video_list, storage, country, activation_time,
+             firmware) are hashed per serial. They are published to the
+             retained thing/product/{sn}/static topic only when the hash
+             changes; the high-rate osd topic carries the remaining 'slim'
+             payload plus 'static_version'. Per-second camera state
+             (record_time, recording_state, remain_*, photo_state) stays in
+             the slim packet as a cameras list of just those keys, so a
+             recording aircraft does not republish its static message on
+             every packet. The static message is also re-sent every
+             STATIC_RESEND_PACKETS slim packets per serial, so a subscriber
+             recovers if one was lost on the way. merge_static() /
+             StaticCache rebuild the full payload on the client side.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import hashlib
+import json
+
+STATIC_KEYS = (
+    "cameras",
+    "device_list",          # camera_list / video_list live underneath
+    "storage",
+    "country",
+    "activation_time",
+    "firmware_version",
+)
+# Keys of list entries that change while the rest of the entry does not;
+# they stay in the slim packet (same list position) and are merged back.
+VOLATILE_KEYS = {
+    "cameras": ("payload_index", "record_time", "recording_state", "remain_photo_num",
+                "remain_record_duration", "photo_state"),
+}
+VERSION_KEY = "static_version"
+# The static topic keeps these top-level keys so Telegraf tags/time still apply
+HEADER_KEYS = ("bid", "gateway", "timestamp")
+STATIC_RESEND_PACKETS = 600     # ~1 min of OSD at 10 Hz between unchanged re-sends
+
+
+def static_topic(serial):
+    return f"thing/product/{serial}/static"
+
+
+class StaticDeduper:
+    def __init__(self, keys=STATIC_KEYS, volatile=VOLATILE_KEYS, resend_every=STATIC_RESEND_PACKETS):
+        self.keys = keys
+        self.volatile = volatile
+        self.resend_every = resend_every
+        self.versions = {}      # serial -> current static version
+        self.since = {}         # serial -> slim packets since the static was last sent
+        self.packets = 0
+        self.updates = 0
+        self.resends = 0
+
+    def split(self, serial, payload):
+        """
+        Return (slim, static) for one parsed OSD payload. 'static' is None
+        unless this serial's static sub-trees changed (or were never sent).
+        The input dict is not modified.
+        """
+        data = payload.get("data")
+        if not isinstance(data, dict):
+            return payload, None
+        static = {k: data[k] for k in self.keys if k in data}
+        if not static:
+            return payload, None
+        self.packets += 1
+
+        slim_data = {k: v for k, v in data.items() if k not in static}
+        for key, volatile in self.volatile.items():
+            entries = static.get(key)
+            if isinstance(entries, list):
+                static[key] = [{k: v for k, v in e.items() if k not in volatile or k == "payload_index"}
+                               if isinstance(e, dict) else e for e in entries]
+                slim_data[key] = [{k: e[k] for k in volatile if k in e} if isinstance(e, dict) else {}
+                                  for e in entries]
+
+        blob = json.dumps(static, separators=(",", ":")).encode("utf-8")
+        version = hashlib.blake2b(blob, digest_size=8).hexdigest()
+
+        slim = dict(payload)
+        slim["data"] = slim_data
+        slim[VERSION_KEY] = version
+
+        if self.versions.get(serial) == version:
+            since = self.since[serial] + 1
+            if not self.resend_every or since < self.resend_every:
+                self.since[serial] = since
+                return slim, None
+            self.resends += 1
+        else:
+            self.versions[serial] = version
+            self.updates += 1
+        self.since[serial] = 0
+        message = {k: payload[k] for k in HEADER_KEYS if k in payload}
+        message[VERSION_KEY] = version
+        message["data"] = static
+        return slim, message
+
+    def stats(self):
+        return {"serials": len(self.versions), "packets": self.packets, "static_updates": self.updates,
+                "static_resends": self.resends}
+
+
+# ---------------------------------------------------------------------------
+# CLIENT SIDE
+# ---------------------------------------------------------------------------
+def merge_static(slim, static):
+    """
+    Rebuild the full OSD payload from a slim packet and its static message.
+    Returns None if the static message is for a different version.
+    """
+    version = slim.get(VERSION_KEY)
+    if version is None:
+        return slim
+    if static is None or static.get(VERSION_KEY) != version:
+        return None
+    full = {k: v for k, v in slim.items() if k != VERSION_KEY}
+    data = dict(slim.get("data") or {})
+    for key, value in (static.get("data") or {}).items():
+        state = data.get(key)
+        if key in VOLATILE_KEYS and isinstance(state, list) and isinstance(value, list):
+            # Static entry + its per-packet state, by list position
+            value = [{**e, **s} if isinstance(e, dict) and isinstance(s, dict) else e
+                     for e, s in zip(value, state + [{}] * (len(value) - len(state)))]
+        data[key] = value
+    full["data"] = data
+    return full
+
+
+class StaticCache:
+    """
+    Subscriber helper: subscribe to thing/product/+/osd and thing/product/+/static,
+    feed every message to on_message(); full payloads come back from it.
+    Slim packets that arrive before their static message return None.
+    """
+
+    def __init__(self):
+        self.static = {}    # serial -> latest static message
+
+    def on_message(self, topic, payload):
+        if isinstance(payload, (bytes, bytearray)):
+            payload = json.loads(payload)
+        parts = topic.split("/")
+        serial = parts[2] if len(parts) > 3 else payload.get("gateway")
+        if topic.endswith("/static"):
+            self.static[serial] = payload
+            return None
+        return merge_static(payload, self.static.get(serial))
@@ -0,0 +1,48 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: tiles.py
+Description: Web Mercator pixel math and a stdlib-only PNG writer for z/x/y
+             tile rasters. Shared by camera_coverage.py and, through the
+             scripts -> src import path, by scripts/heatmap_tiles.py.
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import math
+import os
+import struct
+import zlib
+
+import numpy as np
+
+TILE = 256
+MAX_LAT = 85.05112878           # Web Mercator latitude limit
+
+
+def mercator_pixels(lat, lon, zoom):
+    """Web Mercator global pixel coordinates (float) at zoom."""
+    size = TILE * 2.0 ** zoom
+    phi = np.radians(np.clip(lat, -MAX_LAT, MAX_LAT))
+    x = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0 * size
+    y = (1.0 - np.log(np.tan(phi) + 1.0 / np.cos(phi)) / math.pi) / 2.0 * size
+    return x, y
+
+
+def write_png(path, rgba):
+    """RGBA uint8 array -> PNG (stdlib zlib only), replaced atomically."""
+    h, w = rgba.shape[:2]
+    rows = np.zeros((h, 1 + 4 * w), dtype=np.uint8)
+    rows[:, 1:] = rgba.reshape(h, 4 * w)
+
+    def chunk(tag, body):
+        return struct.pack("!I", len(body)) + tag + body + struct.pack("!I", zlib.crc32(tag + body) & 0xFFFFFFFF)
+
+    data = b"".join((b"\x89PNG\r\n\x1a\n",
+                     chunk(b"IHDR", struct.pack("!IIBBBBB", w, h, 8, 6, 0, 0, 0)),
+                     chunk(b"IDAT", zlib.compress(rows.tobytes(), 1)),   # Sparse tiles: level 1 is ~as small
+                     chunk(b"IEND", b"")))
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(data)
+    os.replace(f"{path}.tmp", path)
@@ -0,0 +1,618 @@
+"""
+-----------------------------------------------------------------------------
+Script Name: uplink.py
+Description: Bandwidth-efficient telemetry uplink for the ZeroTier/LTE path
+             to remote mission control.
+
+             Sender (bridge sink "uplink"): raw OSD/event packets are batched
+             (BATCH_S) and delta-encoded per topic: each JSON payload is split
+             into a template (punctuation/whitespace) and its literals (keys,
+             strings, numbers); if the template matches the previous packet
+             of that topic only the changed literals are sent. Batches are
+             deflated with a preset dictionary trained on recorded payloads
+             and sent over one persistent TCP connection. Every batch is
+             acknowledged; on reconnect the session resumes from the last
+             acked batch (or restarts with full frames if the receiver lost
+             its state), so nothing in the unacked window is lost. A batch
+             the receiver cannot decode is not acked and forces the same
+             full-frame resync; if it fails again it is skipped and counted.
+
+             Receiver: rebuilds the byte-exact original payloads and
+             republishes them to the local broker on the original topics.
+
+             python uplink.py train flight_logs/*.jsonl     -> uplink_dict.bin
+             python uplink.py receive [--listen 0.0.0.0:9870]
+             python uplink.py bench flight_logs/*.jsonl     (loopback)
+Version:     1.0.0
+Author:      RW
+Date:        2025-12-19
+-----------------------------------------------------------------------------
+"""
+
+import argparse
+import logging
+import os
+import re
+import socket
+import socketserver
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, deque
+
+from recordings import iter_raw
+from sinks import Sink, KIND_OSD, KIND_EVENT
+
+logger = logging.getLogger(__name__)
+
+# CONFIGURATION
+UPLINK_TARGET = os.getenv("UPLINK_TARGET", "")              # host:port of the receiver
+UPLINK_LISTEN = os.getenv("UPLINK_LISTEN", "0.0.0.0:9870")
+DICT_FILE = os.getenv("UPLINK_DICT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "uplink_dict.bin"))
+BATCH_S = 0.2               # Max batching delay added to the live view
+BATCH_BYTES = 256 * 1024    # Flush early on raw size
+MAX_UNACKED = 1500          # Batches kept for resend (~5 min at BATCH_S)
+DICT_SIZE = 32 * 1024       # zlib uses at most a 32 KB preset dictionary
+RECONNECT_S = 2.0
+
+MAGIC = b"AUL1"
+HELLO = struct.Struct("!4s16sI")        # magic, session id, dictionary crc32
+WELCOME = struct.Struct("!BQ")          # status, last applied seq
+BATCH_HEADER = struct.Struct("!QI")     # seq, compressed length
+ACK = struct.Struct("!Q")
+STATUS_RESUME, STATUS_NEW, STATUS_DICT_MISMATCH = 0, 1, 2
+
+FRAME_FULL, FRAME_DELTA = b"F", b"D"
+_U16 = struct.Struct("!H")
+_U32 = struct.Struct("!I")
+_CHANGE = struct.Struct("!HH")
+
+# Literals: strings (with escapes), numbers, true/false/null. Everything in
+# between is the template, which stays identical while the payload shape does.
+LITERAL_RE = re.compile(rb'("(?:\\.|[^"\\])*"|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null)')
+
+
+# ---------------------------------------------------------------------------
+# DELTA CODEC
+# ---------------------------------------------------------------------------
+def tokenize(payload):
+    parts = LITERAL_RE.split(payload)
+    return parts[0::2], parts[1::2]
+
+
+def join_tokens(template, literals):
+    out = [None] * (len(template) + len(literals))
+    out[0::2] = template
+    out[1::2] = literals
+    return b"".join(out)
+
+
+class DeltaEncoder:
+    def __init__(self):
+        self.state = {}     # topic -> (template, literals)
+        self.full_frames = 0
+        self.delta_frames = 0
+
+    def reset(self):
+        self.state.clear()
+
+    def encode(self, topic, payload):
+        t = topic.encode("utf-8") if isinstance(topic, str) else topic
+        template, literals = tokenize(payload)
+        prev = self.state.get(t)
+        self.state[t] = (template, literals)
+        head = _U16.pack(len(t)) + t
+        if prev is None or prev[0] != template or len(literals) > 0xFFFF or len(payload) > 0xFFFF:
+            self.full_frames += 1
+            return FRAME_FULL + head + _U32.pack(len(payload)) + payload
+        changes = [_CHANGE.pack(i, len(lit)) + lit
+                   for i, (old, lit) in enumerate(zip(prev[1], literals)) if old != lit]
+        self.delta_frames += 1
+        return FRAME_DELTA + head + _U16.pack(len(changes)) + b"".join(changes)
+
+
+class DeltaDecoder:
+    def __init__(self):
+        self.state = {}     # topic -> (template, literals)
+
+    def decode(self, frames):
+        """Yield (topic, payload) for every frame of a decompressed batch."""
+        view = memoryview(frames)
+        pos = 0
+        while pos < len(view):
+            kind = bytes(view[pos:pos + 1])
+            (tlen,) = _U16.unpack_from(view, pos + 1)
+            topic = bytes(view[pos + 3:pos + 3 + tlen])
+            pos += 3 + tlen
+            if kind == FRAME_FULL:
+                (plen,) = _U32.unpack_from(view, pos)
+                payload = bytes(view[pos + 4:pos + 4 + plen])
+                pos += 4 + plen
+                self.state[topic] = tokenize(payload)
+            elif kind == FRAME_DELTA:
+                template, literals = self.state[topic]
+                literals = list(literals)
+                (count,) = _U16.unpack_from(view, pos)
+                pos += 2
+                for _ in range(count):
+                    idx, llen = _CHANGE.unpack_from(view, pos)
+                    literals[idx] = bytes(view[pos + 4:pos + 4 + llen])
+                    pos += 4 + llen
+                self.state[topic] = (template, literals)
+                payload = join_tokens(template, literals)
+            else:
+                raise ValueError(f"Unknown frame type {kind!r}")
+            yield topic.decode("utf-8"), payload
+
+
+# ---------------------------------------------------------------------------
+# DICTIONARY
+# ---------------------------------------------------------------------------
+def load_dictionary(path=DICT_FILE):
+    try:
+        with open(path, "rb") as f:
+            return f.read()[-DICT_SIZE:]
+    except OSError:
+        return b""
+
+
+def dict_id(dictionary):
+    return zlib.crc32(dictionary)
+
+
+def train_dictionary(messages, size=DICT_SIZE):
+    """
+    Build a deflate preset dictionary from (topic, payload) samples: the
+    frames the encoder actually produces, delta frames first and one full
+    frame per payload shape last (deflate favours the end of the dictionary).
+    """
+    encoder = DeltaEncoder()
+    fulls = {}
+    shape_counts = Counter()
+    deltas = deque(maxlen=512)
+    for topic, payload in messages:
+        t = topic.encode("utf-8")
+        frame = encoder.encode(t, payload)
+        shape = (t, len(encoder.state[t][0]))
+        shape_counts[shape] += 1
+        if frame[:1] == FRAME_FULL:
+            fulls[shape] = frame
+        else:
+            deltas.append(frame)
+    tail = b"".join(fulls[s] for s, _ in reversed(shape_counts.most_common()) if s in fulls)
+    head = b"".join(deltas)
+    return (head + tail)[-size:]
+
+
+def compress(dictionary, data):
+    c = zlib.compressobj(6, zlib.DEFLATED, 15, 9, zlib.Z_DEFAULT_STRATEGY, dictionary) if dictionary \
+        else zlib.compressobj(6)
+    return c.compress(data) + c.flush()
+
+
+def decompress(dictionary, data):
+    d = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+    return d.decompress(data) + d.flush()
+
+
+def _recv_exact(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:])
+        if not k:
+            raise ConnectionError("Connection closed")
+        got += k
+    return bytes(buf)
+
+
+def _parse_target(target):
+    host, _, port = target.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Uplink target must be host:port, got '{target}'")
+    return host, int(port)
+
+
+# ---------------------------------------------------------------------------
+# SENDER (bridge sink)
+# ---------------------------------------------------------------------------
+class UplinkSink(Sink):
+    kinds = frozenset({KIND_OSD, KIND_EVENT})
+    idle_s = BATCH_S / 2
+
+    def __init__(self, name, target=None, dictionary=None, batch_s=BATCH_S,
+                 batch_bytes=BATCH_BYTES, batch_messages=None, **kw):
+        kw.setdefault("maxsize", 20000)
+        super().__init__(name, **kw)
+        self.target = _parse_target(target or UPLINK_TARGET)
+        self.dictionary = load_dictionary() if dictionary is None else dictionary
+        self.batch_s = batch_s
+        self.batch_bytes = batch_bytes
+        self.batch_messages = batch_messages
+        self.session = uuid.uuid4().bytes
+        self.encoder = DeltaEncoder()
+
+        self._pending = []
+        self._pending_bytes = 0
+        self._pending_since = 0.0
+        self._seq = 0
+        self._unacked = deque()         # [seq, messages, wire]
+        self._ack_lock = threading.Lock()
+        self._acked_cond = threading.Condition(self._ack_lock)
+        self._sock = None
+        self._next_connect = 0.0
+        self._need_reset = False        # Unacked batches were dropped: restart deltas
+
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+        self.batches = 0
+        self.acked = 0
+        self.resent = 0
+        self.lost = 0
+
+    # --- Batching -----------------------------------------------------------
+    def write(self, msg):
+        payload = msg.payload if isinstance(msg.payload, bytes) else msg.payload.encode("utf-8")
+        if not self._pending:
+            self._pending_since = time.monotonic()
+        self._pending.append((msg.topic, payload))
+        self._pending_bytes += len(payload)
+        if (self._pending_bytes >= self.batch_bytes
+                or (self.batch_messages and len(self._pending) >= self.batch_messages)
+                or time.monotonic() - self._pending_since >= self.batch_s):
+            self._flush()
+
+    def idle(self):
+        if self._pending and time.monotonic() - self._pending_since >= self.batch_s:
+            self._flush()
+        elif self._sock is None and self._unacked:
+            self._connect()
+
+    def close(self):
+        if self._pending:
+            self._flush()
+        if self._sock is not None:
+            self.wait_acked(5.0)
+        self._disconnect()
+
+    def _encode(self, messages):
+        frames = b"".join(self.encoder.encode(topic, payload) for topic, payload in messages)
+        return compress(self.dictionary, frames)
+
+    def _flush(self):
+        messages, self._pending, self._pending_bytes = self._pending, [], 0
+        self._seq += 1
+        wire = self._encode(messages)
+        batch = [self._seq, messages, wire]
+        self.raw_bytes += sum(len(t) + len(p) for t, p in messages)
+        self.batches += 1
+        with self._ack_lock:
+            self._unacked.append(batch)
+            while len(self._unacked) > MAX_UNACKED:
+                self._unacked.popleft()
+                self.lost += 1
+                self._need_reset = True
+        if self._sock is None:
+            self._connect()     # Resends the whole unacked window, including this batch
+        else:
+            self._send(batch)
+
+    # --- Connection -----------------------------------------------------------
+    def _send(self, batch):
+        sock = self._sock
+        if sock is None:
+            return False
+        try:
+            sock.sendall(BATCH_HEADER.pack(batch[0], len(batch[2])) + batch[2])
+            self.wire_bytes += BATCH_HEADER.size + len(batch[2])
+            return True
+        except OSError as e:
+            logger.warning(f"⚠️ Uplink send failed: {e}")
+            self._disconnect()
+            return False
+
+    def _connect(self):
+        if time.monotonic() < self._next_connect:
+            return
+        self._next_connect = time.monotonic() + RECONNECT_S
+        try:
+            sock = socket.create_connection(self.target, timeout=5)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.sendall(HELLO.pack(MAGIC, self.session, dict_id(self.dictionary)))
+            status, last_seq = WELCOME.unpack(_recv_exact(sock, WELCOME.size))
+            sock.settimeout(None)
+        except (OSError, ConnectionError, struct.error) as e:
+            logger.warning(f"⚠️ Uplink connect to {self.target[0]}:{self.target[1]} failed: {e}")
+            return
+        if status == STATUS_DICT_MISMATCH:
+            logger.error("🔴 Uplink receiver uses a different dictionary; retrain/copy uplink_dict.bin")
+            sock.close()
+            self._next_connect = time.monotonic() + 30
+            return
+
+        with self._ack_lock:
+            while self._unacked and self._unacked[0][0] <= last_seq:
+                self._unacked.popleft()
+                self.acked += 1
+            window = list(self._unacked)
+        # Receiver state is only usable if it applied everything up to our window
+        if status == STATUS_NEW or self._need_reset or (window and window[0][0] != last_seq + 1):
+            self._need_reset = False
+            self.encoder.reset()
+            for batch in window:
+                batch[2] = self._encode(batch[1])
+        logger.info(f"📶 Uplink connected ({'resume' if status == STATUS_RESUME else 'new session'}, "
+                    f"{len(window)} batch(es) to resend)")
+        self._sock = sock
+        threading.Thread(target=self._read_acks, args=(sock,), name=f"{self.name}-acks", daemon=True).start()
+        for batch in window:
+            if not self._send(batch):
+                return
+            self.resent += 1
+
+    def _disconnect(self):
+        if self._sock:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def _read_acks(self, sock):
+        try:
+            while True:
+                (seq,) = ACK.unpack(_recv_exact(sock, ACK.size))
+                with self._ack_lock:
+                    while self._unacked and self._unacked[0][0] <= seq:
+                        self._unacked.popleft()
+                        self.acked += 1
+                    self._acked_cond.notify_all()
+        except (OSError, ConnectionError):
+            if self._sock is sock:
+                self._disconnect()
+
+    def wait_acked(self, timeout=10.0):
+        """Block until every flushed batch is acknowledged (used by bench/shutdown)."""
+        deadline = time.monotonic() + timeout
+        with self._acked_cond:
+            while self._unacked and time.monotonic() < deadline:
+                self._acked_cond.wait(0.1)
+            return not self._unacked
+
+    def stats(self):
+        stats = super().stats()
+        with self._ack_lock:
+            unacked = len(self._unacked)
+        stats.update({
+            "connected": self._sock is not None,
+            "batches": self.batches,
+            "unacked": unacked,
+            "acked": self.acked,
+            "resent": self.resent,
+            "lost": self.lost,
+            "raw_bytes": self.raw_bytes,
+            "wire_bytes": self.wire_bytes,
+            "ratio": round(self.raw_bytes / self.wire_bytes, 1) if self.wire_bytes else 0.0,
+        })
+        return stats
+
+
+# ---------------------------------------------------------------------------
+# RECEIVER
+# ---------------------------------------------------------------------------
+class _Session:
+    def __init__(self):
+        self.decoder = DeltaDecoder()
+        self.last_seq = 0
+        self.lock = threading.Lock()
+        self.sock = None            # Connection currently feeding this session
+
+
+class UplinkReceiver(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, publish, dictionary=None):
+        self.publish = publish              # publish(topic, payload)
+        self.dictionary = load_dictionary() if dictionary is None else dictionary
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.failed = {}                    # session id -> seq of the batch that forced a resync
+        self.stats_lock = threading.Lock()
+        self.messages = 0
+        self.decode_errors = 0
+        self.dropped = 0                    # Batches that still failed to decode after a resync
+        super().__init__(address, _UplinkHandler)
+
+    def count(self, **deltas):
+        with self.stats_lock:
+            for name, n in deltas.items():
+                setattr(self, name, getattr(self, name) + n)
+
+
+class _UplinkHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            magic, session_id, dictionary_id = HELLO.unpack(_recv_exact(sock, HELLO.size))
+            if magic != MAGIC:
+                return
+            if dictionary_id != dict_id(server.dictionary):
+                sock.sendall(WELCOME.pack(STATUS_DICT_MISMATCH, 0))
+                return
+            with server.sessions_lock:
+                session = server.sessions.get(session_id)
+                status = STATUS_RESUME if session else STATUS_NEW
+                if session is None:
+                    session = server.sessions[session_id] = _Session()
+                stale = session.sock
+                session.sock = sock
+            if stale is not None:
+                # A half-open previous connection still holds the session
+                try:
+                    stale.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            with session.lock:
+                sock.sendall(WELCOME.pack(status, session.last_seq))
+                logger.info(f"📶 Uplink {self.client_address[0]} {'resumed at ' + str(session.last_seq) if status == STATUS_RESUME else 'new session'}")
+                while True:
+                    seq, length = BATCH_HEADER.unpack(_recv_exact(sock, BATCH_HEADER.size))
+                    body = _recv_exact(sock, length)
+                    if seq > session.last_seq:
+                        try:
+                            # Decode the whole batch first so a bad frame publishes nothing
+                            decoded = list(session.decoder.decode(decompress(server.dictionary, body)))
+                        except (zlib.error, KeyError, IndexError, ValueError, struct.error) as e:
+                            server.count(decode_errors=1)
+                            if server.failed.get(session_id) != seq:
+                                self._resync(session_id, session, seq, e)
+                                return
+                            # Failed again from a clean state: skip it instead of resending forever
+                            logger.error(f"🔴 Uplink batch {seq} undecodable after resync, dropped: {e}")
+                            server.count(dropped=1)
+                            decoded = []
+                        for topic, payload in decoded:
+                            server.publish(topic, payload)
+                        server.count(messages=len(decoded))
+                        session.last_seq = seq
+                    sock.sendall(ACK.pack(seq))
+        except (OSError, ConnectionError, struct.error):
+            pass
+
+    def _resync(self, session_id, session, seq, error):
+        """
+        Forget the session and close without acking: the sender reconnects,
+        gets STATUS_NEW and resends its unacked window as full frames.
+        """
+        server = self.server
+        logger.warning(f"⚠️ Uplink batch {seq} failed to decode ({type(error).__name__}: {error}); "
+                       f"forcing full resync")
+        with server.sessions_lock:
+            if server.sessions.get(session_id) is session:
+                del server.sessions[session_id]
+            server.failed[session_id] = seq
+            session.sock = None
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def read_recordings(paths):
+    """(topic, payload bytes) from flight_recorder logs, payloads as recorded."""
+    for path in paths:
+        yield from iter_raw(path)
+
+
+def cmd_train(args):
+    messages = list(read_recordings(args.logs))
+    if args.limit:
+        messages = messages[:args.limit]
+    dictionary = train_dictionary(messages)
+    with open(args.output, "wb") as f:
+        f.write(dictionary)
+    print(f"📚 Dictionary {len(dictionary)} bytes from {len(messages)} messages -> {args.output} "
+          f"(id {dict_id(dictionary):08x})")
+
+
+def cmd_receive(args):
+    import paho.mqtt.client as mqtt
+
+    client = mqtt.Client(client_id="autel_uplink_receiver", protocol=mqtt.MQTTv311)
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+
+    def publish(topic, payload):
+        client.publish(topic, payload, qos=1 if topic.endswith("/events") else 0)
+
+    server = UplinkReceiver(_parse_target(args.listen), publish)
+    print(f"📡 Uplink receiver on {args.listen} -> mqtt://{args.broker}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        client.loop_stop()
+        client.disconnect()
+
+
+def cmd_bench(args):
+    from sinks import message
+
+    messages = list(read_recordings(args.logs))
+    if args.limit:
+        messages = messages[:args.limit]
+    if not messages:
+        print("❌ No recorded messages.")
+        return
+    split = int(len(messages) * args.train)
+    dictionary = train_dictionary(messages[:split]) if split else load_dictionary()
+    test = messages[split:]
+
+    received = []
+    server = UplinkReceiver(("127.0.0.1", 0), lambda t, p: received.append((t, p)), dictionary)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+
+    sink = UplinkSink("uplink", target=f"{host}:{port}", dictionary=dictionary,
+                      batch_messages=args.batch, maxsize=len(test) + 1)
+    t0 = time.perf_counter()
+    sink.start()
+    for topic, payload in test:
+        sink.submit(message(KIND_EVENT if topic.endswith("/events") else KIND_OSD, topic, payload))
+    sink.stop()
+    ok = sink.wait_acked(30)
+    elapsed = time.perf_counter() - t0
+    server.shutdown()
+    server.server_close()
+
+    exact = received == test
+    raw = sum(len(t) + len(p) for t, p in test)
+    per_message_zlib = sum(len(zlib.compress(p, 6)) + len(t) for t, p in test)
+    print(f"📦 {len(test)} messages ({split} used for the dictionary), batch={args.batch} msgs")
+    print(f"   Raw payload+topic : {raw / 1e6:10.2f} MB")
+    print(f"   Per-message zlib  : {per_message_zlib / 1e6:10.2f} MB  ({raw / per_message_zlib:5.1f}x)")
+    print(f"   Uplink on wire    : {sink.wire_bytes / 1e6:10.2f} MB  ({raw / max(sink.wire_bytes, 1):5.1f}x)")
+    print(f"   Frames            : {sink.encoder.full_frames} full / {sink.encoder.delta_frames} delta")
+    print(f"   Throughput        : {len(test) / elapsed:10.0f} msg/s")
+    print(f"   {'✅' if exact and ok else '❌'} Receiver stream {'byte-identical' if exact else 'MISMATCH'}"
+          f"{'' if ok else ' (unacked batches left)'}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - [UPLINK] - %(levelname)s - %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(description="Batched delta/dictionary telemetry uplink.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("train", help="Train the preset dictionary from recorded flights")
+    p.add_argument("logs", nargs="+")
+    p.add_argument("--output", default=DICT_FILE)
+    p.add_argument("--limit", type=int, default=20000, help="Messages to sample (0 = all)")
+    p.set_defaults(func=cmd_train)
+
+    p = sub.add_parser("receive", help="Run the receiver and republish to the local broker")
+    p.add_argument("--listen", default=UPLINK_LISTEN)
+    p.add_argument("--broker", default=os.getenv("MQTT_BROKER_HOST", "localhost"))
+    p.add_argument("--port", type=int, default=int(os.getenv("MQTT_PORT", 1883)))
+    p.set_defaults(func=cmd_receive)
+
+    p = sub.add_parser("bench", help="Replay recorded flights through sender+receiver on loopback")
+    p.add_argument("logs", nargs="+")
+    p.add_argument("--train", type=float, default=0.2, help="Fraction of messages used to train the dictionary")
+    p.add_argument("--batch", type=int, default=2, help="Messages per batch (2 ~ one aircraft at 10 Hz / 0.2 s)")
+    p.add_argument("--limit", type=int, default=0)
+    p.set_defaults(func=cmd_bench)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()